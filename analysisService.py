@@ -0,0 +1,359 @@
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import math
+import multiprocessing
+from multiprocessing.connection import Connection
+import os
+import queue
+import sys
+import threading
+from time import monotonic
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.error import HTTPError
+from urllib.parse import parse_qs, urlencode, urlsplit
+from urllib.request import Request, urlopen
+
+
+# Largest pack accepted by the daemon
+MAX_PACK_SIZE = 64 * 1024 * 1024
+
+_analysisLock = threading.Lock()
+
+
+class AnalysisError(RuntimeError):
+    pass
+
+
+class AnalysisTimeout(AnalysisError):
+    pass
+
+
+def analyzePackData(inb: bytes, name: str = 'course.sarc', isNSMBUDX: bool = False) -> Dict[str, Any]:
+    # Analyzes a pack given as bytes and returns its report entry (as in the JSON report of the scan)
+    # with the log of the pack added as 'log'. name is only used in the results, and to find the inner
+    # level archive of packs without a "levelname" file. Calls are serialized, as the scan state is global.
+    # The log lines and warnings buffered by a scan in this process are kept, and the pack is not counted
+    # in its telemetry, but CourseData holds the pack afterwards. Calls must not overlap a scan running on another thread
+    import main as analyzer
+
+    with _analysisLock:
+        logger = analyzer.logger
+        buffer = logger.takeBuffer()
+        warnings = logger.takeWarnings()
+        listeners = logger.listeners
+        telemetry = analyzer.telemetry
+        enableJsonReport = analyzer.enableJsonReport
+
+        logger.listeners = []
+        analyzer.telemetry = None
+        analyzer.enableJsonReport = True
+        start = len(analyzer.jsonReport)
+
+        try:
+            analyzer.scanPack(name, isNSMBUDX, inb)
+            result: Dict[str, Any] = analyzer.jsonReport[start]
+
+        finally:
+            del analyzer.jsonReport[start:]
+            logLines = logger.takeBuffer()
+
+            logger.buffer = buffer
+            logger.warnings = warnings
+            logger.listeners = listeners
+            analyzer.telemetry = telemetry
+            analyzer.enableJsonReport = enableJsonReport
+
+    result['log'] = ''.join(logLines)
+    return result
+
+
+def _workerMain(conn: Connection) -> None:
+    # Loop of a worker process: receives (pack data, name, is NSMBUDX) and sends back (ok, result or error message).
+    # Everything the analysis needs is imported before the first request
+    import main as analyzer
+
+    analyzer.logger.toFile = True
+    analyzer.enableGraphDraw = False
+    analyzer.showProgress = False
+
+    while True:
+        try:
+            request = conn.recv()
+        except (EOFError, OSError):
+            return
+
+        if request is None:
+            return
+
+        try:
+            response: Tuple[bool, Any] = (True, analyzePackData(*request))
+        except Exception as e:
+            response = (False, "%s: %s" % (type(e).__name__, e))
+
+        conn.send(response)
+
+
+def _getContext() -> Any:
+    # Workers started after the daemon's threads are running must not be forked from it directly
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        ctx = multiprocessing.get_context('forkserver')
+        ctx.set_forkserver_preload(['main'])
+        return ctx
+
+    return multiprocessing.get_context('spawn')
+
+
+class _Worker:
+    def __init__(self, ctx: Any) -> None:
+        self.conn, child = ctx.Pipe()
+        self.process = ctx.Process(target=_workerMain, args=(child,), daemon=True)
+        self.process.start()
+        child.close()
+
+    def kill(self) -> None:
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+    def stop(self) -> None:
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class AnalysisPool:
+    # Pool of warm worker processes, each analyzing one pack at a time
+    #
+    # A request waits for an idle worker and then for its result, both within its timeout.
+    # A worker that runs out of time or crashes is killed and replaced, so one bad pack
+    # cannot hold a worker forever
+
+    def __init__(self, processes: Optional[int] = None, timeout: float = 30.0) -> None:
+        self.processes = max(1, processes or multiprocessing.cpu_count())
+        self.timeout = timeout
+
+        self._ctx = _getContext()
+        self._idle: 'queue.Queue[_Worker]' = queue.Queue()
+        self._workers: List[_Worker] = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+        for _ in range(self.processes):
+            self._addWorker()
+
+    def __enter__(self) -> 'AnalysisPool':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _addWorker(self) -> None:
+        worker = _Worker(self._ctx)
+        with self._lock:
+            self._workers.append(worker)
+        self._idle.put(worker)
+
+    def _replaceWorker(self, worker: _Worker) -> None:
+        worker.kill()
+        with self._lock:
+            self._workers.remove(worker)
+            if self._closed:
+                return
+        self._addWorker()
+
+    def analyze(self, inb: bytes, name: str = 'course.sarc', isNSMBUDX: bool = False, timeout: Optional[float] = None) -> Dict[str, Any]:
+        if timeout is None:
+            timeout = self.timeout
+        if not 0 < timeout < math.inf:
+            # A worker would be killed before it could even receive the pack
+            raise ValueError("Timeout must be a positive number of seconds")
+        deadline = monotonic() + timeout
+
+        while True:
+            try:
+                worker = self._idle.get(timeout=max(0.0, deadline - monotonic()))
+            except queue.Empty:
+                raise AnalysisTimeout("No worker became available within %.1f s" % timeout) from None
+
+            # Workers that died while idle are replaced before being used
+            if worker.process.is_alive():
+                break
+            self._replaceWorker(worker)
+
+        try:
+            worker.conn.send((inb, name, isNSMBUDX))
+
+            if not worker.conn.poll(max(0.0, deadline - monotonic())):
+                self._replaceWorker(worker)
+                raise AnalysisTimeout("Analysis did not finish within %.1f s" % timeout)
+
+            ok, value = worker.conn.recv()
+
+        except (EOFError, OSError):
+            self._replaceWorker(worker)
+            raise AnalysisError("Worker process exited during the analysis") from None
+
+        self._idle.put(worker)
+
+        if not ok:
+            raise AnalysisError(value)
+
+        return value
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            workers = self._workers[:]
+            self._workers.clear()
+
+        for worker in workers:
+            worker.stop()
+
+
+class AnalysisRequestHandler(BaseHTTPRequestHandler):
+    # POST /analyze?name=<pack name>&dx=<0|1>&timeout=<seconds> with the pack data as body
+    # returns the result of analyzePackData() as JSON. GET /health returns the number of workers
+    server: 'AnalysisServer'
+
+    def _sendJson(self, status: int, data: Any) -> None:
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        if urlsplit(self.path).path != '/health':
+            self._sendJson(404, {'error': "Not found"})
+            return
+
+        self._sendJson(200, {'workers': self.server.pool.processes})
+
+    def do_POST(self) -> None:
+        url = urlsplit(self.path)
+        if url.path != '/analyze':
+            self._sendJson(404, {'error': "Not found"})
+            return
+
+        query = parse_qs(url.query)
+        name = query.get('name', ['course.sarc'])[0]
+        isNSMBUDX = query.get('dx', ['0'])[0] not in ('', '0', 'false')
+
+        try:
+            timeout = float(query['timeout'][0]) if 'timeout' in query else None
+            size = int(self.headers.get('Content-Length', ''))
+        except ValueError:
+            self._sendJson(400, {'error': "Invalid timeout or Content-Length"})
+            return
+
+        if timeout is not None and not 0 < timeout < math.inf:
+            self._sendJson(400, {'error': "Timeout must be a positive number of seconds"})
+            return
+
+        if not 0 < size <= MAX_PACK_SIZE:
+            self._sendJson(413 if size > 0 else 400, {'error': "Pack size must be between 1 and %d bytes" % MAX_PACK_SIZE})
+            return
+
+        inb = self.rfile.read(size)
+
+        try:
+            result = self.server.pool.analyze(inb, name, isNSMBUDX, timeout)
+        except AnalysisTimeout as e:
+            self._sendJson(504, {'error': str(e)})
+        except AnalysisError as e:
+            self._sendJson(422, {'error': str(e)})
+        else:
+            self._sendJson(200, result)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class AnalysisServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], pool: AnalysisPool, verbose: bool = False) -> None:
+        super().__init__(address, AnalysisRequestHandler)
+        self.pool = pool
+        self.verbose = verbose
+
+
+def serve(host: str = '127.0.0.1', port: int = 8765, processes: Optional[int] = None, timeout: float = 30.0, verbose: bool = False) -> None:
+    with AnalysisPool(processes, timeout) as pool, AnalysisServer((host, port), pool, verbose) as server:
+        print("Serving on http://%s:%d with %d workers" % (host, server.server_address[1], pool.processes), file=sys.stderr, flush=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+def requestAnalysis(url: str, inb: bytes, name: str = 'course.sarc', isNSMBUDX: bool = False, timeout: Optional[float] = None) -> Dict[str, Any]:
+    # Client side of the daemon, url being e.g. http://127.0.0.1:8765
+    query: Dict[str, Any] = {'name': name, 'dx': int(isNSMBUDX)}
+    if timeout is not None:
+        query['timeout'] = timeout
+
+    request = Request('%s/analyze?%s' % (url.rstrip('/'), urlencode(query)), data=inb, method='POST', headers={'Content-Type': 'application/octet-stream'})
+    try:
+        with urlopen(request) as response:
+            return json.load(response)
+
+    except HTTPError as e:
+        try:
+            message = json.load(e)['error']
+        except (ValueError, KeyError):
+            message = str(e)
+
+        if e.code == 504:
+            raise AnalysisTimeout(message) from None
+        raise AnalysisError(message) from None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Analysis daemon with warm worker processes, and its client")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    serveParser = subparsers.add_parser('serve', help="Run the daemon on localhost")
+    serveParser.add_argument('--host', default='127.0.0.1')
+    serveParser.add_argument('-p', '--port', type=int, default=8765)
+    serveParser.add_argument('-j', '--processes', type=int, help="Number of worker processes (default: number of CPUs)")
+    serveParser.add_argument('-t', '--timeout', type=float, default=30.0, help="Default timeout of a request in seconds")
+    serveParser.add_argument('-v', '--verbose', action='store_true', help="Log every request")
+
+    analyzeParser = subparsers.add_parser('analyze', help="Analyze a pack, through the daemon if --url is given")
+    analyzeParser.add_argument('pack')
+    analyzeParser.add_argument('--dx', action='store_true', help="Pack is from NSMBUDX")
+    analyzeParser.add_argument('--url', help="Daemon URL, e.g. http://127.0.0.1:8765")
+    analyzeParser.add_argument('-t', '--timeout', type=float)
+
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        serve(args.host, args.port, args.processes, args.timeout, args.verbose)
+        return
+
+    with open(args.pack, 'rb') as inf:
+        inb = inf.read()
+
+    name = os.path.basename(args.pack)
+    if args.url:
+        result = requestAnalysis(args.url, inb, name, args.dx, args.timeout)
+    else:
+        result = analyzePackData(inb, name, args.dx)
+
+    json.dump(result, sys.stdout, indent=1)
+    print()
+
+
+if __name__ == '__main__':
+    main()
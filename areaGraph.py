@@ -0,0 +1,239 @@
+from typing import Any, Collection, Dict, Hashable, List, Mapping, Optional, Set
+
+
+TGraph = Mapping[Hashable, Collection[Hashable]]
+
+
+def GetGraphNodes(graph: TGraph) -> List[Hashable]:
+    # All nodes, including those which only appear as successors, in first-seen order
+    nodes: Dict[Hashable, None] = {}
+    for node, successors in graph.items():
+        nodes[node] = None
+        for successor in successors:
+            nodes[successor] = None
+
+    return list(nodes)
+
+
+def StronglyConnectedComponents(graph: TGraph) -> List[List[Hashable]]:
+    # Iterative Tarjan, returns the components in reverse topological order (sinks first)
+    index: Dict[Hashable, int] = {}
+    lowlink: Dict[Hashable, int] = {}
+    onStack: Set[Hashable] = set()
+    stack: List[Hashable] = []
+    components: List[List[Hashable]] = []
+
+    for root in GetGraphNodes(graph):
+        if root in index:
+            continue
+
+        index[root] = lowlink[root] = len(index)
+        stack.append(root)
+        onStack.add(root)
+        work = [(root, iter(graph.get(root, ())))]
+
+        while work:
+            node, successors = work[-1]
+
+            for successor in successors:
+                if successor not in index:
+                    index[successor] = lowlink[successor] = len(index)
+                    stack.append(successor)
+                    onStack.add(successor)
+                    work.append((successor, iter(graph.get(successor, ()))))
+                    break
+
+                elif successor in onStack:
+                    lowlink[node] = min(lowlink[node], index[successor])
+
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+
+                if lowlink[node] == index[node]:
+                    component: List[Hashable] = []
+                    while True:
+                        member = stack.pop()
+                        onStack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    components.append(component)
+
+    return components
+
+
+class Condensation:
+    # Components of the graph in topological order, with the DAG between them
+    # and, for every component, a bitset of the components reachable from it
+    components: List[List[Hashable]]
+    componentOf: Dict[Hashable, int]
+    successors: List[Set[int]]
+    reach: List[int]
+
+    def __init__(self, graph: TGraph) -> None:
+        self.components = StronglyConnectedComponents(graph)
+        self.components.reverse()
+
+        self.componentOf = {}
+        for i, component in enumerate(self.components):
+            for node in component:
+                self.componentOf[node] = i
+
+        self.successors = [set() for _ in self.components]
+        for node, successors in graph.items():
+            i = self.componentOf[node]
+            for successor in successors:
+                j = self.componentOf[successor]
+                if i != j:
+                    self.successors[i].add(j)
+
+        # Successors always come later in topological order, so walk it backwards
+        self.reach = [0] * len(self.components)
+        for i in reversed(range(len(self.components))):
+            reach = 1 << i
+            for j in self.successors[i]:
+                reach |= self.reach[j]
+            self.reach[i] = reach
+
+    def canReach(self, src: Hashable, dst: Hashable) -> bool:
+        return bool(self.reach[self.componentOf[src]] >> self.componentOf[dst] & 1)
+
+    def getReachable(self, src: Hashable) -> List[Hashable]:
+        reach = self.reach[self.componentOf[src]]
+        return [node for i, component in enumerate(self.components) if reach >> i & 1 for node in component]
+
+    def getOneWayTraps(self, root: Hashable) -> List[Hashable]:
+        # Nodes which can be reached from the root, but from which the root cannot be reached again
+        rootComponent = self.componentOf[root]
+        reach = self.reach[rootComponent]
+
+        return [
+            node
+            for i, component in enumerate(self.components)
+            if reach >> i & 1 and not self.reach[i] >> rootComponent & 1
+            for node in component
+        ]
+
+    def getClosure(self, nodeIndex: Dict[Hashable, int]) -> List[int]:
+        # For every component, the bitset of the reachable nodes under the given numbering
+        closure = [0] * len(self.components)
+        for i in reversed(range(len(self.components))):
+            bits = 0
+            for node in self.components[i]:
+                bits |= 1 << nodeIndex[node]
+            for j in self.successors[i]:
+                bits |= closure[j]
+            closure[i] = bits
+
+        return closure
+
+    def toJson(self, root: Hashable) -> Dict[str, Any]:
+        return {
+            'components': [list(component) for component in self.components],
+            'edges': sorted([i, j] for i, successors in enumerate(self.successors) for j in successors),
+            'one_way_traps': self.getOneWayTraps(root),
+        }
+
+
+def ReversePostorder(graph: TGraph, root: Hashable) -> List[Hashable]:
+    # Nodes reachable from the root, in reverse postorder of an iterative DFS
+    visited: Set[Hashable] = {root}
+    postorder: List[Hashable] = []
+    work = [(root, iter(graph.get(root, ())))]
+
+    while work:
+        node, successors = work[-1]
+
+        for successor in successors:
+            if successor not in visited:
+                visited.add(successor)
+                work.append((successor, iter(graph.get(successor, ()))))
+                break
+
+        else:
+            work.pop()
+            postorder.append(node)
+
+    postorder.reverse()
+    return postorder
+
+
+def ImmediateDominators(graph: TGraph, root: Hashable) -> Dict[Hashable, Hashable]:
+    # Cooper, Harvey & Kennedy, "A Simple, Fast Dominance Algorithm"
+    # Only nodes reachable from the root are returned, and the root is its own immediate dominator
+    order = ReversePostorder(graph, root)
+    orderOf = {node: i for i, node in enumerate(order)}
+
+    predecessors: List[List[int]] = [[] for _ in order]
+    for node in order:
+        i = orderOf[node]
+        for successor in graph.get(node, ()):
+            predecessors[orderOf[successor]].append(i)
+
+    idom: List[int] = [-1] * len(order)
+    idom[0] = 0
+
+    changed = True
+    while changed:
+        changed = False
+
+        for i in range(1, len(order)):
+            newIdom = -1
+            for j in predecessors[i]:
+                if idom[j] < 0:
+                    continue
+
+                if newIdom < 0:
+                    newIdom = j
+                    continue
+
+                # Intersect, walking up the tree until both fingers meet
+                a = j
+                b = newIdom
+                while a != b:
+                    while a > b:
+                        a = idom[a]
+                    while b > a:
+                        b = idom[b]
+                newIdom = a
+
+            if idom[i] != newIdom:
+                idom[i] = newIdom
+                changed = True
+
+    return {node: order[idom[i]] for i, node in enumerate(order)}
+
+
+def GetDominators(idom: Dict[Hashable, Hashable], node: Hashable) -> List[Hashable]:
+    # All dominators of the node, starting from the node itself and ending with the root
+    ret = [node]
+    while idom[node] != node:
+        node = idom[node]
+        ret.append(node)
+
+    return ret
+
+
+def GetMandatoryNodes(graph: TGraph, idom: Dict[Hashable, Hashable]) -> List[Hashable]:
+    # Nodes which every route from the root passes through before it gets stuck in a terminal component,
+    # i.e. the common dominators of all nodes in the sink components of the condensation
+    condensation = Condensation({node: graph.get(node, ()) for node in idom})
+
+    mandatory: Optional[List[Hashable]] = None
+    for i, component in enumerate(condensation.components):
+        if condensation.successors[i]:
+            continue
+
+        for node in component:
+            dominators = GetDominators(idom, node)
+            if mandatory is None:
+                mandatory = dominators[::-1]
+            else:
+                common = set(dominators)
+                mandatory = [dominator for dominator in mandatory if dominator in common]
+
+    assert mandatory is not None
+    return mandatory
@@ -0,0 +1,197 @@
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from courseData import CourseData, CD_FILE_MAX_NUM
+from main import TAreaID, TNextGotoID, TAreaGraph, FindFileEntrances, FindAreaExits
+
+
+class ReachabilityDiff(NamedTuple):
+    # Areas which became reachable and unreachable from the start
+    reachable: Set[TAreaID]
+    unreachable: Set[TAreaID]
+
+
+class IncrementalReachability:
+    # Keeps the exits of every area and the reachable areas of the loaded course up to date
+    # as single records change, using the same edges as the entrance matrix of the report
+    #
+    # Edits are reported with update(), which recomputes the entrances and exits of the files
+    # the changed records belong to. If edges were only added, the new areas are found by
+    # traversing from the added edges alone, otherwise the reachable set is re-traversed over
+    # the cached edges, which never touches the course data again.
+
+    coinOrBoost: bool
+
+    def __init__(self, coinOrBoost: bool = False) -> None:
+        self.coinOrBoost = coinOrBoost
+        self.rebuild()
+
+    def rebuild(self) -> None:
+        self._entrances: Dict[TNextGotoID, TAreaID] = {}
+        self._fileEntrances: List[Set[TNextGotoID]] = [set() for _ in range(CD_FILE_MAX_NUM)]
+        self._exits: Dict[TAreaID, Set[TNextGotoID]] = {}
+        self._fileAreas: List[Set[TAreaID]] = [set() for _ in range(CD_FILE_MAX_NUM)]
+        self._sources: Dict[TNextGotoID, Set[TAreaID]] = {}
+        self._edges: TAreaGraph = {}
+
+        for fileID in range(CD_FILE_MAX_NUM):
+            self._updateFileEntrances(fileID)
+
+        for fileID in range(CD_FILE_MAX_NUM):
+            self._updateFileExits(fileID)
+
+        self._start = self._findStart()
+        self._reachable = self._traverse()
+
+    def getEdges(self) -> TAreaGraph:
+        return self._edges
+
+    def getStart(self) -> Optional[TAreaID]:
+        return self._start
+
+    def getReachable(self) -> Set[TAreaID]:
+        return set(self._reachable)
+
+    def getUnreachable(self) -> Set[TAreaID]:
+        return set(self._edges).difference(self._reachable)
+
+    def isReachable(self, areaID: TAreaID) -> bool:
+        return areaID in self._reachable
+
+    def update(
+        self,
+        nextGotos: Iterable[TNextGotoID] = (),
+        areas: Iterable[TAreaID] = (),
+        actors: Iterable[Tuple[int, int]] = (),
+        options: Iterable[int] = (),
+    ) -> ReachabilityDiff:
+        # nextGotos and areas are (file, ID), actors are (file, index) and options are file IDs
+        files: Set[int] = set()
+        files.update(fileID for fileID, _ in nextGotos)
+        files.update(fileID for fileID, _ in areas)
+        files.update(fileID for fileID, _ in actors)
+
+        optionFiles = set(options)
+        if optionFiles:
+            # Final Bowser leads to the start nextGoto of its destination file, which can be in any file
+            files.update(range(CD_FILE_MAX_NUM))
+
+        # Entrances are updated first, as the exits are resolved through them
+        changedEntrances: Set[TNextGotoID] = set()
+        for fileID in files:
+            changedEntrances.update(self._updateFileEntrances(fileID))
+
+        added: Set[Tuple[TAreaID, TAreaID]] = set()
+        removed: Set[Tuple[TAreaID, TAreaID]] = set()
+        for fileID in files:
+            self._updateFileExits(fileID, added, removed)
+
+        for nextGotoID in changedEntrances:
+            for areaID in self._sources.get(nextGotoID, ()):
+                if areaID[0] not in files:
+                    self._updateAreaEdges(areaID, added, removed)
+
+        old = self._reachable
+        start = self._findStart()
+
+        if start != self._start or any(src in old for src, _ in removed):
+            self._start = start
+            self._reachable = self._traverse()
+
+        else:
+            self._reachable = set(old)
+            self._reachable.intersection_update(self._edges)
+            self._traverse(
+                [dst for src, dst in added if src in self._reachable and dst not in self._reachable],
+                self._reachable,
+            )
+
+        return ReachabilityDiff(self._reachable - old, old - self._reachable)
+
+    def _findStart(self) -> Optional[TAreaID]:
+        file0 = CourseData.getCourseDataFile(0)
+        if not file0.isValid():
+            return None
+
+        options = file0.getOptions()
+        nextGotoID = options.start_next_goto_coin_boost if self.coinOrBoost else options.start_next_goto
+        return self._entrances.get((0, nextGotoID))
+
+    def _traverse(self, roots: Optional[List[TAreaID]] = None, reachable: Optional[Set[TAreaID]] = None) -> Set[TAreaID]:
+        if roots is None:
+            roots = [] if self._start is None else [self._start]
+        if reachable is None:
+            reachable = set()
+
+        reachable.update(roots)
+        stack = list(roots)
+        while stack:
+            for dstAreaID in self._edges.get(stack.pop(), ()):
+                if dstAreaID not in reachable:
+                    reachable.add(dstAreaID)
+                    stack.append(dstAreaID)
+
+        return reachable
+
+    def _updateFileEntrances(self, fileID: int) -> Set[TNextGotoID]:
+        # Returns the nextGotos whose containing area changed
+        file = CourseData.getCourseDataFile(fileID)
+        entrances = FindFileEntrances(file, fileID) if file.isValid() else {}
+
+        changed: Set[TNextGotoID] = set()
+        for nextGotoID in self._fileEntrances[fileID]:
+            if nextGotoID not in entrances:
+                del self._entrances[nextGotoID]
+                changed.add(nextGotoID)
+
+        for nextGotoID, areaID in entrances.items():
+            if self._entrances.get(nextGotoID) != areaID:
+                self._entrances[nextGotoID] = areaID
+                changed.add(nextGotoID)
+
+        self._fileEntrances[fileID] = set(entrances)
+        return changed
+
+    def _updateFileExits(self, fileID: int, added: Optional[Set[Tuple[TAreaID, TAreaID]]] = None, removed: Optional[Set[Tuple[TAreaID, TAreaID]]] = None) -> None:
+        file = CourseData.getCourseDataFile(fileID)
+
+        exits: Dict[TAreaID, Set[TNextGotoID]] = {}
+        if file.isValid():
+            for area in file.getAreaData():
+                exits[(fileID, area.ID)] = FindAreaExits(file, fileID, area, self.coinOrBoost)
+
+        for areaID in self._fileAreas[fileID]:
+            if areaID not in exits:
+                self._setAreaExits(areaID, set())
+                if removed is not None:
+                    removed.update((areaID, dstAreaID) for dstAreaID in self._edges[areaID])
+                del self._exits[areaID]
+                del self._edges[areaID]
+
+        for areaID, areaExits in exits.items():
+            self._setAreaExits(areaID, areaExits)
+            self._updateAreaEdges(areaID, added, removed)
+
+        self._fileAreas[fileID] = set(exits)
+
+    def _setAreaExits(self, areaID: TAreaID, exits: Set[TNextGotoID]) -> None:
+        for nextGotoID in self._exits.get(areaID, set()) - exits:
+            sources = self._sources[nextGotoID]
+            sources.discard(areaID)
+            if not sources:
+                del self._sources[nextGotoID]
+
+        for nextGotoID in exits:
+            self._sources.setdefault(nextGotoID, set()).add(areaID)
+
+        self._exits[areaID] = exits
+
+    def _updateAreaEdges(self, areaID: TAreaID, added: Optional[Set[Tuple[TAreaID, TAreaID]]], removed: Optional[Set[Tuple[TAreaID, TAreaID]]]) -> None:
+        edges = {self._entrances[nextGotoID] for nextGotoID in self._exits[areaID] if nextGotoID in self._entrances}
+        old = self._edges.get(areaID, set())
+
+        if added is not None:
+            added.update((areaID, dstAreaID) for dstAreaID in edges - old)
+        if removed is not None:
+            removed.update((areaID, dstAreaID) for dstAreaID in old - edges)
+
+        self._edges[areaID] = edges
@@ -0,0 +1,260 @@
+import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import main as analyzer
+
+
+# Items passed between the stages, None marks the end of the stream
+TJob = Tuple[str, str, bool]  # (Variant, Path, Is NSMBUDX)
+TReadItem = Optional[Tuple[str, str, bool, bytes]]
+TAnalysisItem = Optional[Tuple[str, List[str], List[Dict[str, Any]], List[analyzer.TGraphDraw]]]
+
+
+def _readFile(path: str) -> bytes:
+    with open(path, 'rb') as inf:
+        return inf.read()
+
+
+def _analyzePack(variant: str, file_path: str, isNSMBUDX: bool, inb: bytes) -> Tuple[List[str], List[Dict[str, Any]], List[analyzer.TGraphDraw]]:
+    # Runs on the single analysis thread, as CourseData and the traversal state are global,
+    # and takes the log lines and report entries of the pack out of the globals
+    if analyzer.telemetry is not None:
+        analyzer.telemetry.setVariant(variant)
+
+    analyzer.logger.takeBuffer()
+    graphs = analyzer.scanPack(file_path, isNSMBUDX, inb)
+
+    logLines = analyzer.logger.takeBuffer()
+    report = analyzer.jsonReport[:]
+    analyzer.jsonReport.clear()
+
+    return logLines, report, graphs
+
+
+def _renderGraphs(variant: str, graphs: List[analyzer.TGraphDraw]) -> None:
+    analyzer.setGraphAtlasVariant(variant)
+    for graph, out_fname, node_list in graphs:
+        analyzer.draw_graph(graph, out_fname, node_list=node_list)
+
+
+class PipelinedScan:
+    # Scan split into stages connected by bounded queues:
+    #   reader   -> reads packs ahead on the I/O threads
+    #   analyzer -> parses and traverses packs one by one on the analysis thread
+    #   renderer -> draws the graphs on the render thread
+    #   writer   -> appends the log and report of every pack to the output files, in scan order
+    #
+    # A full queue blocks the stage before it, so at most a few packs are held in memory at once
+
+    def __init__(self, jobs: Sequence[TJob], logPath: Optional[str], reportPath: Optional[str], readAhead: int = 4, queueSize: int = 4, drawGraphs: bool = True) -> None:
+        self.jobs = jobs
+        self.logPath = logPath
+        self.reportPath = reportPath
+        self.readAhead = max(1, readAhead)
+        self.queueSize = max(1, queueSize)
+        self.drawGraphs = drawGraphs
+
+        self.readQueue: 'asyncio.Queue[TReadItem]'
+        self.renderQueue: 'asyncio.Queue[Optional[Tuple[str, List[analyzer.TGraphDraw]]]]'
+        self.writeQueue: 'asyncio.Queue[TAnalysisItem]'
+
+        self.bytesRead = 0
+        self.packsDone = 0
+        self.telemetry = analyzer.telemetry
+
+    async def run(self) -> None:
+        self.readQueue = asyncio.Queue(self.readAhead)
+        self.renderQueue = asyncio.Queue(self.queueSize)
+        self.writeQueue = asyncio.Queue(self.queueSize)
+
+        if self.telemetry is not None:
+            self.telemetry.addQueue('read', self.readQueue.qsize)
+            self.telemetry.addQueue('render', self.renderQueue.qsize)
+            self.telemetry.addQueue('write', self.writeQueue.qsize)
+
+        with ThreadPoolExecutor(self.readAhead, 'read') as readExecutor, \
+             ThreadPoolExecutor(1, 'analyze') as analyzeExecutor, \
+             ThreadPoolExecutor(1, 'render') as renderExecutor:
+
+            tasks = [
+                asyncio.ensure_future(self._reader(readExecutor)),
+                asyncio.ensure_future(self._analyzer(analyzeExecutor)),
+                asyncio.ensure_future(self._renderer(renderExecutor)),
+                asyncio.ensure_future(self._writer()),
+            ]
+
+            ticker = asyncio.ensure_future(self._ticker())
+            try:
+                await asyncio.gather(*tasks)
+            except BaseException:
+                for task in tasks:
+                    task.cancel()
+                raise
+            finally:
+                ticker.cancel()
+
+        if self.telemetry is not None:
+            self.telemetry.update(force=True)
+
+    async def _ticker(self) -> None:
+        # Keeps the progress and metrics updating while no pack gets done, e.g. when a stage is stuck
+        if self.telemetry is None:
+            return
+
+        while True:
+            await asyncio.sleep(self.telemetry.interval)
+            self.telemetry.update()
+
+    async def _reader(self, executor: ThreadPoolExecutor) -> None:
+        loop = asyncio.get_running_loop()
+        reads: 'asyncio.Queue[Optional[Tuple[str, str, bool, asyncio.Future]]]' = asyncio.Queue(self.readAhead)
+
+        async def submit() -> None:
+            # Keeps up to readAhead reads in flight
+            for variant, file_path, isNSMBUDX in self.jobs:
+                await reads.put((variant, file_path, isNSMBUDX, loop.run_in_executor(executor, _readFile, file_path)))
+            await reads.put(None)
+
+        submitter = asyncio.ensure_future(submit())
+        try:
+            while True:
+                item = await reads.get()
+                if item is None:
+                    break
+
+                variant, file_path, isNSMBUDX, future = item
+                inb = await future
+                self.bytesRead += len(inb)
+                if self.telemetry is not None:
+                    self.telemetry.countRead(len(inb))
+                await self.readQueue.put((variant, file_path, isNSMBUDX, inb))
+
+        finally:
+            submitter.cancel()
+
+        await self.readQueue.put(None)
+
+    async def _analyzer(self, executor: ThreadPoolExecutor) -> None:
+        loop = asyncio.get_running_loop()
+
+        while True:
+            item = await self.readQueue.get()
+            if item is None:
+                break
+
+            logLines, report, graphs = await loop.run_in_executor(executor, _analyzePack, *item)
+
+            if self.drawGraphs and graphs:
+                await self.renderQueue.put((item[0], graphs))
+            await self.writeQueue.put((item[0], logLines, report, graphs))
+
+        await self.renderQueue.put(None)
+        await self.writeQueue.put(None)
+
+    async def _renderer(self, executor: ThreadPoolExecutor) -> None:
+        loop = asyncio.get_running_loop()
+
+        while True:
+            item = await self.renderQueue.get()
+            if item is None:
+                break
+
+            await loop.run_in_executor(executor, _renderGraphs, *item)
+
+        await loop.run_in_executor(executor, analyzer.closeGraphAtlas)
+
+    async def _writer(self) -> None:
+        logFile = open(self.logPath, 'wb') if self.logPath else None
+        reportFile = open(self.reportPath, 'w', encoding='utf-8') if self.reportPath else None
+        first = True
+
+        try:
+            if reportFile is not None:
+                reportFile.write('[')
+
+            while True:
+                item = await self.writeQueue.get()
+                if item is None:
+                    break
+
+                variant, logLines, report, _ = item
+
+                if logFile is not None:
+                    logFile.write(''.join(logLines).encode('utf-8'))
+
+                if reportFile is not None:
+                    for entry in report:
+                        reportFile.write('\n' if first else ',\n')
+                        json.dump(entry, reportFile)
+                        first = False
+
+                self.packsDone += 1
+                if self.telemetry is not None:
+                    self.telemetry.countPack(variant)
+
+        finally:
+            if logFile is not None:
+                logFile.close()
+            if reportFile is not None:
+                # Closes the array even if the scan stopped, so that the report stays valid JSON
+                reportFile.write('\n]\n')
+                reportFile.close()
+
+
+def listJobs(scanPaths: Sequence[Tuple[str, str, bool]]) -> List[TJob]:
+    jobs: List[TJob] = []
+    for variant, path, isNSMBUDX in scanPaths:
+        if not os.path.isdir(path):
+            continue
+
+        for fname in analyzer.listPacks(path):
+            jobs.append((variant, os.path.join(path, fname), isNSMBUDX))
+
+    return jobs
+
+
+def scanPipelined(readAhead: int = 4, queueSize: int = 4) -> None:
+    if analyzer.enableGraphDraw and analyzer.graphRenderer == 'matplotlib':
+        # Graphs are only ever saved to files, from the render thread
+        import matplotlib.pyplot as plt
+        plt.switch_backend('Agg')
+
+    timestamp = analyzer.now()
+    logPath = timestamp + '.txt' if analyzer.logger.toFile else None
+    reportPath = timestamp + '.json' if analyzer.enableJsonReport else None
+
+    jobs = listJobs(analyzer.scanPaths)
+    analyzer.startTelemetry(len(jobs))
+
+    scan = PipelinedScan(jobs, logPath, reportPath, readAhead, queueSize, analyzer.enableGraphDraw)
+    asyncio.run(scan.run())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Scan all packs with reading, analysis, rendering and output overlapped")
+    parser.add_argument('--read-ahead', type=int, default=4, help="Number of packs read ahead of the analysis")
+    parser.add_argument('--queue-size', type=int, default=4, help="Capacity of the render and output queues")
+    parser.add_argument('--no-draw', action='store_true', help="Do not draw the graphs")
+    parser.add_argument('--renderer', choices=sorted(analyzer.GRAPH_EXTENSIONS), help="Graph output (default: %s)" % analyzer.graphRenderer)
+    parser.add_argument('--no-progress', action='store_true', help="Do not print the progress")
+    parser.add_argument('--metrics', help="Prometheus textfile to update with the scan metrics")
+    args = parser.parse_args()
+
+    if args.no_draw:
+        analyzer.enableGraphDraw = False
+    if args.renderer:
+        analyzer.graphRenderer = args.renderer
+    if args.no_progress:
+        analyzer.showProgress = False
+    if args.metrics:
+        analyzer.metricsPath = args.metrics
+
+    scanPipelined(args.read_ahead, args.queue_size)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+from functools import lru_cache
+import re
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+
+from courseData import Structures, TEndian, SID, SIZE
+from courseData import Options, ScrollData, DistantViewData, NextGoto, MapActorData, AreaData, Location, RailInfo, RailPoint, BgCourseData
+
+
+TBuffer = Union[bytes, bytearray, memoryview]
+
+
+StructureClasses: Dict[Structures, type] = {
+    SID.Options:      Options,
+    SID.ScrollData:   ScrollData,
+    SID.DistantView:  DistantViewData,
+    SID.NextGoto:     NextGoto,
+    SID.MapActor:     MapActorData,
+    SID.Area:         AreaData,
+    SID.Location:     Location,
+    SID.Rail:         RailInfo,
+    SID.RailPoint:    RailPoint,
+    SID.BgCourseData: BgCourseData,
+}
+
+STRUCT_CODE_TO_DTYPE = {
+    'B': 'u1',
+    'b': 'i1',
+    'H': 'u2',
+    'h': 'i2',
+    'I': 'u4',
+    'i': 'i4',
+    'f': 'f4',
+}
+
+
+def GetStructureFieldNames(structId: Structures) -> List[str]:
+    if structId == SID.CdFileBlock:
+        return ['offset', 'size']
+
+    if structId == SID.MapActorRes:
+        return ['type', '_pad_0']
+
+    # Record classes declare their fields in the same order as the structure format
+    return list(StructureClasses[structId].__annotations__)
+
+
+@lru_cache(maxsize=None)
+def GetStructureDtype(endianness: TEndian, structId: Structures) -> np.dtype:
+    names = GetStructureFieldNames(structId)
+    formats: List[str] = []
+
+    for count, code in re.findall(r'(\d*)([a-zA-Z])', structId.value):
+        if code == 's':
+            formats.append('S%s' % (count or '1'))
+        else:
+            formats.extend([endianness + STRUCT_CODE_TO_DTYPE[code]] * int(count or '1'))
+
+    assert len(names) == len(formats)
+    dtype = np.dtype({'names': names, 'formats': formats})
+
+    assert dtype.itemsize == SIZE(endianness, structId)
+    return dtype
+
+
+def LoadStructureArray(endianness: TEndian, structId: Structures, data: TBuffer, offset: int = 0, count: Optional[int] = None) -> np.ndarray:
+    dtype = GetStructureDtype(endianness, structId)
+    if count is None:
+        count = (len(data) - offset) // dtype.itemsize
+
+    return np.frombuffer(data, dtype, count, offset)
+
+
+def LoadBgDataArray(endianness: TEndian, data: TBuffer) -> np.ndarray:
+    # Records run until the first one starting with 0xFFFF
+    records = LoadStructureArray(endianness, SID.BgCourseData, data)
+    terminators = np.flatnonzero(records['type'] == 0xFFFF)
+    return records[:terminators[0]] if len(terminators) else records
@@ -0,0 +1,214 @@
+import argparse
+import os
+import sqlite3
+from typing import Any, Dict, Iterable, List, Sequence, Set, Tuple
+
+from courseArrays import GetStructureFieldNames
+from courseData import CourseData, CourseDataError, Structures, SID, CD_FILE_MAX_NUM
+
+
+CATALOG_BATCH_SIZE = 64
+
+MODE_NORMAL = 'normal'
+MODE_COIN_BOOST = 'coin_boost'
+
+
+def _createRecordTable(cur: sqlite3.Cursor, table: str, structId: Structures) -> None:
+    columns = ', '.join('%s INTEGER' % name for name in GetStructureFieldNames(structId))
+    cur.execute("CREATE TABLE %s (pack_id INTEGER NOT NULL, file_id INTEGER NOT NULL, idx INTEGER NOT NULL, %s, PRIMARY KEY (pack_id, file_id, idx))" % (table, columns))
+
+
+def _createTables(cur: sqlite3.Cursor) -> None:
+    cur.execute("CREATE TABLE packs (id INTEGER PRIMARY KEY, path TEXT NOT NULL UNIQUE, name TEXT NOT NULL, variant TEXT NOT NULL, is_nsmbudx INTEGER NOT NULL)")
+
+    options_columns = ', '.join('%s INTEGER' % name for name in GetStructureFieldNames(SID.Options))
+    cur.execute("CREATE TABLE course_files (pack_id INTEGER NOT NULL, file_id INTEGER NOT NULL, %s, PRIMARY KEY (pack_id, file_id))" % options_columns)
+
+    _createRecordTable(cur, 'areas', SID.Area)
+    _createRecordTable(cur, 'next_gotos', SID.NextGoto)
+    _createRecordTable(cur, 'map_actors', SID.MapActor)
+
+    cur.execute("CREATE TABLE edges (pack_id INTEGER NOT NULL, mode TEXT NOT NULL, src_file INTEGER NOT NULL, src_area INTEGER NOT NULL, dst_file INTEGER NOT NULL, dst_area INTEGER NOT NULL)")
+    cur.execute("CREATE TABLE reachability (pack_id INTEGER NOT NULL, mode TEXT NOT NULL, file_id INTEGER NOT NULL, area_id INTEGER NOT NULL, reachable INTEGER NOT NULL, PRIMARY KEY (pack_id, mode, file_id, area_id))")
+
+
+def _createIndexes(cur: sqlite3.Cursor) -> None:
+    # Created after the bulk load, which is much faster than maintaining them during inserts
+    cur.execute("CREATE INDEX packs_variant ON packs (variant)")
+    cur.execute("CREATE INDEX areas_id ON areas (pack_id, file_id, ID)")
+    cur.execute("CREATE INDEX next_gotos_id ON next_gotos (pack_id, file_id, ID)")
+    cur.execute("CREATE INDEX next_gotos_destination ON next_gotos (destination__file, destination__next_goto)")
+    cur.execute("CREATE INDEX next_gotos_type ON next_gotos (type)")
+    cur.execute("CREATE INDEX map_actors_type ON map_actors (type)")
+    cur.execute("CREATE INDEX edges_src ON edges (pack_id, mode, src_file, src_area)")
+    cur.execute("CREATE INDEX edges_dst ON edges (pack_id, mode, dst_file, dst_area)")
+    cur.execute("CREATE INDEX reachability_reachable ON reachability (mode, reachable)")
+
+
+def _insertRows(cur: sqlite3.Cursor, table: str, rows: List[Tuple[Any, ...]]) -> None:
+    if rows:
+        cur.executemany("INSERT INTO %s VALUES (%s)" % (table, ', '.join('?' * len(rows[0]))), rows)
+
+
+class _CatalogBatch:
+    def __init__(self) -> None:
+        self.clear()
+
+    def clear(self) -> None:
+        self.packs: List[Tuple[Any, ...]] = []
+        self.course_files: List[Tuple[Any, ...]] = []
+        self.areas: List[Tuple[Any, ...]] = []
+        self.next_gotos: List[Tuple[Any, ...]] = []
+        self.map_actors: List[Tuple[Any, ...]] = []
+        self.edges: List[Tuple[Any, ...]] = []
+        self.reachability: List[Tuple[Any, ...]] = []
+
+    def __len__(self) -> int:
+        return len(self.packs)
+
+    def addCourseData(self, pack_id: int) -> None:
+        optionsColumns = GetStructureFieldNames(SID.Options)
+        areaColumns = GetStructureFieldNames(SID.Area)
+        nextGotoColumns = GetStructureFieldNames(SID.NextGoto)
+        mapActorColumns = GetStructureFieldNames(SID.MapActor)
+
+        for fileID in range(CD_FILE_MAX_NUM):
+            file = CourseData.getCourseDataFile(fileID)
+            if not file.isValid():
+                continue
+
+            options = file.getOptions()
+            self.course_files.append((pack_id, fileID, *(getattr(options, name) for name in optionsColumns)))
+
+            for i, area in enumerate(file.getAreaData()):
+                self.areas.append((pack_id, fileID, i, *(getattr(area, name) for name in areaColumns)))
+
+            for i, nextGoto in enumerate(file.getNextGoto()):
+                self.next_gotos.append((pack_id, fileID, i, *(getattr(nextGoto, name) for name in nextGotoColumns)))
+
+            for i, actor in enumerate(file.getMapActorData()):
+                self.map_actors.append((pack_id, fileID, i, *(getattr(actor, name) for name in mapActorColumns)))
+
+    def addReachability(self, pack_id: int, mode: str, visitable_areas: Dict[Tuple[int, int], Set[Tuple[int, int]]], unvisitable_areas: Iterable[Tuple[int, int]]) -> None:
+        for (src_file, src_area), neighbors in visitable_areas.items():
+            self.reachability.append((pack_id, mode, src_file, src_area, 1))
+            for dst_file, dst_area in neighbors:
+                self.edges.append((pack_id, mode, src_file, src_area, dst_file, dst_area))
+
+        for file_id, area_id in unvisitable_areas:
+            self.reachability.append((pack_id, mode, file_id, area_id, 0))
+
+    def flush(self, con: sqlite3.Connection) -> None:
+        # One transaction per batch
+        with con:
+            cur = con.cursor()
+            _insertRows(cur, 'packs', self.packs)
+            _insertRows(cur, 'course_files', self.course_files)
+            _insertRows(cur, 'areas', self.areas)
+            _insertRows(cur, 'next_gotos', self.next_gotos)
+            _insertRows(cur, 'map_actors', self.map_actors)
+            _insertRows(cur, 'edges', self.edges)
+            _insertRows(cur, 'reachability', self.reachability)
+
+        self.clear()
+
+
+def exportCatalog(db_path: str, scanPaths: Sequence[Tuple[str, str, bool]], batchSize: int = CATALOG_BATCH_SIZE) -> int:
+    from main import logger, listPacks, findVisitableAreas, findUnvisitableAreas
+
+    # The catalog is derived data, so it is always rebuilt from scratch
+    if os.path.exists(db_path):
+        os.remove(db_path)
+
+    con = sqlite3.connect(db_path)
+    try:
+        con.execute("PRAGMA journal_mode = OFF")
+        con.execute("PRAGMA synchronous = OFF")
+
+        with con:
+            _createTables(con.cursor())
+
+        batch = _CatalogBatch()
+        pack_id = 0
+
+        for variant, path, isNSMBUDX in scanPaths:
+            if not os.path.isdir(path):
+                continue
+
+            for fname in listPacks(path):
+                file_path = os.path.join(path, fname)
+                try:
+                    CourseData.loadFromPack(file_path, isNSMBUDX)
+                except CourseDataError as e:
+                    print("Error: %s: %s" % (file_path, e))
+                    continue
+
+                pack_id += 1
+                batch.packs.append((pack_id, file_path, os.path.splitext(fname)[0], variant, int(isNSMBUDX)))
+                batch.addCourseData(pack_id)
+
+                visitable_areas, visitable_areas_cb = findVisitableAreas()
+                batch.addReachability(pack_id, MODE_NORMAL, visitable_areas, findUnvisitableAreas(visitable_areas))
+                if visitable_areas_cb is not None:
+                    batch.addReachability(pack_id, MODE_COIN_BOOST, visitable_areas_cb, findUnvisitableAreas(visitable_areas_cb))
+
+                # The catalog does not keep the log, so it is dropped after each pack instead of piling up
+                logger.takeBuffer()
+                logger.takeWarnings()
+
+                if len(batch) >= batchSize:
+                    batch.flush(con)
+
+        if len(batch):
+            batch.flush(con)
+
+        with con:
+            _createIndexes(con.cursor())
+
+        con.execute("ANALYZE")
+
+    finally:
+        con.close()
+
+    return pack_id
+
+
+def queryCatalog(db_path: str, sql: str, params: Sequence[Any] = ()) -> Tuple[List[str], List[Tuple[Any, ...]]]:
+    con = sqlite3.connect(db_path)
+    try:
+        cur = con.execute(sql, params)
+        columns = [desc[0] for desc in cur.description] if cur.description else []
+        return columns, cur.fetchall()
+    finally:
+        con.close()
+
+
+def main() -> None:
+    from main import scanPaths
+
+    parser = argparse.ArgumentParser(description="SQLite catalog of courses, areas, entrances and actors")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = subparsers.add_parser('export', help="Rebuild the catalog from all scan paths")
+    export_parser.add_argument('db', nargs='?', default='courseCatalog.db')
+
+    query_parser = subparsers.add_parser('query', help="Run an SQL query against the catalog")
+    query_parser.add_argument('sql')
+    query_parser.add_argument('db', nargs='?', default='courseCatalog.db')
+
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        count = exportCatalog(args.db, scanPaths)
+        print("Exported %d packs" % count)
+
+    else:
+        columns, rows = queryCatalog(args.db, args.sql)
+        if columns:
+            print('\t'.join(columns))
+        for row in rows:
+            print('\t'.join(map(str, row)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+import argparse
+from multiprocessing import Pool
+import os
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import SarcLib
+
+from courseArrays import GetStructureDtype, LoadStructureArray
+from courseData import SharcReadEntries, SharcWriteEntries, Structures, TEndian, SID, SIZE
+from courseData import CD_FILE_MAX_NUM, CD_FILE_BLOCK_NUM, CD_FILE_BLOCK_UNKNOWN
+from courseData import CD_FILE_BLOCK_OPTIONS, CD_FILE_BLOCK_SCROLL_DATA, CD_FILE_BLOCK_DISTANT_VIEW_DATA, CD_FILE_BLOCK_NEXT_GOTO, CD_FILE_BLOCK_MAP_ACTOR_DATA
+from courseData import CD_FILE_BLOCK_MAP_ACTOR_RES, CD_FILE_BLOCK_AREA_DATA, CD_FILE_BLOCK_LOCATION, CD_FILE_BLOCK_RAIL_INFO, CD_FILE_BLOCK_RAIL_POINT
+from yaz0 import IsYaz0, Yaz0Decompress
+
+
+# Layout of each block which holds endian-dependent data
+# (block 1 only holds strings, and the layout of the unknown blocks is not known)
+BLOCK_STRUCTURES: Dict[int, Structures] = {
+    CD_FILE_BLOCK_OPTIONS:           SID.Options,
+    CD_FILE_BLOCK_SCROLL_DATA:       SID.ScrollData,
+    CD_FILE_BLOCK_DISTANT_VIEW_DATA: SID.DistantView,
+    CD_FILE_BLOCK_NEXT_GOTO:         SID.NextGoto,
+    CD_FILE_BLOCK_MAP_ACTOR_DATA:    SID.MapActor,
+    CD_FILE_BLOCK_MAP_ACTOR_RES:     SID.MapActorRes,
+    CD_FILE_BLOCK_AREA_DATA:         SID.Area,
+    CD_FILE_BLOCK_LOCATION:          SID.Location,
+    CD_FILE_BLOCK_RAIL_INFO:         SID.Rail,
+    CD_FILE_BLOCK_RAIL_POINT:        SID.RailPoint,
+}
+
+
+def _convertRecords(src: TEndian, dst: TEndian, structId: Structures, data: bytes, out: bytearray, pos: int, count: int) -> None:
+    # Assigning between structured dtypes of different endianness byteswaps field by field
+    records = LoadStructureArray(src, structId, data, pos, count)
+    out[pos:pos + records.nbytes] = records.astype(GetStructureDtype(dst, structId)).tobytes()
+
+
+def ConvertCourseDataFile(data: bytes, src: TEndian, dst: TEndian) -> bytes:
+    out = bytearray(data)
+
+    # Block offsets and sizes do not change, only their encoding
+    header = LoadStructureArray(src, SID.CdFileBlock, data, 0, CD_FILE_BLOCK_NUM)
+    _convertRecords(src, dst, SID.CdFileBlock, data, out, 0, CD_FILE_BLOCK_NUM)
+
+    for index, (offset, size) in enumerate(header.tolist()):
+        if not size:
+            continue
+
+        if index in CD_FILE_BLOCK_UNKNOWN:
+            raise ValueError("Block %d has unknown layout and cannot be converted!" % (index + 1))
+
+        structId = BLOCK_STRUCTURES.get(index)
+        if structId is None:
+            continue
+
+        count = size // SIZE(src, structId)
+        if index == CD_FILE_BLOCK_MAP_ACTOR_DATA:
+            # u32(-1) terminator, identical in both endiannesses
+            assert data[offset + size - 4:offset + size] == b'\xFF\xFF\xFF\xFF'
+        else:
+            assert size % SIZE(src, structId) == 0
+
+        _convertRecords(src, dst, structId, data, out, offset, count)
+
+    return bytes(out)
+
+
+def ConvertBgDat(data: bytes, src: TEndian, dst: TEndian) -> bytes:
+    out = bytearray(data)
+
+    # Records run until the first one starting with 0xFFFF
+    records = LoadStructureArray(src, SID.BgCourseData, data)
+    terminators = np.flatnonzero(records['type'] == 0xFFFF)
+    count = int(terminators[0]) if len(terminators) else len(records)
+    assert data[count * SIZE(src, SID.BgCourseData):count * SIZE(src, SID.BgCourseData) + 2] == b'\xFF\xFF'
+
+    _convertRecords(src, dst, SID.BgCourseData, data, out, 0, count)
+    return bytes(out)
+
+
+def _courseDataFileNames() -> Tuple[List[str], List[str]]:
+    files: List[str] = []
+    bgdats: List[str] = []
+    for i in range(CD_FILE_MAX_NUM):
+        files.append("course/course%d.bin" % (1 + i))
+        bgdats.extend("course/course%d_bgdatL%d.bin" % (1 + i, layer) for layer in range(3))
+
+    return files, bgdats
+
+
+def _convertEntries(entries: Dict[str, bytes], src: TEndian, dst: TEndian, verify: bool) -> Dict[str, bytes]:
+    files, bgdats = _courseDataFileNames()
+    ret = dict(entries)
+
+    for name, data in entries.items():
+        if name in files:
+            convert = ConvertCourseDataFile
+        elif name in bgdats:
+            convert = ConvertBgDat
+        else:
+            continue
+
+        converted = convert(data, src, dst)
+        if verify and convert(converted, dst, src) != data:
+            raise ValueError("%s does not survive a round trip!" % name)
+
+        ret[name] = converted
+
+    return ret
+
+
+def convertPackData(data: bytes, path: str, isNSMBUDX: bool, verify: bool = True) -> bytes:
+    src: TEndian = '<' if isNSMBUDX else '>'
+    dst: TEndian = '>' if isNSMBUDX else '<'
+
+    if IsYaz0(data):
+        data = Yaz0Decompress(data)
+
+    entries = dict(SharcReadEntries(SarcLib.SARC_Archive(data, src)))
+
+    if isNSMBUDX or "course/course1.bin" in entries:
+        return SharcWriteEntries(_convertEntries(entries, src, dst, verify).items(), dst)
+
+    # Same inner level lookup as CourseData.loadFromPackData()
+    level_name = entries["levelname"].decode() if "levelname" in entries else None
+    if level_name is None or level_name not in entries:
+        level_name = os.path.splitext(os.path.basename(path))[0]
+        if level_name not in entries:
+            raise RuntimeError("Inner level not found...")
+
+    level_dat = entries[level_name]
+    if IsYaz0(level_dat):
+        level_dat = Yaz0Decompress(level_dat)
+
+    inner_entries = _convertEntries(dict(SharcReadEntries(SarcLib.SARC_Archive(level_dat, src))), src, dst, verify)
+
+    # NSMBUDX does not look for an inner level, so its files are moved into the pack itself
+    del entries[level_name]
+    entries.pop("levelname", None)
+    entries.update(inner_entries)
+
+    return SharcWriteEntries(entries.items(), dst)
+
+
+def convertPack(src_path: str, dst_path: str, isNSMBUDX: bool, verify: bool = True) -> Tuple[str, Optional[str]]:
+    try:
+        with open(src_path, 'rb') as inf:
+            inb = inf.read()
+
+        outb = convertPackData(inb, src_path, isNSMBUDX, verify)
+
+        # The output is never compressed
+        if dst_path.endswith('.szs'):
+            dst_path = dst_path[:-len('.szs')] + '.sarc'
+
+        os.makedirs(os.path.dirname(dst_path) or '.', exist_ok=True)
+        with open(dst_path, 'wb') as outf:
+            outf.write(outb)
+
+    except Exception as e:
+        return src_path, "%s: %s" % (type(e).__name__, e)
+
+    return src_path, None
+
+
+def _convertPackStar(args: Tuple[str, str, bool, bool]) -> Tuple[str, Optional[str]]:
+    return convertPack(*args)
+
+
+def convertCorpus(out_root: str, scanPaths: Sequence[Tuple[str, str, bool]], processes: Optional[int] = None, verify: bool = True) -> Tuple[int, int]:
+    from main import listPacks
+
+    if os.path.abspath(out_root) == os.path.abspath('.'):
+        raise ValueError("The output tree must be separate from the input tree!")
+
+    jobs: List[Tuple[str, str, bool, bool]] = []
+    for _, path, isNSMBUDX in scanPaths:
+        if not os.path.isdir(path):
+            continue
+
+        for fname in listPacks(path):
+            jobs.append((os.path.join(path, fname), os.path.join(out_root, path, fname), isNSMBUDX, verify))
+
+    errorCount = 0
+
+    with Pool(processes) as pool:
+        for src_path, error in pool.imap_unordered(_convertPackStar, jobs, chunksize=4):
+            if error is not None:
+                errorCount += 1
+                print("Error: %s: %s" % (src_path, error))
+
+    return len(jobs), errorCount
+
+
+def main() -> None:
+    from main import scanPaths
+
+    parser = argparse.ArgumentParser(description="Convert packs between the Wii U (big-endian) and Switch (little-endian) course formats")
+    parser.add_argument('out', help="Root of the output tree")
+    parser.add_argument('-j', '--jobs', type=int, default=None, help="Number of worker processes (default: CPU count)")
+    parser.add_argument('--no-verify', action='store_true', help="Skip the round-trip check of every converted file")
+    args = parser.parse_args()
+
+    total, errors = convertCorpus(args.out, scanPaths, args.jobs, not args.no_verify)
+    print("Converted %d packs, failed %d" % (total - errors, errors))
+
+
+if __name__ == '__main__':
+    main()
@@ -6,10 +6,13 @@ try:
     from typing import Literal
 except ImportError:
     from typing_extensions import Literal
-from typing import Dict, Set, Optional, List, Tuple, Union
+from typing import Dict, Set, Optional, List, Iterable, Sequence, Tuple, Union
 
 import SarcLib
 
+from sarcReader import SarcReader
+from yaz0 import IsYaz0, Yaz0Decompress
+
 
 CD_FILE_MAX_NUM = 4
 CD_FILE_ENV_PA_SLOT_NAME_MAX_LEN = 32
@@ -33,6 +36,11 @@ CD_FILE_BLOCK_RAIL_POINT        = 15 - 1
 
 CD_FILE_BLOCK_NUM = 15
 
+# Blocks whose layout is not known, which are kept as raw data
+CD_FILE_BLOCK_UNKNOWN = (4 - 1, 6 - 1, 12 - 1, 13 - 1)
+
+CD_FILE_BLOCK_ALIGNMENT = 4
+
 LAYER_1 = 0
 LAYER_2 = 1
 LAYER_0 = 2
@@ -40,6 +48,9 @@ LAYER_0 = 2
 CD_FILE_LAYER_MAX_NUM = 3
 
 
+TEndian = Literal['>', '<']
+
+
 def SharcHasFile(arc: SarcLib.SARC_Archive, file: str) -> bool:
     try:
         arc[file]
@@ -81,6 +92,29 @@ def SharcReadEntries(arc: SarcLib.SARC_Archive) -> List[Tuple[str, bytes]]:
     return flatList
 
 
+def SharcWriteEntries(entries: Iterable[Tuple[str, Union[bytes, memoryview]]], endianness: TEndian) -> bytes:
+    arc = SarcLib.SARC_Archive(endianness=endianness)
+
+    for path, data in entries:
+        *folderNames, name = path.split('/')
+
+        folder: Union[SarcLib.Folder, SarcLib.SARC_Archive] = arc
+        for folderName in folderNames:
+            for checkObj in folder.contents:
+                if isinstance(checkObj, SarcLib.Folder) and checkObj.name == folderName:
+                    folder = checkObj
+                    break
+
+            else:
+                newFolder = SarcLib.Folder(folderName)
+                folder.addFolder(newFolder)
+                folder = newFolder
+
+        folder.addFile(SarcLib.File(name, data))
+
+    return arc.save()[0]
+
+
 class Structures(Enum):
     CdFileBlock  = 'II'
     Options      = 'IIHHBBBBBBBBHH'
@@ -88,6 +122,7 @@ class Structures(Enum):
     DistantView  = 'Hhhh16sHBB'
     NextGoto     = 'HHHHBBBBBBBBHBBBBBB'
     MapActor     = 'HHHHIIBBBBBBBB'
+    MapActorRes  = 'HH'
     Area         = 'HHHHHHBBBBBBBBBBBBBBBB'
     Location     = 'HHHHBBBB'
     Rail         = 'BbHHHI'
@@ -95,9 +130,6 @@ class Structures(Enum):
     BgCourseData = 'HHHHHBBBBBB'
 
 
-TEndian = Literal['>', '<']
-
-
 def GetStructureFormat(endianness: TEndian, structId: Structures) -> str:
     return endianness + structId.value
 
@@ -111,6 +143,24 @@ FMT = GetStructureFormat
 SIZE = GetStructureSize
 
 
+class CourseDataError(ValueError):
+    # Raised for packs and course data files that cannot be loaded, naming the file and the first problem found.
+    # Loading checks every block offset and size and every terminator, as malformed data must not crash a scan
+    def __init__(self, name: str, message: str) -> None:
+        super().__init__("%s: %s" % (name, message))
+        self.name = name
+        self.message = message
+
+    def __reduce__(self) -> Tuple[type, Tuple[str, str]]:
+        # Raised in worker processes too, e.g. by ExportPack() in courseShared.py
+        return CourseDataError, (self.name, self.message)
+
+
+def LoadRecords(cls: type, structId: Structures, endianness: TEndian, data: bytes, count: int) -> list:
+    recordSize = SIZE(endianness, structId)
+    return [cls(endianness, data, i * recordSize) for i in range(count)]
+
+
 class CourseDataFileHeader:
     @staticmethod
     def getBlock(index: int, endianness: TEndian, data: bytes, pos: int = 0) -> None:
@@ -140,11 +190,16 @@ class Environment:
         
         self.pa_slot_name = tuple(pa_slot_name)
 
-    def save(self) -> bytes:
+    def saveInto(self, data: bytearray, pos: int = 0) -> None:
         for i in range(CD_FILE_ENV_MAX_NUM):
-            assert len(self.pa_slot_name[i]) < CD_FILE_ENV_PA_SLOT_NAME_MAX_LEN
+            pa_slot_name_i = self.pa_slot_name[i].encode('ascii')
+            assert len(pa_slot_name_i) < CD_FILE_ENV_PA_SLOT_NAME_MAX_LEN
+            data[pos + CD_FILE_ENV_PA_SLOT_NAME_MAX_LEN*i:pos + CD_FILE_ENV_PA_SLOT_NAME_MAX_LEN*(i+1)] = pa_slot_name_i.ljust(CD_FILE_ENV_PA_SLOT_NAME_MAX_LEN, b'\0')
 
-        return b''.join(self.pa_slot_name[i].encode('ascii').ljust(CD_FILE_ENV_PA_SLOT_NAME_MAX_LEN, b'\0') for i in range(CD_FILE_ENV_MAX_NUM))
+    def save(self) -> bytes:
+        data = bytearray(CD_FILE_ENV_PA_SLOT_NAME_MAX_LEN * CD_FILE_ENV_MAX_NUM)
+        self.saveInto(data)
+        return bytes(data)
 
 
 class Options:
@@ -203,9 +258,11 @@ class Options:
             self.time_2
         ) = struct.unpack_from(FMT(endianness, SID.Options), data, pos)
 
-    def save(self, endianness: TEndian) -> bytes:
-        return struct.pack(
+    def saveInto(self, endianness: TEndian, data: bytearray, pos: int = 0) -> None:
+        struct.pack_into(
             FMT(endianness, SID.Options),
+            data,
+            pos,
             self.def_events_0,
             self.def_events_1,
             self.loop,
@@ -222,6 +279,11 @@ class Options:
             self.time_2
         )
 
+    def save(self, endianness: TEndian) -> bytes:
+        data = bytearray(SIZE(endianness, SID.Options))
+        self.saveInto(endianness, data)
+        return bytes(data)
+
 
 class ScrollData:
     bound_0__upper: int
@@ -256,9 +318,11 @@ class ScrollData:
             self._unused0_3
         ) = struct.unpack_from(FMT(endianness, SID.ScrollData), data, pos)
 
-    def save(self, endianness: TEndian) -> bytes:
-        return struct.pack(
+    def saveInto(self, endianness: TEndian, data: bytearray, pos: int = 0) -> None:
+        struct.pack_into(
             FMT(endianness, SID.ScrollData),
+            data,
+            pos,
             self.bound_0__upper,
             self.bound_0__lower,
             self.bound_1__upper,
@@ -273,6 +337,11 @@ class ScrollData:
             self._unused0_3
         )
 
+    def save(self, endianness: TEndian) -> bytes:
+        data = bytearray(SIZE(endianness, SID.ScrollData))
+        self.saveInto(endianness, data)
+        return bytes(data)
+
 
 class DistantViewData:
     ID: int
@@ -299,9 +368,11 @@ class DistantViewData:
             self._pad_1
         ) = struct.unpack_from(FMT(endianness, SID.DistantView), data, pos)
 
-    def save(self, endianness: TEndian) -> bytes:
-        return struct.pack(
+    def saveInto(self, endianness: TEndian, data: bytearray, pos: int = 0) -> None:
+        struct.pack_into(
             FMT(endianness, SID.DistantView),
+            data,
+            pos,
             self.ID,
             self.offset__x,
             self.offset__y,
@@ -312,6 +383,11 @@ class DistantViewData:
             self._pad_1
         )
 
+    def save(self, endianness: TEndian) -> bytes:
+        data = bytearray(SIZE(endianness, SID.DistantView))
+        self.saveInto(endianness, data)
+        return bytes(data)
+
 
 class NextGoto:
     offset__x: int
@@ -360,9 +436,11 @@ class NextGoto:
             self._pad_0
         ) = struct.unpack_from(FMT(endianness, SID.NextGoto), data, pos)
 
-    def save(self, endianness: TEndian) -> bytes:
-        return struct.pack(
+    def saveInto(self, endianness: TEndian, data: bytearray, pos: int = 0) -> None:
+        struct.pack_into(
             FMT(endianness, SID.NextGoto),
+            data,
+            pos,
             self.offset__x,
             self.offset__y,
             self.camera_offset__x,
@@ -384,6 +462,11 @@ class NextGoto:
             self._pad_0
         )
 
+    def save(self, endianness: TEndian) -> bytes:
+        data = bytearray(SIZE(endianness, SID.NextGoto))
+        self.saveInto(endianness, data)
+        return bytes(data)
+
 
 class MapActorData:
     type: int
@@ -422,9 +505,11 @@ class MapActorData:
             self._pad_2
         ) = struct.unpack_from(FMT(endianness, SID.MapActor), data, pos)
 
-    def save(self, endianness: TEndian) -> bytes:
-        return struct.pack(
+    def saveInto(self, endianness: TEndian, data: bytearray, pos: int = 0) -> None:
+        struct.pack_into(
             FMT(endianness, SID.MapActor),
+            data,
+            pos,
             self.type,
             self.offset__x,
             self.offset__y,
@@ -441,6 +526,11 @@ class MapActorData:
             self._pad_2
         )
 
+    def save(self, endianness: TEndian) -> bytes:
+        data = bytearray(SIZE(endianness, SID.MapActor))
+        self.saveInto(endianness, data)
+        return bytes(data)
+
 
 class AreaData:
     offset__x: int
@@ -495,9 +585,11 @@ class AreaData:
             self._pad_1
         ) = struct.unpack_from(FMT(endianness, SID.Area), data, pos)
 
-    def save(self, endianness: TEndian) -> bytes:
-        return struct.pack(
+    def saveInto(self, endianness: TEndian, data: bytearray, pos: int = 0) -> None:
+        struct.pack_into(
             FMT(endianness, SID.Area),
+            data,
+            pos,
             self.offset__x,
             self.offset__y,
             self.size__x,
@@ -522,6 +614,11 @@ class AreaData:
             self._pad_1
         )
 
+    def save(self, endianness: TEndian) -> bytes:
+        data = bytearray(SIZE(endianness, SID.Area))
+        self.saveInto(endianness, data)
+        return bytes(data)
+
 
 class Location:
     offset__x: int
@@ -548,9 +645,11 @@ class Location:
             self._pad_2
         ) = struct.unpack_from(FMT(endianness, SID.Location), data, pos)
 
-    def save(self, endianness: TEndian) -> bytes:
-        return struct.pack(
+    def saveInto(self, endianness: TEndian, data: bytearray, pos: int = 0) -> None:
+        struct.pack_into(
             FMT(endianness, SID.Location),
+            data,
+            pos,
             self.offset__x,
             self.offset__y,
             self.size__x,
@@ -561,6 +660,11 @@ class Location:
             self._pad_2
         )
 
+    def save(self, endianness: TEndian) -> bytes:
+        data = bytearray(SIZE(endianness, SID.Location))
+        self.saveInto(endianness, data)
+        return bytes(data)
+
 
 class RailInfo:
     ID: int
@@ -583,9 +687,11 @@ class RailInfo:
             self._8
         ) = struct.unpack_from(FMT(endianness, SID.Rail), data, pos)
 
-    def save(self, endianness: TEndian) -> bytes:
-        return struct.pack(
+    def saveInto(self, endianness: TEndian, data: bytearray, pos: int = 0) -> None:
+        struct.pack_into(
             FMT(endianness, SID.Rail),
+            data,
+            pos,
             self.ID,
             self._1,
             self.point__start,
@@ -594,6 +700,11 @@ class RailInfo:
             self._8
         )
 
+    def save(self, endianness: TEndian) -> bytes:
+        data = bytearray(SIZE(endianness, SID.Rail))
+        self.saveInto(endianness, data)
+        return bytes(data)
+
 
 class RailPoint:
     offset__x: int
@@ -624,9 +735,11 @@ class RailPoint:
             self._pad_0
         ) = struct.unpack_from(FMT(endianness, SID.RailPoint), data, pos)
 
-    def save(self, endianness: TEndian) -> bytes:
-        return struct.pack(
+    def saveInto(self, endianness: TEndian, data: bytearray, pos: int = 0) -> None:
+        struct.pack_into(
             FMT(endianness, SID.RailPoint),
+            data,
+            pos,
             self.offset__x,
             self.offset__y,
             self.speed,
@@ -639,6 +752,11 @@ class RailPoint:
             self._pad_0
         )
 
+    def save(self, endianness: TEndian) -> bytes:
+        data = bytearray(SIZE(endianness, SID.RailPoint))
+        self.saveInto(endianness, data)
+        return bytes(data)
+
 
 class BgCourseData:
     type: int
@@ -671,9 +789,11 @@ class BgCourseData:
             self._pad_4
         ) = struct.unpack_from(FMT(endianness, SID.BgCourseData), data, pos)
 
-    def save(self, endianness: TEndian) -> bytes:
-        return struct.pack(
+    def saveInto(self, endianness: TEndian, data: bytearray, pos: int = 0) -> None:
+        struct.pack_into(
             FMT(endianness, SID.BgCourseData),
+            data,
+            pos,
             self.type,
             self.offset__x,
             self.offset__y,
@@ -687,6 +807,11 @@ class BgCourseData:
             self._pad_4
         )
 
+    def save(self, endianness: TEndian) -> bytes:
+        data = bytearray(SIZE(endianness, SID.BgCourseData))
+        self.saveInto(endianness, data)
+        return bytes(data)
+
 
 class CourseDataFile:
     _ID: int
@@ -711,9 +836,27 @@ class CourseDataFile:
     _railInfo:        List[RailInfo]        # 14
     _railPoint:       List[RailPoint]       # 15
 
+    # Raw data of blocks 4, 6, 12 and 13
+    _unknownBlocks:   Dict[int, bytes]
+
+    # Whether the bg data file of each layer was present when loading
+    _bgDataPresent:   List[bool]
+
+    # Loaded file data, its byte order and block header, and the bytes from the 0xFFFF terminator to the end
+    # of the bg data file of each layer, so that unchanged layouts are saved back as they were
+    _fileData:        Optional[bytes]
+    _fileEndianness:  Optional[TEndian]
+    _blockHeader:     Tuple[int, ...]
+    _bgDataTail:      List[bytes]
+
     def __init__(self) -> None:
         self._ID: int = -1
         self._bgData = ([], [], [])
+        self._bgDataPresent = [False, False, False]
+        self._fileData = None
+        self._fileEndianness = None
+        self._blockHeader = ()
+        self._bgDataTail = [b'', b'', b'']
         self._environment = Environment()
         self._options = Options()
         self._scrollData = []
@@ -724,6 +867,7 @@ class CourseDataFile:
         self._location = []
         self._railInfo = []
         self._railPoint = []
+        self._unknownBlocks = {}
 
     def load(
         self,
@@ -759,79 +903,100 @@ class CourseDataFile:
         )
     
     def _loadFile(self, endianness: TEndian, header_b: bytes) -> None:
-        block1 = CourseDataFileHeader.getBlock(CD_FILE_BLOCK_ENVIRONMENT, endianness, header_b)
+        blockHeaderFmt = endianness + Structures.CdFileBlock.value * CD_FILE_BLOCK_NUM
+        name = "course/course%d.bin" % (1 + self._ID)
+
+        if len(header_b) < struct.calcsize(blockHeaderFmt):
+            raise CourseDataError(name, "file size 0x%X is smaller than the block header" % len(header_b))
+
+        blockHeader = struct.unpack_from(blockHeaderFmt, header_b)
+        self._fileData = header_b
+        self._fileEndianness = endianness
+        self._blockHeader = blockHeader
+
+        def getBlock(index: int) -> bytes:
+            offset = blockHeader[index * 2]
+            size = blockHeader[index * 2 + 1]
+            if not size:
+                return b''
+
+            if offset + size > len(header_b):
+                raise CourseDataError(name, "block %d (offset 0x%X, size 0x%X) exceeds the file size 0x%X" % (index + 1, offset, size, len(header_b)))
+
+            return header_b[offset:offset + size]
+
+        def getRecordCount(index: int, block: bytes, structId: Structures) -> int:
+            recordSize = SIZE(endianness, structId)
+            if len(block) % recordSize:
+                raise CourseDataError(name, "block %d size 0x%X is not a multiple of the record size 0x%X" % (index + 1, len(block), recordSize))
+
+            return len(block) // recordSize
+
+        block1 = getBlock(CD_FILE_BLOCK_ENVIRONMENT)
         if block1:
+            envSize = CD_FILE_ENV_PA_SLOT_NAME_MAX_LEN * CD_FILE_ENV_MAX_NUM
+            if len(block1) < envSize:
+                raise CourseDataError(name, "block 1 size 0x%X is smaller than 0x%X" % (len(block1), envSize))
+            for i in range(CD_FILE_ENV_MAX_NUM):
+                pa_slot_name_i = block1[CD_FILE_ENV_PA_SLOT_NAME_MAX_LEN*i:CD_FILE_ENV_PA_SLOT_NAME_MAX_LEN*(i+1)]
+                if b'\0' not in pa_slot_name_i:
+                    raise CourseDataError(name, "block 1 slot name %d is not terminated" % i)
+                if not pa_slot_name_i.split(b'\0')[0].isascii():
+                    raise CourseDataError(name, "block 1 slot name %d is not ASCII" % i)
             self._environment.load(block1)
 
-        block2 = CourseDataFileHeader.getBlock(CD_FILE_BLOCK_OPTIONS, endianness, header_b)
+        block2 = getBlock(CD_FILE_BLOCK_OPTIONS)
         if block2:
+            if len(block2) < SIZE(endianness, SID.Options):
+                raise CourseDataError(name, "block 2 size 0x%X is smaller than 0x%X" % (len(block2), SIZE(endianness, SID.Options)))
             self._options.load(endianness, block2)
 
-        block3 = CourseDataFileHeader.getBlock(CD_FILE_BLOCK_SCROLL_DATA, endianness, header_b)
+        block3 = getBlock(CD_FILE_BLOCK_SCROLL_DATA)
         if block3:
-            block3Size = len(block3)
-            scrollDataSize = SIZE(endianness, SID.ScrollData)
-            assert block3Size % scrollDataSize == 0
-            block3Count = block3Size // scrollDataSize
-            self._scrollData = [ScrollData(endianness, block3, i * scrollDataSize) for i in range(block3Count)]
+            block3Count = getRecordCount(CD_FILE_BLOCK_SCROLL_DATA, block3, SID.ScrollData)
+            self._scrollData = LoadRecords(ScrollData, SID.ScrollData, endianness, block3, block3Count)
 
-        block5 = CourseDataFileHeader.getBlock(CD_FILE_BLOCK_DISTANT_VIEW_DATA, endianness, header_b)
+        block5 = getBlock(CD_FILE_BLOCK_DISTANT_VIEW_DATA)
         if block5:
-            block5Size = len(block5)
-            distantViewSize = SIZE(endianness, SID.DistantView)
-            assert block5Size % distantViewSize == 0
-            block5Count = block5Size // distantViewSize
-            self._distantViewData = [DistantViewData(endianness, block5, i * distantViewSize) for i in range(block5Count)]
+            block5Count = getRecordCount(CD_FILE_BLOCK_DISTANT_VIEW_DATA, block5, SID.DistantView)
+            self._distantViewData = LoadRecords(DistantViewData, SID.DistantView, endianness, block5, block5Count)
 
-        block7 = CourseDataFileHeader.getBlock(CD_FILE_BLOCK_NEXT_GOTO, endianness, header_b)
+        block7 = getBlock(CD_FILE_BLOCK_NEXT_GOTO)
         if block7:
-            block7Size = len(block7)
-            nextGotoSize = SIZE(endianness, SID.NextGoto)
-            assert block7Size % nextGotoSize == 0
-            block7Count = block7Size // nextGotoSize
-            self._nextGoto = [NextGoto(endianness, block7, i * nextGotoSize) for i in range(block7Count)]
+            block7Count = getRecordCount(CD_FILE_BLOCK_NEXT_GOTO, block7, SID.NextGoto)
+            self._nextGoto = LoadRecords(NextGoto, SID.NextGoto, endianness, block7, block7Count)
 
-        block8 = CourseDataFileHeader.getBlock(CD_FILE_BLOCK_MAP_ACTOR_DATA, endianness, header_b)
+        block8 = getBlock(CD_FILE_BLOCK_MAP_ACTOR_DATA)
         if block8:
-            block8Size = len(block8) - 4  # 4 == sizeof(u32)
-            assert block8Size > 0
-            mapActorSize = SIZE(endianness, SID.MapActor)
-            assert block8Size % mapActorSize == 0
-            assert block8[-4:] == b'\xFF\xFF\xFF\xFF'  # u32(-1)
-            block8Count = block8Size // mapActorSize
-            self._mapActorData = [MapActorData(endianness, block8, i * mapActorSize) for i in range(block8Count)]
-
-        block10 = CourseDataFileHeader.getBlock(CD_FILE_BLOCK_AREA_DATA, endianness, header_b)
+            if block8[-4:] != b'\xFF\xFF\xFF\xFF':  # u32(-1)
+                raise CourseDataError(name, "block 8 is not terminated by 0xFFFFFFFF")
+            block8Count = getRecordCount(CD_FILE_BLOCK_MAP_ACTOR_DATA, block8[:-4], SID.MapActor)  # 4 == sizeof(u32)
+            self._mapActorData = LoadRecords(MapActorData, SID.MapActor, endianness, block8, block8Count)
+
+        block10 = getBlock(CD_FILE_BLOCK_AREA_DATA)
         if block10:
-            block10Size = len(block10)
-            areaSize = SIZE(endianness, SID.Area)
-            assert block10Size % areaSize == 0
-            block10Count = block10Size // areaSize
-            self._areaData = [AreaData(endianness, block10, i * areaSize) for i in range(block10Count)]
+            block10Count = getRecordCount(CD_FILE_BLOCK_AREA_DATA, block10, SID.Area)
+            self._areaData = LoadRecords(AreaData, SID.Area, endianness, block10, block10Count)
 
-        block11 = CourseDataFileHeader.getBlock(CD_FILE_BLOCK_LOCATION, endianness, header_b)
+        block11 = getBlock(CD_FILE_BLOCK_LOCATION)
         if block11:
-            block11Size = len(block11)
-            locationSize = SIZE(endianness, SID.Location)
-            assert block11Size % locationSize == 0
-            block11Count = block11Size // locationSize
-            self._location = [Location(endianness, block11, i * locationSize) for i in range(block11Count)]
+            block11Count = getRecordCount(CD_FILE_BLOCK_LOCATION, block11, SID.Location)
+            self._location = LoadRecords(Location, SID.Location, endianness, block11, block11Count)
 
-        block14 = CourseDataFileHeader.getBlock(CD_FILE_BLOCK_RAIL_INFO, endianness, header_b)
+        block14 = getBlock(CD_FILE_BLOCK_RAIL_INFO)
         if block14:
-            block14Size = len(block14)
-            railSize = SIZE(endianness, SID.Rail)
-            assert block14Size % railSize == 0
-            block14Count = block14Size // railSize
-            self._railInfo = [RailInfo(endianness, block14, i * railSize) for i in range(block14Count)]
+            block14Count = getRecordCount(CD_FILE_BLOCK_RAIL_INFO, block14, SID.Rail)
+            self._railInfo = LoadRecords(RailInfo, SID.Rail, endianness, block14, block14Count)
 
-        block15 = CourseDataFileHeader.getBlock(CD_FILE_BLOCK_RAIL_POINT, endianness, header_b)
+        block15 = getBlock(CD_FILE_BLOCK_RAIL_POINT)
         if block15:
-            block15Size = len(block15)
-            railPointSize = SIZE(endianness, SID.RailPoint)
-            assert block15Size % railPointSize == 0
-            block15Count = block15Size // railPointSize
-            self._railPoint = [RailPoint(endianness, block15, i * railPointSize) for i in range(block15Count)]
+            block15Count = getRecordCount(CD_FILE_BLOCK_RAIL_POINT, block15, SID.RailPoint)
+            self._railPoint = LoadRecords(RailPoint, SID.RailPoint, endianness, block15, block15Count)
+
+        for index in CD_FILE_BLOCK_UNKNOWN:
+            block = getBlock(index)
+            if block:
+                self._unknownBlocks[index] = bytes(block)
 
     def _loadBgDat(self, layer: int, endianness: TEndian, bgdat_b: Optional[bytes]) -> None:
         if bgdat_b is None:
@@ -839,19 +1004,151 @@ class CourseDataFile:
         
         self_bgdat = self._bgData[layer]
         self_bgdat.clear()
+        self._bgDataPresent[layer] = True
+
+        bgDataSize = SIZE(endianness, SID.BgCourseData)
+
+        name = "course/course%d_bgdatL%d.bin" % (1 + self._ID, (LAYER_0, LAYER_1, LAYER_2).index(layer))
 
         pos = 0
         while True:
+            if pos + 2 > len(bgdat_b):
+                raise CourseDataError(name, "no 0xFFFF terminator after %d records" % len(self_bgdat))
             if bgdat_b[pos:pos+2] == b'\xFF\xFF':
                 break
+            if pos + bgDataSize > len(bgdat_b):
+                raise CourseDataError(name, "record %d at 0x%X is truncated" % (len(self_bgdat), pos))
             self_bgdat.append(BgCourseData(endianness, bgdat_b, pos))
-            pos += SIZE(endianness, SID.BgCourseData)
+            pos += bgDataSize
+
+        self._bgDataTail[layer] = bytes(bgdat_b[pos:])
     
+    @staticmethod
+    def _saveRecordsInto(endianness: TEndian, records: List, structId: Structures, data: bytearray, pos: int) -> None:
+        recordSize = SIZE(endianness, structId)
+        for record in records:
+            record.saveInto(endianness, data, pos)
+            pos += recordSize
+
+    def getLoadedBlock(self, index: int) -> bytes:
+        if self._fileData is None:
+            return b''
+
+        offset = self._blockHeader[index * 2]
+        size = self._blockHeader[index * 2 + 1]
+        return self._fileData[offset:offset + size]
+
+    def _hasLoadedLayout(self, endianness: TEndian, blockSize: List[int]) -> bool:
+        # Whether the blocks still fit the loaded file exactly
+        # (blocks 1 and 2 may have been larger than the data read from them).
+        # A file saved in the other byte order never does, as the header and the bytes not read are in the loaded one
+        if self._fileData is None or endianness != self._fileEndianness:
+            return False
+
+        for index in range(CD_FILE_BLOCK_NUM):
+            size = self._blockHeader[index * 2 + 1]
+            if index in (CD_FILE_BLOCK_ENVIRONMENT, CD_FILE_BLOCK_OPTIONS):
+                if size < blockSize[index]:
+                    return False
+            elif size != blockSize[index]:
+                return False
+
+        return True
+
     def _saveFile(self, endianness: TEndian) -> bytes:
-        raise NotImplementedError
+        # As long as no block changed size, the file is saved over a copy of the loaded one, so block offsets,
+        # padding and the bytes not read (e.g. past the environment and options) are kept and an unchanged file
+        # is saved back byte for byte. Otherwise, or when saving in the other byte order, the layout is normalized:
+        # blocks one after the other in order, aligned to 4 bytes. Block 9 is kept as loaded if it is in the same
+        # byte order and lists the same actor types as block 8, otherwise it is regenerated as the sorted actor types
+        blockHeaderSize = SIZE(endianness, SID.CdFileBlock)
+        mapActorResSize = SIZE(endianness, SID.MapActorRes)
+
+        mapActorTypes = {actor.type for actor in self._mapActorData}
+
+        mapActorResBlock: Optional[bytes] = None
+        block9 = self.getLoadedBlock(CD_FILE_BLOCK_MAP_ACTOR_RES) if endianness == self._fileEndianness else b''
+        if block9 and not len(block9) % mapActorResSize:
+            if {actorType for actorType, _ in struct.iter_unpack(FMT(endianness, SID.MapActorRes), block9)} == mapActorTypes:
+                mapActorResBlock = bytes(block9)
+
+        if mapActorResBlock is None:
+            mapActorResBlock = b''.join(struct.pack(FMT(endianness, SID.MapActorRes), actorType, 0) for actorType in sorted(mapActorTypes))
+
+        # Block 8 only holds its terminator if there are no actors, if it was there before
+        hasBlock8 = bool(self._mapActorData) or bool(self.getLoadedBlock(CD_FILE_BLOCK_MAP_ACTOR_DATA))
+
+        blockSize = [0] * CD_FILE_BLOCK_NUM
+        blockSize[CD_FILE_BLOCK_ENVIRONMENT]       = CD_FILE_ENV_PA_SLOT_NAME_MAX_LEN * CD_FILE_ENV_MAX_NUM
+        blockSize[CD_FILE_BLOCK_OPTIONS]           = SIZE(endianness, SID.Options)
+        blockSize[CD_FILE_BLOCK_SCROLL_DATA]       = SIZE(endianness, SID.ScrollData) * len(self._scrollData)
+        blockSize[CD_FILE_BLOCK_DISTANT_VIEW_DATA] = SIZE(endianness, SID.DistantView) * len(self._distantViewData)
+        blockSize[CD_FILE_BLOCK_NEXT_GOTO]         = SIZE(endianness, SID.NextGoto) * len(self._nextGoto)
+        if hasBlock8:
+            blockSize[CD_FILE_BLOCK_MAP_ACTOR_DATA] = SIZE(endianness, SID.MapActor) * len(self._mapActorData) + 4  # 4 == sizeof(u32)
+        blockSize[CD_FILE_BLOCK_MAP_ACTOR_RES]     = len(mapActorResBlock)
+        blockSize[CD_FILE_BLOCK_AREA_DATA]         = SIZE(endianness, SID.Area) * len(self._areaData)
+        blockSize[CD_FILE_BLOCK_LOCATION]          = SIZE(endianness, SID.Location) * len(self._location)
+        blockSize[CD_FILE_BLOCK_RAIL_INFO]         = SIZE(endianness, SID.Rail) * len(self._railInfo)
+        blockSize[CD_FILE_BLOCK_RAIL_POINT]        = SIZE(endianness, SID.RailPoint) * len(self._railPoint)
+        for index, block in self._unknownBlocks.items():
+            blockSize[index] = len(block)
+
+        if self._hasLoadedLayout(endianness, blockSize):
+            assert self._fileData is not None
+            data = bytearray(self._fileData)
+            blockOffset = list(self._blockHeader[0::2])
+
+        else:
+            # Blocks are placed one after the other, following the header
+            blockOffset = [0] * CD_FILE_BLOCK_NUM
+            pos = blockHeaderSize * CD_FILE_BLOCK_NUM
+            for index in range(CD_FILE_BLOCK_NUM):
+                blockOffset[index] = pos
+                pos += blockSize[index]
+                pos += -pos % CD_FILE_BLOCK_ALIGNMENT
+
+            data = bytearray(pos)
+
+            for index in range(CD_FILE_BLOCK_NUM):
+                struct.pack_into(FMT(endianness, SID.CdFileBlock), data, index * blockHeaderSize, blockOffset[index], blockSize[index])
+
+        self._environment.saveInto(data, blockOffset[CD_FILE_BLOCK_ENVIRONMENT])
+        self._options.saveInto(endianness, data, blockOffset[CD_FILE_BLOCK_OPTIONS])
+        self._saveRecordsInto(endianness, self._scrollData, SID.ScrollData, data, blockOffset[CD_FILE_BLOCK_SCROLL_DATA])
+        self._saveRecordsInto(endianness, self._distantViewData, SID.DistantView, data, blockOffset[CD_FILE_BLOCK_DISTANT_VIEW_DATA])
+        self._saveRecordsInto(endianness, self._nextGoto, SID.NextGoto, data, blockOffset[CD_FILE_BLOCK_NEXT_GOTO])
+
+        if hasBlock8:
+            self._saveRecordsInto(endianness, self._mapActorData, SID.MapActor, data, blockOffset[CD_FILE_BLOCK_MAP_ACTOR_DATA])
+            block8End = blockOffset[CD_FILE_BLOCK_MAP_ACTOR_DATA] + blockSize[CD_FILE_BLOCK_MAP_ACTOR_DATA]
+            data[block8End - 4:block8End] = b'\xFF\xFF\xFF\xFF'  # u32(-1)
+
+        pos = blockOffset[CD_FILE_BLOCK_MAP_ACTOR_RES]
+        data[pos:pos + len(mapActorResBlock)] = mapActorResBlock
+
+        self._saveRecordsInto(endianness, self._areaData, SID.Area, data, blockOffset[CD_FILE_BLOCK_AREA_DATA])
+        self._saveRecordsInto(endianness, self._location, SID.Location, data, blockOffset[CD_FILE_BLOCK_LOCATION])
+        self._saveRecordsInto(endianness, self._railInfo, SID.Rail, data, blockOffset[CD_FILE_BLOCK_RAIL_INFO])
+        self._saveRecordsInto(endianness, self._railPoint, SID.RailPoint, data, blockOffset[CD_FILE_BLOCK_RAIL_POINT])
+
+        for index, block in self._unknownBlocks.items():
+            data[blockOffset[index]:blockOffset[index] + len(block)] = block
+
+        return bytes(data)
 
     def _saveBgDat(self, layer: int, endianness: TEndian) -> bytes:
-        raise NotImplementedError
+        self_bgdat = self._bgData[layer]
+        bgCourseDataSize = SIZE(endianness, SID.BgCourseData)
+
+        # The terminator is followed by whatever came after it in the loaded file
+        tail = self._bgDataTail[layer] or b'\xFF\xFF'
+
+        data = bytearray(bgCourseDataSize * len(self_bgdat) + len(tail))
+        self._saveRecordsInto(endianness, self_bgdat, SID.BgCourseData, data, 0)
+        data[-len(tail):] = tail
+
+        return bytes(data)
     
     def clear(self) -> None:
         self._ID = -1
@@ -859,6 +1156,11 @@ class CourseDataFile:
         self._bgData[LAYER_0].clear()
         self._bgData[LAYER_1].clear()
         self._bgData[LAYER_2].clear()
+        self._bgDataPresent[:] = (False, False, False)
+        self._fileData = None
+        self._fileEndianness = None
+        self._blockHeader = ()
+        self._bgDataTail[:] = (b'', b'', b'')
 
         self._environment.initialize()
         self._options.initialize()
@@ -871,6 +1173,7 @@ class CourseDataFile:
         self._location.clear()
         self._railInfo.clear()
         self._railPoint.clear()
+        self._unknownBlocks.clear()
     
     def isValid(self) -> bool:
         return 0 <= self._ID < CD_FILE_MAX_NUM
@@ -884,7 +1187,9 @@ class CourseDataFile:
 
     def setEnvironment(self, index: int, name: str) -> None:
         assert 0 <= index < CD_FILE_ENV_MAX_NUM
-        self._environment.pa_slot_name[index] = name[:CD_FILE_ENV_PA_SLOT_NAME_MAX_LEN - 1]
+        pa_slot_name = list(self._environment.pa_slot_name)
+        pa_slot_name[index] = name[:CD_FILE_ENV_PA_SLOT_NAME_MAX_LEN - 1]
+        self._environment.pa_slot_name = (pa_slot_name[0], pa_slot_name[1], pa_slot_name[2], pa_slot_name[3])
 
     def getOptions(self) -> Options:
         return self._options
@@ -1001,50 +1306,54 @@ class CourseDataFile:
         assert 0 <= layer < CD_FILE_LAYER_MAX_NUM
         return self._bgData[layer]
 
+    def hasBgData(self, layer: int) -> bool:
+        assert 0 <= layer < CD_FILE_LAYER_MAX_NUM
+        return self._bgDataPresent[layer] or bool(self._bgData[layer])
+
 
 class CourseData:
     _file = tuple(CourseDataFile() for _ in range(CD_FILE_MAX_NUM))
-    _resData: Dict[str, bytes] = {}
+    _resData: Dict[str, Union[bytes, memoryview]] = {}
+
+    _endianness: TEndian = '>'
+
+    # Name of the inner level archive (None if the course data files are in the pack itself),
+    # whether it was referenced by a "levelname" file, and the other files in the inner archive
+    _levelName: Optional[str] = None
+    _hasLevelNameFile: bool = False
+    _innerResData: Dict[str, Union[bytes, memoryview]] = {}
+
+    # Archives whose remaining files are only read into _resData/_innerResData once they are needed,
+    # so that loading a pack does not depend on how many resources it bundles
+    _pendingResData: List[Tuple[SarcReader, Set[str], Dict[str, Union[bytes, memoryview]]]] = []
 
     @classmethod
     def loadFromPack(cls, path: str, isNSMBUDX: bool) -> None:
-        endianness: TEndian = '<' if isNSMBUDX else '>'
-
         with open(path, 'rb') as inf:
             inb = inf.read()
 
-        pack_arc_dat = inb
-        pack_arc = SarcLib.SARC_Archive(pack_arc_dat, endianness)
+        cls.loadFromPackData(inb, path, isNSMBUDX)
 
-        read_files: Set[str] = set()
+    @classmethod
+    def loadFromPackData(cls, inb: bytes, path: str, isNSMBUDX: bool) -> None:
+        endianness: TEndian = '<' if isNSMBUDX else '>'
 
-        # print("\nLoaded %s\n" % path)
+        pack_arc = cls.openArchive(inb, os.path.basename(path))
 
-        archive = pack_arc
-        inner_archive = False
+        read_files: Set[str] = set()
 
-        if not isNSMBUDX and not SharcHasFile(archive, "course/course1.bin"):
-            inner_archive = True
-            level_name: str = ""
-            level_dat: Optional[bytes] = None
+        # print("\nLoaded %s\n" % path)
 
-            level_name_dat = SharcTryGetFile(pack_arc, "levelname")
-            if level_name_dat is not None:
-                level_name = level_name_dat.decode()
-                level_dat = SharcTryGetFile(pack_arc, level_name)
-                if level_dat is not None:
-                    read_files.add("levelname")
+        archive, level_name, has_level_name_file = cls.openCourseArchive(pack_arc, path, isNSMBUDX)
+        inner_archive = level_name is not None
 
-            if level_dat is None:
-                level_name = os.path.splitext(os.path.basename(path))[0]
-                level_dat = SharcTryGetFile(pack_arc, level_name)
-                if level_dat is None:
-                    raise RuntimeError("Inner level not found...")
-                
-            assert level_dat is not None
-            archive = SarcLib.SARC_Archive(level_dat, endianness)
+        if inner_archive:
+            if has_level_name_file:
+                read_files.add("levelname")
             read_files.add(level_name)
 
+        inner_read_files: Set[str] = set()
+
         for i in range(CD_FILE_MAX_NUM):
             courseDataFileName   = "course/course%d.bin"         % (1 + i)
             courseDataFileL0Name = "course/course%d_bgdatL0.bin" % (1 + i)
@@ -1055,10 +1364,10 @@ class CourseData:
             cd_file.load(
                 i,
                 endianness,
-                SharcTryGetFile(archive, courseDataFileName  ),
-                SharcTryGetFile(archive, courseDataFileL0Name),
-                SharcTryGetFile(archive, courseDataFileL1Name),
-                SharcTryGetFile(archive, courseDataFileL2Name)
+                archive.getFile(courseDataFileName  ),
+                archive.getFile(courseDataFileL0Name),
+                archive.getFile(courseDataFileL1Name),
+                archive.getFile(courseDataFileL2Name)
             )
 
             if not inner_archive:
@@ -1066,10 +1375,15 @@ class CourseData:
                 read_files.add(courseDataFileL0Name)
                 read_files.add(courseDataFileL1Name)
                 read_files.add(courseDataFileL2Name)
+            else:
+                inner_read_files.add(courseDataFileName)
+                inner_read_files.add(courseDataFileL0Name)
+                inner_read_files.add(courseDataFileL1Name)
+                inner_read_files.add(courseDataFileL2Name)
 
             if i == 0:
                 if not cd_file.isValid():
-                    raise ValueError("File 0 must be valid!")
+                    raise CourseDataError(courseDataFileName, "file 0 must be valid")
 
             else:
                 if not cd_file.isValid():
@@ -1086,15 +1400,143 @@ class CourseData:
 
         cls._clearResData()
 
-        entries = SharcReadEntries(pack_arc)
-        for name, data in entries:
-            if name not in read_files:
-                cls._resData[name] = data
+        cls._endianness = endianness
+
+        cls._pendingResData.append((pack_arc, read_files, cls._resData))
+
+        if level_name is not None:
+            cls._levelName = level_name
+            cls._hasLevelNameFile = has_level_name_file
+            cls._pendingResData.append((archive, inner_read_files, cls._innerResData))
+
+    @staticmethod
+    def openArchive(data: bytes, name: str) -> SarcReader:
+        # Archive of a pack or an inner level archive, Yaz0 compressed or not
+        try:
+            return SarcReader(Yaz0Decompress(data) if IsYaz0(data) else data)
+        except (ValueError, struct.error) as e:
+            raise CourseDataError(name, str(e)) from None
+
+    @classmethod
+    def openCourseArchive(cls, pack_arc: SarcReader, path: str, isNSMBUDX: bool) -> Tuple[SarcReader, Optional[str], bool]:
+        # Archive with the course files: the pack itself, or its inner level archive.
+        # Also returns the name of the inner level archive and whether the "levelname" file names it
+        if isNSMBUDX or pack_arc.hasFile("course/course1.bin"):
+            return pack_arc, None, False
+
+        level_name: str = ""
+        level_dat: Optional[bytes] = None
+        has_level_name_file = False
+
+        level_name_dat = pack_arc.getFile("levelname")
+        if level_name_dat is not None:
+            try:
+                level_name = level_name_dat.decode()
+            except UnicodeDecodeError:
+                raise CourseDataError("levelname", "the name is not UTF-8") from None
+            level_dat = pack_arc.getFile(level_name)
+            has_level_name_file = level_dat is not None
+
+        if level_dat is None:
+            level_name = os.path.splitext(os.path.basename(path))[0]
+            level_dat = pack_arc.getFile(level_name)
+            if level_dat is None:
+                raise CourseDataError(level_name, "inner level archive not found")
+
+        return cls.openArchive(level_dat, level_name), level_name, has_level_name_file
+
+    @classmethod
+    def readPackFiles(cls, inb: bytes, path: str, isNSMBUDX: bool) -> List[Tuple[Optional[bytes], Optional[bytes], Optional[bytes], Optional[bytes]]]:
+        # The course data files of a pack as (file, bgdat L0, L1, L2) for each file, as they are in the archive
+        pack_arc = cls.openArchive(inb, os.path.basename(path))
+        archive, _, _ = cls.openCourseArchive(pack_arc, path, isNSMBUDX)
+
+        files: List[Tuple[Optional[bytes], Optional[bytes], Optional[bytes], Optional[bytes]]] = []
+        for i in range(CD_FILE_MAX_NUM):
+            file = archive.getFile("course/course%d.bin" % (1 + i))
+            if file is None:
+                files.append((None, None, None, None))
+                continue
+
+            files.append((
+                file,
+                archive.getFile("course/course%d_bgdatL0.bin" % (1 + i)),
+                archive.getFile("course/course%d_bgdatL1.bin" % (1 + i)),
+                archive.getFile("course/course%d_bgdatL2.bin" % (1 + i)),
+            ))
+
+        return files
+
+    @classmethod
+    def loadFromFiles(cls, endianness: TEndian, files: Sequence[Tuple[Optional[bytes], Optional[bytes], Optional[bytes], Optional[bytes]]]) -> None:
+        # Loads course data files that were already taken out of a pack, given as (file, bgdat L0, L1, L2) for each file.
+        # The other resources of the pack are not available afterwards
+        assert len(files) == CD_FILE_MAX_NUM
+
+        for i in range(CD_FILE_MAX_NUM):
+            cd_file = cls._file[i]
+            cd_file.load(i, endianness, *files[i])
+
+            if i == 0 and not cd_file.isValid():
+                raise CourseDataError("course/course1.bin", "file 0 must be valid")
+
+        cls._clearResData()
+
+        cls._endianness = endianness
+
+    @classmethod
+    def getEndianness(cls) -> TEndian:
+        return cls._endianness
+
+    @classmethod
+    def _readResData(cls) -> None:
+        # Resources are kept as views of the pack data, without being copied
+        for archive, read_files, resData in cls._pendingResData:
+            for name, data in archive.readEntries():
+                if name not in read_files:
+                    resData[name] = data
+
+        cls._pendingResData.clear()
 
     @classmethod
     def save(cls) -> bytes:
-        raise NotImplementedError
-        return b''
+        cls._readResData()
+
+        endianness = cls._endianness
+        files: Dict[str, Union[bytes, memoryview]] = {}
+
+        for i in range(CD_FILE_MAX_NUM):
+            cd_file = cls._file[i]
+            if not cd_file.isValid():
+                continue
+
+            courseDataFileName   = "course/course%d.bin"         % (1 + i)
+            courseDataFileL0Name = "course/course%d_bgdatL0.bin" % (1 + i)
+            courseDataFileL1Name = "course/course%d_bgdatL1.bin" % (1 + i)
+            courseDataFileL2Name = "course/course%d_bgdatL2.bin" % (1 + i)
+
+            file, bgdat_L0, bgdat_L1, bgdat_L2 = cd_file.save(endianness)
+
+            files[courseDataFileName] = file
+            if cd_file.hasBgData(LAYER_0):
+                files[courseDataFileL0Name] = bgdat_L0
+            if cd_file.hasBgData(LAYER_1):
+                files[courseDataFileL1Name] = bgdat_L1
+            if cd_file.hasBgData(LAYER_2):
+                files[courseDataFileL2Name] = bgdat_L2
+
+        if cls._levelName is None:
+            files.update(cls._resData)
+            return SharcWriteEntries(files.items(), endianness)
+
+        files.update(cls._innerResData)
+
+        pack_files = dict(cls._resData)
+        pack_files[cls._levelName] = SharcWriteEntries(files.items(), endianness)
+        if cls._hasLevelNameFile:
+            pack_files["levelname"] = cls._levelName.encode()
+
+        return SharcWriteEntries(pack_files.items(), endianness)
 
     @classmethod
     def getCourseDataFile(cls, index: int) -> CourseDataFile:
@@ -1104,3 +1546,7 @@ class CourseData:
     @classmethod
     def _clearResData(cls) -> None:
         cls._resData.clear()
+        cls._innerResData.clear()
+        cls._pendingResData.clear()
+        cls._levelName = None
+        cls._hasLevelNameFile = False
@@ -0,0 +1,321 @@
+import argparse
+import hashlib
+import mmap
+import os
+import struct
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from courseArrays import LoadStructureArray
+from courseData import CourseData, CourseDataError, CourseDataFile, CourseDataFileHeader, TEndian, SID, FMT, SIZE
+from courseData import CD_FILE_MAX_NUM, CD_FILE_BLOCK_NUM, CD_FILE_BLOCK_OPTIONS, CD_FILE_BLOCK_NEXT_GOTO, CD_FILE_BLOCK_MAP_ACTOR_DATA, CD_FILE_BLOCK_AREA_DATA
+
+
+# Index layout (all index fields are little-endian):
+#   Header:       magic, version, entry count, string table offset, string table size
+#   Entry table:  one entry per pack (see CD_INDEX_ENTRY_FMT)
+#   String table: UTF-8 pack names and variants
+#   File data:    for every valid course data file of a pack, a stripped-down course data file
+#                 holding only the indexed blocks, in the pack's own endianness, so that it can
+#                 be mapped straight into structured arrays or handed to CourseDataFile.load()
+
+CD_INDEX_MAGIC = b'CDIX'
+CD_INDEX_VERSION = 1
+
+CD_INDEX_HEADER_FMT = '<4sHHII'
+# Source SHA-1, name (offset, size), variant (offset, size), endianness, then (offset, size) of each course data file
+CD_INDEX_ENTRY_FMT = '<20sIHIHcx' + 'II' * CD_FILE_MAX_NUM
+
+CD_INDEX_DATA_ALIGNMENT = 0x10
+
+
+def _alignUp(x: int, alignment: int) -> int:
+    return (x + alignment - 1) & -alignment
+
+
+def HashPackData(data: bytes) -> bytes:
+    return hashlib.sha1(data).digest()
+
+
+def MakeIndexFileData(file: CourseDataFile, endianness: TEndian) -> bytes:
+    assert file.isValid()
+
+    blocks: Dict[int, bytes] = {
+        CD_FILE_BLOCK_OPTIONS: file.getOptions().save(endianness),
+        CD_FILE_BLOCK_NEXT_GOTO: b''.join(nextGoto.save(endianness) for nextGoto in file.getNextGoto()),
+        CD_FILE_BLOCK_AREA_DATA: b''.join(area.save(endianness) for area in file.getAreaData()),
+    }
+
+    mapActorData = file.getMapActorData()
+    if mapActorData:
+        blocks[CD_FILE_BLOCK_MAP_ACTOR_DATA] = b''.join(actor.save(endianness) for actor in mapActorData) + b'\xFF\xFF\xFF\xFF'
+
+    header = bytearray(CD_FILE_BLOCK_NUM * SIZE(endianness, SID.CdFileBlock))
+    body: List[bytes] = []
+    pos = len(header)
+
+    for index in range(CD_FILE_BLOCK_NUM):
+        block = blocks.get(index, b'')
+        struct.pack_into(FMT(endianness, SID.CdFileBlock), header, index * SIZE(endianness, SID.CdFileBlock), pos, len(block))
+        body.append(block)
+        pos += len(block)
+
+    return b''.join((header, *body))
+
+
+class CourseIndexEntry:
+    name: str
+    variant: str
+    endianness: TEndian
+    sourceHash: bytes
+
+    _files: Tuple[Optional[memoryview], ...]
+
+    def __init__(self, name: str, variant: str, endianness: TEndian, sourceHash: bytes, files: Sequence[Optional[memoryview]]) -> None:
+        assert len(files) == CD_FILE_MAX_NUM
+        self.name = name
+        self.variant = variant
+        self.endianness = endianness
+        self.sourceHash = sourceHash
+        self._files = tuple(files)
+
+    def isFileValid(self, fileID: int) -> bool:
+        assert 0 <= fileID < CD_FILE_MAX_NUM
+        return self._files[fileID] is not None
+
+    def getFileData(self, fileID: int) -> Optional[memoryview]:
+        assert 0 <= fileID < CD_FILE_MAX_NUM
+        return self._files[fileID]
+
+    def getBlock(self, fileID: int, index: int) -> memoryview:
+        data = self.getFileData(fileID)
+        if data is None:
+            return memoryview(b'')
+
+        return CourseDataFileHeader.getBlock(index, self.endianness, data)
+
+    def getOptions(self, fileID: int) -> np.ndarray:
+        return LoadStructureArray(self.endianness, SID.Options, self.getBlock(fileID, CD_FILE_BLOCK_OPTIONS))
+
+    def getNextGoto(self, fileID: int) -> np.ndarray:
+        return LoadStructureArray(self.endianness, SID.NextGoto, self.getBlock(fileID, CD_FILE_BLOCK_NEXT_GOTO))
+
+    def getMapActorData(self, fileID: int) -> np.ndarray:
+        # Block 8 is terminated by u32(-1), which the floor division drops
+        return LoadStructureArray(self.endianness, SID.MapActor, self.getBlock(fileID, CD_FILE_BLOCK_MAP_ACTOR_DATA))
+
+    def getAreaData(self, fileID: int) -> np.ndarray:
+        return LoadStructureArray(self.endianness, SID.Area, self.getBlock(fileID, CD_FILE_BLOCK_AREA_DATA))
+
+    def release(self) -> None:
+        for data in self._files:
+            if data is not None:
+                data.release()
+
+    def loadCourseData(self) -> None:
+        # Only the indexed blocks are loaded, resources and bg data are left untouched
+        for i in range(CD_FILE_MAX_NUM):
+            CourseData.getCourseDataFile(i).load(i, self.endianness, self._files[i])
+
+
+class CourseIndex:
+    _entries: Dict[str, CourseIndexEntry]
+
+    def __init__(self, path: str) -> None:
+        self._entries = {}
+
+        with open(path, 'rb') as inf:
+            self._mmap = mmap.mmap(inf.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self._view = memoryview(self._mmap)
+        try:
+            self._load()
+        except:
+            self.close()
+            raise
+
+    def _load(self) -> None:
+        data = self._view
+
+        magic, version, entryCount, stringsOffset, stringsSize = struct.unpack_from(CD_INDEX_HEADER_FMT, data)
+        if magic != CD_INDEX_MAGIC:
+            raise ValueError("Not a course index file!")
+        if version != CD_INDEX_VERSION:
+            raise ValueError("Unsupported course index version: %d" % version)
+
+        strings = bytes(data[stringsOffset:stringsOffset + stringsSize])
+
+        pos = struct.calcsize(CD_INDEX_HEADER_FMT)
+        entrySize = struct.calcsize(CD_INDEX_ENTRY_FMT)
+
+        for _ in range(entryCount):
+            sourceHash, nameOffset, nameSize, variantOffset, variantSize, endianness, *fileRanges = struct.unpack_from(CD_INDEX_ENTRY_FMT, data, pos)
+            pos += entrySize
+
+            files: List[Optional[memoryview]] = []
+            for i in range(CD_FILE_MAX_NUM):
+                fileOffset, fileSize = fileRanges[2*i:2*i + 2]
+                files.append(data[fileOffset:fileOffset + fileSize] if fileSize else None)
+
+            name = strings[nameOffset:nameOffset + nameSize].decode('utf-8')
+            variant = strings[variantOffset:variantOffset + variantSize].decode('utf-8')
+            self._entries[name] = CourseIndexEntry(name, variant, endianness.decode('ascii'), sourceHash, files)
+
+    def close(self) -> None:
+        # Arrays obtained from the entries must not outlive the index
+        for entry in self._entries.values():
+            entry.release()
+
+        self._entries.clear()
+        self._view.release()
+        self._mmap.close()
+
+    def __enter__(self) -> 'CourseIndex':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def getEntry(self, name: str) -> Optional[CourseIndexEntry]:
+        return self._entries.get(name)
+
+    def getEntries(self) -> List[CourseIndexEntry]:
+        return list(self._entries.values())
+
+
+def writeIndex(path: str, entries: Sequence[Tuple[str, str, TEndian, bytes, Sequence[Optional[bytes]]]]) -> None:
+    strings = bytearray()
+    stringRanges: List[Tuple[int, int, int, int]] = []
+    for name, variant, _, _, _ in entries:
+        name_b = name.encode('utf-8')
+        variant_b = variant.encode('utf-8')
+        stringRanges.append((len(strings), len(name_b), len(strings) + len(name_b), len(variant_b)))
+        strings += name_b
+        strings += variant_b
+
+    headerSize = struct.calcsize(CD_INDEX_HEADER_FMT)
+    entrySize = struct.calcsize(CD_INDEX_ENTRY_FMT)
+    stringsOffset = headerSize + entrySize * len(entries)
+
+    # Lay out the file data
+    pos = _alignUp(stringsOffset + len(strings), CD_INDEX_DATA_ALIGNMENT)
+    fileRanges: List[List[int]] = []
+    for _, _, _, _, files in entries:
+        ranges: List[int] = []
+        for fileData in files:
+            if fileData is None:
+                ranges.extend((0, 0))
+            else:
+                ranges.extend((pos, len(fileData)))
+                pos = _alignUp(pos + len(fileData), CD_INDEX_DATA_ALIGNMENT)
+        fileRanges.append(ranges)
+
+    out = bytearray(pos)
+    struct.pack_into(CD_INDEX_HEADER_FMT, out, 0, CD_INDEX_MAGIC, CD_INDEX_VERSION, len(entries), stringsOffset, len(strings))
+
+    for i, (_, _, endianness, sourceHash, files) in enumerate(entries):
+        nameOffset, nameSize, variantOffset, variantSize = stringRanges[i]
+        struct.pack_into(
+            CD_INDEX_ENTRY_FMT, out, headerSize + entrySize * i,
+            sourceHash, nameOffset, nameSize, variantOffset, variantSize, endianness.encode('ascii'), *fileRanges[i]
+        )
+
+        for j, fileData in enumerate(files):
+            if fileData is not None:
+                fileOffset = fileRanges[i][2*j]
+                out[fileOffset:fileOffset + len(fileData)] = fileData
+
+    out[stringsOffset:stringsOffset + len(strings)] = strings
+
+    # Write to a temporary file first so that readers never see a partial index
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as outf:
+        outf.write(out)
+    os.replace(tmp_path, path)
+
+
+def buildIndex(path: str, scanPaths: Sequence[Tuple[str, str, bool]]) -> Tuple[int, int]:
+    # Entries of packs whose source hash did not change are copied over from the existing index
+    oldEntries: Dict[str, Tuple[str, str, TEndian, bytes, Sequence[Optional[bytes]]]] = {}
+    if os.path.isfile(path):
+        try:
+            index = CourseIndex(path)
+        except ValueError:
+            pass
+        else:
+            with index:
+                for entry in index.getEntries():
+                    oldEntries[entry.name] = (
+                        entry.name, entry.variant, entry.endianness, entry.sourceHash,
+                        [None if entry.getFileData(i) is None else bytes(entry.getFileData(i)) for i in range(CD_FILE_MAX_NUM)]
+                    )
+
+    from main import listPacks
+
+    entries: List[Tuple[str, str, TEndian, bytes, Sequence[Optional[bytes]]]] = []
+    updated = 0
+
+    for variant, scan_path, isNSMBUDX in scanPaths:
+        if not os.path.isdir(scan_path):
+            continue
+
+        endianness: TEndian = '<' if isNSMBUDX else '>'
+
+        for fname in listPacks(scan_path):
+            file_path = os.path.join(scan_path, fname)
+            with open(file_path, 'rb') as inf:
+                inb = inf.read()
+
+            sourceHash = HashPackData(inb)
+
+            oldEntry = oldEntries.get(file_path)
+            if oldEntry is not None and oldEntry[1] == variant and oldEntry[2] == endianness and oldEntry[3] == sourceHash:
+                entries.append(oldEntry)
+                continue
+
+            try:
+                CourseData.loadFromPackData(inb, file_path, isNSMBUDX)
+            except CourseDataError as e:
+                print("Error: %s: %s" % (file_path, e))
+                continue
+
+            files: List[Optional[bytes]] = []
+            for i in range(CD_FILE_MAX_NUM):
+                file = CourseData.getCourseDataFile(i)
+                files.append(MakeIndexFileData(file, endianness) if file.isValid() else None)
+
+            entries.append((file_path, variant, endianness, sourceHash, files))
+            updated += 1
+
+    writeIndex(path, entries)
+    return updated, len(entries)
+
+
+def main() -> None:
+    from main import scanPaths
+
+    parser = argparse.ArgumentParser(description="Pre-parsed course index")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = subparsers.add_parser('build', help="Build or refresh the index of all scan paths")
+    build_parser.add_argument('index', nargs='?', default='courseIndex.bin')
+
+    info_parser = subparsers.add_parser('info', help="List the packs in an index")
+    info_parser.add_argument('index', nargs='?', default='courseIndex.bin')
+
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        updated, total = buildIndex(args.index, scanPaths)
+        print("Indexed %d packs (%d updated)" % (total, updated))
+
+    else:
+        with CourseIndex(args.index) as index:
+            for entry in index.getEntries():
+                validFiles = [i for i in range(CD_FILE_MAX_NUM) if entry.isFileValid(i)]
+                print("%s [%s] %s files: %s" % (entry.name, entry.variant, entry.sourceHash.hex(), validFiles))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+import argparse
+import os
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from courseArrays import LoadBgDataArray, LoadStructureArray
+from courseData import CourseData, CourseDataFileHeader, TEndian, SID, LAYER_0, LAYER_1, LAYER_2
+from courseData import CD_FILE_BLOCK_NEXT_GOTO, CD_FILE_BLOCK_MAP_ACTOR_DATA, CD_FILE_BLOCK_AREA_DATA
+
+
+# Bg data objects are placed and sized in tiles, everything else in pixels
+TILE_SIZE = 16
+
+# Bg data layers by the number in their file name (course<N>_bgdatL<number>.bin)
+LAYERS_BY_NUMBER = {0: LAYER_0, 1: LAYER_1, 2: LAYER_2}
+
+# A course data file as (file, bgdat L0, L1, L2), see CourseData.readPackFiles()
+TCourseFiles = Tuple[Optional[bytes], Optional[bytes], Optional[bytes], Optional[bytes]]
+
+# Index of the bg data file of every layer in TCourseFiles
+_BGDAT_PART = {LAYER_0: 1, LAYER_1: 2, LAYER_2: 3}
+
+
+def GetBgDataRects(endianness: TEndian, files: TCourseFiles, layers: Sequence[int] = (LAYER_1,)) -> np.ndarray:
+    # (x, y, width, height) in tiles of every object in the given layers
+    rects: List[np.ndarray] = []
+    for layer in layers:
+        data = files[_BGDAT_PART[layer]]
+        if data is None:
+            continue
+
+        records = LoadBgDataArray(endianness, data)
+        rects.append(np.stack((records['offset__x'], records['offset__y'], records['size__x'], records['size__y']), axis=1))
+
+    if not rects:
+        return np.zeros((0, 4), dtype=np.int32)
+
+    return np.concatenate(rects).astype(np.int32)
+
+
+def GetPositions(records: np.ndarray) -> np.ndarray:
+    # (x, y) in pixels of every nextGoto or actor
+    return np.stack((records['offset__x'], records['offset__y']), axis=1).astype(np.int32)
+
+
+def RasterizeRects(rects: np.ndarray, x: int, y: int, width: int, height: int) -> np.ndarray:
+    # Marks every tile of the (x, y, width, height) window covered by any of the rectangles
+    grid = np.zeros((height + 1, width + 1), dtype=np.int32)
+
+    x0 = np.clip(rects[:, 0] - x, 0, width)
+    y0 = np.clip(rects[:, 1] - y, 0, height)
+    x1 = np.clip(rects[:, 0] + rects[:, 2] - x, 0, width)
+    y1 = np.clip(rects[:, 1] + rects[:, 3] - y, 0, height)
+
+    visible = (x0 < x1) & (y0 < y1)
+    x0 = x0[visible]
+    y0 = y0[visible]
+    x1 = x1[visible]
+    y1 = y1[visible]
+
+    # Corners of every rectangle go into a 2D difference array, whose prefix sums are the coverage counts
+    np.add.at(grid, (y0, x0), 1)
+    np.add.at(grid, (y0, x1), -1)
+    np.add.at(grid, (y1, x0), -1)
+    np.add.at(grid, (y1, x1), 1)
+
+    return grid.cumsum(axis=0).cumsum(axis=1)[:height, :width] > 0
+
+
+class AreaOccupancy:
+    # Tile occupancy of an area, grid[y, x] is the tile at (originX + x, originY + y)
+    areaID: int
+    originX: int
+    originY: int
+    grid: np.ndarray
+
+    def __init__(self, area: np.void, rects: np.ndarray) -> None:
+        # area is a record of an area data array, rects are those of GetBgDataRects()
+        offsetX, offsetY = int(area['offset__x']), int(area['offset__y'])
+
+        self.areaID = int(area['ID'])
+        self.originX = offsetX // TILE_SIZE
+        self.originY = offsetY // TILE_SIZE
+
+        width = -(-(offsetX + int(area['size__x'])) // TILE_SIZE) - self.originX
+        height = -(-(offsetY + int(area['size__y'])) // TILE_SIZE) - self.originY
+        self.grid = RasterizeRects(rects, self.originX, self.originY, width, height)
+
+    def isSolid(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        # Whether the tiles at the given pixel positions are occupied (positions outside of the area are not)
+        tx = np.asarray(x) // TILE_SIZE - self.originX
+        ty = np.asarray(y) // TILE_SIZE - self.originY
+
+        inside = (tx >= 0) & (ty >= 0) & (tx < self.grid.shape[1]) & (ty < self.grid.shape[0])
+        ret = np.zeros(inside.shape, dtype=bool)
+        ret[inside] = self.grid[ty[inside], tx[inside]]
+        return ret
+
+
+def GetFileOccupancy(endianness: TEndian, files: TCourseFiles, layers: Sequence[int] = (LAYER_1,)) -> Dict[int, AreaOccupancy]:
+    assert files[0] is not None
+    rects = GetBgDataRects(endianness, files, layers)
+    areas = LoadStructureArray(endianness, SID.Area, CourseDataFileHeader.getBlock(CD_FILE_BLOCK_AREA_DATA, endianness, files[0]))
+    return {int(area['ID']): AreaOccupancy(area, rects) for area in areas}
+
+
+def FindBuriedPositions(occupancy: Dict[int, AreaOccupancy], positions: np.ndarray, areas: np.ndarray) -> np.ndarray:
+    # Mask of the (x, y) pixel positions inside occupied tiles of the areas they belong to
+    buried = np.zeros(len(positions), dtype=bool)
+    for areaID, areaOccupancy in occupancy.items():
+        inArea = np.flatnonzero(areas == areaID)
+        if len(inArea):
+            buried[inArea] = areaOccupancy.isSolid(positions[inArea, 0], positions[inArea, 1])
+
+    return buried
+
+
+def findBuriedEntrances(endianness: TEndian, files: Sequence[TCourseFiles], layers: Sequence[int] = (LAYER_1,)) -> List[Dict[str, Any]]:
+    # nextGotos and actors of a pack placed inside terrain
+    # (for pipes and doors this is expected, so the type is reported to tell them apart)
+    ret: List[Dict[str, Any]] = []
+
+    for fileID, fileParts in enumerate(files):
+        file = fileParts[0]
+        if file is None:
+            continue
+
+        occupancy = GetFileOccupancy(endianness, fileParts, layers)
+
+        nextGotos = LoadStructureArray(endianness, SID.NextGoto, CourseDataFileHeader.getBlock(CD_FILE_BLOCK_NEXT_GOTO, endianness, file))
+        for i in np.flatnonzero(FindBuriedPositions(occupancy, GetPositions(nextGotos), nextGotos['area'])).tolist():
+            nextGoto = nextGotos[i]
+            ret.append({'kind': 'nextGoto', 'file': fileID, 'area': int(nextGoto['area']), 'ID': int(nextGoto['ID']), 'type': int(nextGoto['type'])})
+
+        # Block 8 is terminated by u32(-1), which the floor division drops
+        actors = LoadStructureArray(endianness, SID.MapActor, CourseDataFileHeader.getBlock(CD_FILE_BLOCK_MAP_ACTOR_DATA, endianness, file))
+        for i in np.flatnonzero(FindBuriedPositions(occupancy, GetPositions(actors), actors['area'])).tolist():
+            actor = actors[i]
+            ret.append({'kind': 'actor', 'file': fileID, 'area': int(actor['area']), 'ID': i, 'type': int(actor['type'])})
+
+    return ret
+
+
+def main() -> None:
+    from main import scanPaths, listPacks
+
+    parser = argparse.ArgumentParser(description="Find nextGotos and actors placed inside terrain")
+    parser.add_argument('-l', '--layer', type=int, action='append', choices=sorted(LAYERS_BY_NUMBER), help="Bg data layer to treat as solid, as in the bgdatL<number> file names (default: 1, the main layer)")
+    parser.add_argument('-t', '--type', type=int, action='append', help="Only report nextGotos of this type")
+    args = parser.parse_args()
+
+    layers: Tuple[int, ...] = tuple(LAYERS_BY_NUMBER[number] for number in args.layer) if args.layer else (LAYER_1,)
+
+    for _, path, isNSMBUDX in scanPaths:
+        if not os.path.isdir(path):
+            continue
+
+        for fname in listPacks(path):
+            file_path = os.path.join(path, fname)
+            with open(file_path, 'rb') as inf:
+                files = CourseData.readPackFiles(inf.read(), file_path, isNSMBUDX)
+
+            for entry in findBuriedEntrances('<' if isNSMBUDX else '>', files, layers):
+                if args.type and (entry['kind'] != 'nextGoto' or entry['type'] not in args.type):
+                    continue
+
+                print("%s: file %d, area %d: %s %d (type %d) is inside terrain" % (
+                    file_path, entry['file'], entry['area'], entry['kind'], entry['ID'], entry['type']
+                ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+import argparse
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from courseArrays import LoadStructureArray
+from courseData import SIZE, CourseData, CourseDataFile, AreaData, NextGoto, TEndian, CD_FILE_BLOCK_RAIL_INFO, CD_FILE_BLOCK_RAIL_POINT, CD_FILE_MAX_NUM
+from courseData import Structures as SID
+
+
+# nextGoto flag of connected pipes, which follow rail rail__info from point rail__point
+NEXT_GOTO_FLAG_CONNECTED_PIPE = 0x08
+
+
+class RailModel:
+    # Array-backed geometry of every rail of a file
+    #
+    # Rails whose point range does not fit in the rail point block are marked invalid
+    # and have no segments, a zero length and an empty bounding box
+
+    IDs: np.ndarray
+    pointStart: np.ndarray
+    pointNum: np.ndarray
+    valid: np.ndarray
+
+    x: np.ndarray
+    y: np.ndarray
+
+    segmentRail: np.ndarray
+    segmentLength: np.ndarray
+    length: np.ndarray
+    bbox: np.ndarray
+
+    def __init__(self, endianness: TEndian, railData: bytes, pointData: bytes) -> None:
+        rails = LoadStructureArray(endianness, SID.Rail, railData)
+        points = LoadStructureArray(endianness, SID.RailPoint, pointData)
+
+        self.IDs = rails['ID'].astype(np.int32)
+        self.pointStart = rails['point__start'].astype(np.int64)
+        self.pointNum = rails['point__num'].astype(np.int64)
+        self.valid = self.pointStart + self.pointNum <= len(points)
+
+        self.x = points['offset__x'].astype(np.float64)
+        self.y = points['offset__y'].astype(np.float64)
+
+        # Index of every point of every valid rail, and the rail it belongs to
+        num = np.where(self.valid, self.pointNum, 0)
+        pointRail = np.repeat(np.arange(len(rails)), num)
+        pointIndex = np.repeat(self.pointStart, num) + np.arange(num.sum()) - np.repeat(np.cumsum(num) - num, num)
+
+        # A segment goes from every point to the next one of the same rail
+        isSegment = pointRail[1:] == pointRail[:-1]
+        self.segmentRail = pointRail[:-1][isSegment]
+        start = pointIndex[:-1][isSegment]
+        end = pointIndex[1:][isSegment]
+
+        self.segmentLength = np.hypot(self.x[end] - self.x[start], self.y[end] - self.y[start])
+        self.length = np.bincount(self.segmentRail, self.segmentLength, minlength=len(rails))
+
+        # (min x, min y, max x, max y)
+        self.bbox = np.empty((len(rails), 4), dtype=np.float64)
+        self.bbox[:, :2] = np.inf
+        self.bbox[:, 2:] = -np.inf
+        np.minimum.at(self.bbox[:, 0], pointRail, self.x[pointIndex])
+        np.minimum.at(self.bbox[:, 1], pointRail, self.y[pointIndex])
+        np.maximum.at(self.bbox[:, 2], pointRail, self.x[pointIndex])
+        np.maximum.at(self.bbox[:, 3], pointRail, self.y[pointIndex])
+
+    def __len__(self) -> int:
+        return len(self.IDs)
+
+    def getIndexByID(self, ID: int) -> int:
+        indices = np.flatnonzero(self.IDs == ID)
+        return int(indices[0]) if len(indices) else -1
+
+
+# Models are cached per file, together with the record lists they were built from, which are replaced
+# whenever a file with rails is loaded and emptied otherwise (the references also keep their IDs from being reused)
+_railModelCache: Dict[int, Tuple[list, list, RailModel]] = {}
+_modifiedRailRecords: Dict[int, Tuple[list, list]] = {}
+
+
+def GetRailModel(file: CourseDataFile) -> RailModel:
+    rails = file.getRailInfo()
+    points = file.getRailPoint()
+
+    cached = _railModelCache.get(file.getID())
+    if cached is not None and cached[0] is rails and cached[1] is points and \
+       len(cached[2]) == len(rails) and len(cached[2].x) == len(points):
+        return cached[2]
+
+    # The rail blocks are taken as loaded, unless the records were modified or do not come from them
+    endianness = CourseData.getEndianness()
+    modified = _modifiedRailRecords.get(file.getID())
+    fromRecords = modified is not None and modified[0] is rails and modified[1] is points
+
+    railData = b'' if fromRecords else file.getLoadedBlock(CD_FILE_BLOCK_RAIL_INFO)
+    if len(railData) != SIZE(endianness, SID.Rail) * len(rails):
+        railData = b''.join(rail.save(endianness) for rail in rails)
+
+    pointData = b'' if fromRecords else file.getLoadedBlock(CD_FILE_BLOCK_RAIL_POINT)
+    if len(pointData) != SIZE(endianness, SID.RailPoint) * len(points):
+        pointData = b''.join(point.save(endianness) for point in points)
+
+    model = RailModel(endianness, railData, pointData)
+    _railModelCache[file.getID()] = (rails, points, model)
+    return model
+
+
+def ClearRailModelCache() -> None:
+    # Must be called after rail records are modified in place, the models of those records
+    # are then built from the records instead of the blocks they were loaded from
+    for fileID, (rails, points, _) in _railModelCache.items():
+        _modifiedRailRecords[fileID] = (rails, points)
+    _railModelCache.clear()
+
+
+def CheckNextGotoRail(file: CourseDataFile, nextGoto: NextGoto, area: Optional[AreaData]) -> Optional[str]:
+    model = GetRailModel(file)
+
+    i = model.getIndexByID(nextGoto.rail__info)
+    if i < 0:
+        return "rail %d does not exist" % nextGoto.rail__info
+
+    if not model.valid[i]:
+        return "rail %d points %d to %d are out of range" % (nextGoto.rail__info, model.pointStart[i], model.pointStart[i] + model.pointNum[i] - 1)
+
+    if nextGoto.rail__point >= model.pointNum[i]:
+        return "rail %d has no point %d" % (nextGoto.rail__info, nextGoto.rail__point)
+
+    if area is not None and model.pointNum[i]:
+        # Same margin as the nextGoto containment check of the traversal
+        minX, minY, maxX, maxY = model.bbox[i].tolist()
+        if minX < area.offset__x - 8*16 or maxX > area.offset__x + area.size__x + 8*16 or \
+           minY < area.offset__y - 8*16 or maxY > area.offset__y + area.size__y + 8*16:
+            return "rail %d leaves area %d" % (nextGoto.rail__info, area.ID)
+
+    return None
+
+
+def checkRails() -> List[Tuple[int, int, str]]:
+    # (file, nextGoto, error) of every invalid rail reference in the loaded course
+    # (only connected pipes use their rail, which can be rail 0 from point 0)
+    from main import FindContainmentArea
+
+    ret: List[Tuple[int, int, str]] = []
+
+    for fileID in range(CD_FILE_MAX_NUM):
+        file = CourseData.getCourseDataFile(fileID)
+        if not file.isValid():
+            continue
+
+        for nextGoto in file.getNextGoto():
+            if not nextGoto.flag & NEXT_GOTO_FLAG_CONNECTED_PIPE:
+                continue
+
+            error = CheckNextGotoRail(file, nextGoto, FindContainmentArea(file, nextGoto))
+            if error is not None:
+                ret.append((fileID, nextGoto.ID, error))
+
+    return ret
+
+
+def main() -> None:
+    from main import scanPaths, listPacks
+
+    parser = argparse.ArgumentParser(description="Check the rails referenced by nextGotos")
+    parser.add_argument('-v', '--verbose', action='store_true', help="Also print the length and bounding box of every rail")
+    args = parser.parse_args()
+
+    for _, path, isNSMBUDX in scanPaths:
+        if not os.path.isdir(path):
+            continue
+
+        for fname in listPacks(path):
+            file_path = os.path.join(path, fname)
+            CourseData.loadFromPack(file_path, isNSMBUDX)
+
+            if args.verbose:
+                for fileID in range(CD_FILE_MAX_NUM):
+                    file = CourseData.getCourseDataFile(fileID)
+                    if not file.isValid():
+                        continue
+
+                    model = GetRailModel(file)
+                    for i in range(len(model)):
+                        print("%s: file %d: rail %d: %d points, length %.1f, bbox %s" % (
+                            file_path, fileID, model.IDs[i], model.pointNum[i], model.length[i], model.bbox[i].tolist()
+                        ))
+
+            for fileID, nextGotoID, error in checkRails():
+                print("%s: file %d: nextGoto %d: %s" % (file_path, fileID, nextGotoID, error))
+
+
+if __name__ == '__main__':
+    main()
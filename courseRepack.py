@@ -0,0 +1,139 @@
+import argparse
+from multiprocessing import Pool
+import os
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from courseData import CourseData, CourseDataFile, CD_FILE_MAX_NUM
+
+
+# A transform modifies a course data file in place and returns whether it changed anything
+TTransform = Callable[[CourseDataFile], bool]
+
+transforms: Dict[str, TTransform] = {}
+
+
+def registerTransform(name: str) -> Callable[[TTransform], TTransform]:
+    def decorator(func: TTransform) -> TTransform:
+        assert name not in transforms
+        transforms[name] = func
+        return func
+
+    return decorator
+
+
+@registerTransform('same-file-id')
+def fixExplicitSameFileID(file: CourseDataFile) -> bool:
+    # Fixes "NextGoto leads to the same file, but uses file ID explicitly instead of 0."
+    # NextGotos to nextGoto 0 are left alone, as the scan takes file 0 nextGoto 0 for
+    # an unused destination and would no longer warn when it does not exist
+    changed = False
+    for nextGoto in file.getNextGoto():
+        if nextGoto.destination__file - 1 == file.getID() and nextGoto.destination__next_goto != 0:
+            nextGoto.destination__file = 0
+            changed = True
+
+    return changed
+
+
+def applyTransforms(names: Sequence[str]) -> List[str]:
+    applied: List[str] = []
+
+    for name in names:
+        transform = transforms[name]
+        changed = False
+
+        for i in range(CD_FILE_MAX_NUM):
+            file = CourseData.getCourseDataFile(i)
+            if file.isValid() and transform(file):
+                changed = True
+
+        if changed:
+            applied.append(name)
+
+    return applied
+
+
+def repackPack(src_path: str, dst_path: str, isNSMBUDX: bool, names: Sequence[str], copyUnchanged: bool = True) -> Tuple[str, Optional[List[str]], Optional[str]]:
+    # Returns the source path, the transforms which changed the pack and the error, if any
+    try:
+        with open(src_path, 'rb') as inf:
+            inb = inf.read()
+
+        CourseData.loadFromPackData(inb, src_path, isNSMBUDX)
+        applied = applyTransforms(names)
+
+        if applied:
+            # CourseData.save() does not compress
+            if dst_path.endswith('.szs'):
+                dst_path = dst_path[:-len('.szs')] + '.sarc'
+
+            os.makedirs(os.path.dirname(dst_path) or '.', exist_ok=True)
+            with open(dst_path, 'wb') as outf:
+                outf.write(CourseData.save())
+
+        elif copyUnchanged:
+            os.makedirs(os.path.dirname(dst_path) or '.', exist_ok=True)
+            with open(dst_path, 'wb') as outf:
+                outf.write(inb)
+
+    except Exception as e:
+        return src_path, None, "%s: %s" % (type(e).__name__, e)
+
+    return src_path, applied, None
+
+
+def _repackPackStar(args: Tuple[str, str, bool, Sequence[str], bool]) -> Tuple[str, Optional[List[str]], Optional[str]]:
+    return repackPack(*args)
+
+
+def repackCorpus(out_root: str, scanPaths: Sequence[Tuple[str, str, bool]], names: Sequence[str], processes: Optional[int] = None, copyUnchanged: bool = True) -> Tuple[int, int, int]:
+    from main import listPacks
+
+    for name in names:
+        if name not in transforms:
+            raise ValueError("Unknown transform: %s" % name)
+
+    if os.path.abspath(out_root) == os.path.abspath('.'):
+        raise ValueError("The output tree must be separate from the input tree!")
+
+    jobs: List[Tuple[str, str, bool, Sequence[str], bool]] = []
+    for _, path, isNSMBUDX in scanPaths:
+        if not os.path.isdir(path):
+            continue
+
+        for fname in listPacks(path):
+            jobs.append((os.path.join(path, fname), os.path.join(out_root, path, fname), isNSMBUDX, names, copyUnchanged))
+
+    changedCount = 0
+    errorCount = 0
+
+    with Pool(processes) as pool:
+        for src_path, applied, error in pool.imap_unordered(_repackPackStar, jobs, chunksize=4):
+            if error is not None:
+                errorCount += 1
+                print("Error: %s: %s" % (src_path, error))
+            elif applied:
+                changedCount += 1
+                print("%s: %s" % (src_path, ', '.join(applied)))
+
+    return len(jobs), changedCount, errorCount
+
+
+def main() -> None:
+    from main import scanPaths
+
+    parser = argparse.ArgumentParser(description="Apply course fixes to every pack and write the results to a separate tree")
+    parser.add_argument('out', help="Root of the output tree")
+    parser.add_argument('-t', '--transform', action='append', choices=sorted(transforms), help="Transform to apply (default: all)")
+    parser.add_argument('-j', '--jobs', type=int, default=None, help="Number of worker processes (default: CPU count)")
+    parser.add_argument('--changed-only', action='store_true', help="Only write the packs which were changed")
+    args = parser.parse_args()
+
+    names = args.transform or list(transforms)
+
+    total, changed, errors = repackCorpus(args.out, scanPaths, names, args.jobs, not args.changed_only)
+    print("Processed %d packs, changed %d, failed %d" % (total, changed, errors))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,237 @@
+import argparse
+from multiprocessing import Pool
+import os
+import re
+import struct
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from courseData import CourseData, CourseDataFile, TEndian, CD_FILE_BLOCK_NUM, CD_FILE_BLOCK_AREA_DATA, FMT, SID, SIZE, LAYER_0, LAYER_2
+from courseData import AreaData, BgCourseData, DistantViewData, Location, MapActorData, NextGoto, RailInfo, RailPoint, ScrollData
+from sarcReader import SarcReader
+from yaz0 import IsYaz0, Yaz0Decompress
+
+
+# Load -> save check of the packs
+#
+# CourseData.save() rebuilds the SARC archives (entry order, alignment and Yaz0 compression of the
+# original are not kept), so the packs are compared by the contents of their archives, with inner
+# level archives opened, and every course data file and bg data file must come back byte for byte.
+# A built-in course file is also checked in both byte orders, and saved in the other one
+
+COURSE_FILE_NAME = re.compile(r'course/course\d\.bin$')
+
+FORMAT_ITEM = re.compile(r'(\d*)([a-zA-Z])')
+
+
+def ReadArchiveFiles(data: bytes, prefix: str = '') -> Dict[str, bytes]:
+    # All files of an archive by path, with the files of inner archives as '<archive>/<path>'
+    if IsYaz0(data):
+        data = Yaz0Decompress(data)
+
+    files: Dict[str, bytes] = {}
+    for name, entry in SarcReader(data).readEntries():
+        entry_b = bytes(entry)
+        inner_b = Yaz0Decompress(entry_b) if IsYaz0(entry_b) else entry_b
+        if inner_b[:4] == b'SARC':
+            files.update(ReadArchiveFiles(inner_b, prefix + name + '/'))
+        else:
+            files[prefix + name] = entry_b
+
+    return files
+
+
+def _findBlock(endianness: TEndian, data: bytes, pos: int) -> str:
+    blockHeaderSize = SIZE(endianness, SID.CdFileBlock)
+    if pos < blockHeaderSize * CD_FILE_BLOCK_NUM:
+        return "header of block %d" % (pos // blockHeaderSize + 1)
+
+    for index in range(CD_FILE_BLOCK_NUM):
+        offset, size = struct.unpack_from(FMT(endianness, SID.CdFileBlock), data, index * blockHeaderSize)
+        if offset <= pos < offset + size:
+            return "block %d" % (index + 1)
+
+    return "padding"
+
+
+def CompareFile(endianness: TEndian, name: str, original: bytes, saved: bytes) -> Optional[str]:
+    if original == saved:
+        return None
+
+    pos = next((i for i, (a, b) in enumerate(zip(original, saved)) if a != b), min(len(original), len(saved)))
+
+    message = "%s differs at 0x%X" % (name, pos)
+    if COURSE_FILE_NAME.search(name) and len(original) >= SIZE(endianness, SID.CdFileBlock) * CD_FILE_BLOCK_NUM:
+        message += " (%s)" % _findBlock(endianness, original, pos)
+    if len(original) != len(saved):
+        message += ", size 0x%X -> 0x%X" % (len(original), len(saved))
+
+    return message
+
+
+def checkPack(path: str, isNSMBUDX: bool) -> Tuple[str, List[str], Optional[str]]:
+    # Returns the path, the differences and the error, if any
+    endianness: TEndian = '<' if isNSMBUDX else '>'
+
+    try:
+        with open(path, 'rb') as inf:
+            inb = inf.read()
+
+        CourseData.loadFromPackData(inb, path, isNSMBUDX)
+        original = ReadArchiveFiles(inb)
+        saved = ReadArchiveFiles(CourseData.save())
+
+    except Exception as e:
+        return path, [], "%s: %s" % (type(e).__name__, e)
+
+    differences: List[str] = []
+    for name in sorted(original.keys() | saved.keys()):
+        if name not in saved:
+            differences.append("%s is missing" % name)
+        elif name not in original:
+            differences.append("%s was added" % name)
+        else:
+            difference = CompareFile(endianness, name, original[name], saved[name])
+            if difference is not None:
+                differences.append(difference)
+
+    return path, differences, None
+
+
+def _makeRecordData(structId: SID, seed: int) -> bytes:
+    # Record with every field set to a value derived from the seed, in big endian
+    values: List[object] = []
+    for count, code in FORMAT_ITEM.findall(structId.value):
+        if code == 's':
+            values.append(b'Check%d' % seed)
+            continue
+
+        for _ in range(int(count or 1)):
+            value = seed * 37 + len(values) * 11
+            if code == 'f':
+                values.append(float(value % 1000) / 4)
+            elif code in 'bhi':
+                values.append(value % 0x80 - 0x40)
+            else:
+                values.append(value % 0x100)
+
+    return struct.pack(FMT('>', structId), *values)
+
+
+def MakeCheckFile() -> CourseDataFile:
+    # Course data file with a few records in every block, not loaded from data
+    file = CourseDataFile()
+    file.setEnvironment(0, "Pa0_Check")
+    file.getOptions().load('>', _makeRecordData(SID.Options, 1))
+
+    for cls, structId, records in (
+        (ScrollData,      SID.ScrollData,   file.getScrollData()),
+        (DistantViewData, SID.DistantView,  file.getDistantViewData()),
+        (NextGoto,        SID.NextGoto,     file.getNextGoto()),
+        (MapActorData,    SID.MapActor,     file.getMapActorData()),
+        (AreaData,        SID.Area,         file.getAreaData()),
+        (Location,        SID.Location,     file.getLocation()),
+        (RailInfo,        SID.Rail,         file.getRailInfo()),
+        (RailPoint,       SID.RailPoint,    file.getRailPoint()),
+        (BgCourseData,    SID.BgCourseData, file.getBgData(LAYER_0)),
+        (BgCourseData,    SID.BgCourseData, file.getBgData(LAYER_2)),
+    ):
+        for i in range(3):
+            records.append(cls('>', _makeRecordData(structId, len(records) + i)))
+
+    return file
+
+
+def _moveAreaBlock(endianness: TEndian, data: bytes) -> bytes:
+    # Same file with the area block moved to the end, after some padding, so that the layout is not the normalized one
+    blockFmt = FMT(endianness, SID.CdFileBlock)
+    pos = CD_FILE_BLOCK_AREA_DATA * SIZE(endianness, SID.CdFileBlock)
+    offset, size = struct.unpack_from(blockFmt, data, pos)
+
+    moved = bytearray(data) + bytes(8) + data[offset:offset + size]
+    struct.pack_into(blockFmt, moved, pos, len(data) + 8, size)
+    return bytes(moved)
+
+
+def checkBuiltIn() -> List[str]:
+    # Differences for the built-in course file: loaded and saved in its byte order it must come back
+    # byte for byte, with the normalized layout and with another one, and saved in the other byte order
+    # it must be what the file not loaded from data saves in that order
+    differences: List[str] = []
+    check = MakeCheckFile()
+
+    for endianness, other in (('>', '<'), ('<', '>')):
+        expectedOther = check.save(other)
+
+        for layout, parts in (
+            ("normalized", check.save(endianness)),
+            ("moved area block", (_moveAreaBlock(endianness, check.save(endianness)[0]),) + check.save(endianness)[1:]),
+        ):
+            file = CourseDataFile()
+            file.load(0, endianness, *parts)
+
+            for saveEndianness, expected in ((endianness, parts), (other, expectedOther)):
+                for name, original, saved in zip(("file", "bgdat L0", "bgdat L1", "bgdat L2"), expected, file.save(saveEndianness)):
+                    difference = CompareFile(saveEndianness, "course/course1.bin" if name == "file" else name, original, saved)
+                    if difference is not None:
+                        differences.append("%s, %s, loaded %s, saved %s: %s" % (name, layout, endianness, saveEndianness, difference))
+
+    return differences
+
+
+def _checkPackStar(args: Tuple[str, bool]) -> Tuple[str, List[str], Optional[str]]:
+    return checkPack(*args)
+
+
+def checkCorpus(scanPaths: Sequence[Tuple[str, str, bool]], processes: Optional[int] = None) -> Tuple[int, int, int]:
+    from main import listPacks
+
+    jobs: List[Tuple[str, bool]] = []
+    for _, path, isNSMBUDX in scanPaths:
+        if not os.path.isdir(path):
+            continue
+
+        for fname in listPacks(path):
+            jobs.append((os.path.join(path, fname), isNSMBUDX))
+
+    differentCount = 0
+    errorCount = 0
+
+    with Pool(processes) as pool:
+        for path, differences, error in pool.imap_unordered(_checkPackStar, jobs, chunksize=4):
+            if error is not None:
+                errorCount += 1
+                print("Error: %s: %s" % (path, error))
+            elif differences:
+                differentCount += 1
+                print("%s:" % path)
+                for difference in differences:
+                    print("  %s" % difference)
+
+    return len(jobs), differentCount, errorCount
+
+
+def main() -> None:
+    from main import scanPaths
+
+    parser = argparse.ArgumentParser(description="Check that every pack is saved back with the same course data files and resources")
+    parser.add_argument('-j', '--jobs', type=int, default=None, help="Number of worker processes (default: CPU count)")
+    parser.add_argument('--built-in-only', action='store_true', help="Only check the built-in course file")
+    args = parser.parse_args()
+
+    differences = checkBuiltIn()
+    print("Built-in course file: %s" % ("OK" if not differences else "FAILED"))
+    for difference in differences:
+        print("  %s" % difference)
+    failed = bool(differences)
+
+    if not args.built_in_only:
+        total, different, errors = checkCorpus(scanPaths, args.jobs)
+        print("Checked %d packs, %d differ, %d failed" % (total, different, errors))
+        failed = failed or bool(different or errors)
+
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
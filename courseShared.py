@@ -0,0 +1,331 @@
+import argparse
+import atexit
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+import json
+from multiprocessing import resource_tracker, shared_memory
+import os
+import weakref
+from typing import Deque, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+from courseData import CourseData, CourseDataError, CD_FILE_MAX_NUM, LAYER_0, LAYER_1, LAYER_2, TEndian
+from courseIndex import CourseIndexEntry
+
+
+# Course files start at multiples of this in a segment
+SEGMENT_ALIGNMENT = 16
+
+# Index of the course file and of the bg data files in the ranges of a file
+SHARED_PART_FILE = 0
+SHARED_PART_BGDAT_L0 = 1
+SHARED_PART_BGDAT_L1 = 2
+SHARED_PART_BGDAT_L2 = 3
+
+TSharedRange = Optional[Tuple[int, int]]  # (Offset, Size)
+TSharedFileRanges = Tuple[TSharedRange, TSharedRange, TSharedRange, TSharedRange]
+
+
+class SharedCourseHandle(NamedTuple):
+    # All another process needs to reach the course data of a pack in a segment,
+    # which is what gets pickled instead of the records
+    segment: str
+    endianness: TEndian
+    packSize: int
+    files: Tuple[TSharedFileRanges, ...]  # (File, bgdat L0, L1, L2) ranges of each file, None if absent
+
+
+def _alignUp(value: int) -> int:
+    return (value + SEGMENT_ALIGNMENT - 1) & -SEGMENT_ALIGNMENT
+
+
+def ExportFiles(segment: str, endianness: TEndian, files: Sequence[Tuple[Optional[bytes], ...]], packSize: int = 0) -> Tuple[shared_memory.SharedMemory, SharedCourseHandle]:
+    # Places course data files, given as (file, bgdat L0, L1, L2) for each file, into a new segment named segment.
+    # They are stored in their fixed-layout binary form, so the blocks are arrays of records that
+    # can be read in place (see SharedCourseView) instead of lists of objects
+    parts: List[Tuple[int, bytes]] = []
+    ranges: List[TSharedFileRanges] = []
+    size = 0
+
+    for fileParts in files:
+        fileRanges: List[TSharedRange] = []
+        for data in fileParts:
+            if data is None:
+                fileRanges.append(None)
+                continue
+
+            fileRanges.append((size, len(data)))
+            parts.append((size, data))
+            size = _alignUp(size + len(data))
+
+        ranges.append((fileRanges[0], fileRanges[1], fileRanges[2], fileRanges[3]))
+
+    shm = shared_memory.SharedMemory(segment, create=True, size=max(size, 1))
+    try:
+        for offset, data in parts:
+            shm.buf[offset:offset + len(data)] = data
+
+    except BaseException:
+        shm.close()
+        shm.unlink()
+        raise
+
+    return shm, SharedCourseHandle(shm.name, endianness, packSize, tuple(ranges))
+
+
+def ExportPack(segment: str, path: str, isNSMBUDX: bool) -> SharedCourseHandle:
+    # Worker side of the handoff: reads a pack and leaves its course data files in the segment,
+    # which is then owned by the arena that named it. The files are taken out of the (decompressed) archives
+    # as they are, they are only parsed once, by the process loading them from the segment
+    endianness: TEndian = '<' if isNSMBUDX else '>'
+
+    with open(path, 'rb') as inf:
+        inb = inf.read()
+
+    shm, handle = ExportFiles(segment, endianness, CourseData.readPackFiles(inb, path, isNSMBUDX), len(inb))
+    shm.close()
+    return handle
+
+
+def _unlinkSegment(name: str) -> bool:
+    try:
+        shm = shared_memory.SharedMemory(name)
+    except FileNotFoundError:
+        return False
+
+    shm.close()
+    shm.unlink()
+    return True
+
+
+class SharedCourseView:
+    # Attachment to the segment of a handle
+    #
+    # getEntry() gives the blocks as structured arrays over the segment, without copying them,
+    # and loadCourseData() decodes them into CourseData. Arrays taken from the entry must be dropped
+    # before the view is closed, as the segment cannot be unmapped while they are alive
+
+    def __init__(self, handle: SharedCourseHandle) -> None:
+        self.handle = handle
+        self._shm = shared_memory.SharedMemory(handle.segment)
+        self._views: List[memoryview] = []
+
+    def __enter__(self) -> 'SharedCourseView':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def getFileData(self, fileID: int, part: int = SHARED_PART_FILE) -> Optional[memoryview]:
+        assert 0 <= fileID < CD_FILE_MAX_NUM
+        dataRange = self.handle.files[fileID][part]
+        if dataRange is None:
+            return None
+
+        offset, size = dataRange
+        view = self._shm.buf[offset:offset + size]
+        self._views.append(view)
+        return view
+
+    def getEntry(self, path: str) -> CourseIndexEntry:
+        return CourseIndexEntry(path, '', self.handle.endianness, b'', [self.getFileData(i) for i in range(CD_FILE_MAX_NUM)])
+
+    def loadCourseData(self) -> None:
+        # The files are copied out, as the loaded course data keeps them for saving
+        buf = self._shm.buf
+        files = []
+
+        for ranges in self.handle.files:
+            files.append(tuple(None if dataRange is None else bytes(buf[dataRange[0]:dataRange[0] + dataRange[1]]) for dataRange in ranges))
+
+        CourseData.loadFromFiles(self.handle.endianness, files)
+
+    def close(self) -> None:
+        for view in self._views:
+            view.release()
+        self._views.clear()
+
+        self._shm.close()
+
+
+class SharedCourseArena:
+    # Owner of the segments handed between processes
+    #
+    # Every segment is named by the arena before it is created, possibly by another process,
+    # so the segment of a worker that crashed or was cancelled is freed like any other:
+    # release() frees one segment, close() all that are left, and also runs at exit.
+    # If this process itself dies first, the resource tracker frees the segments once it exits,
+    # as it is started here before any worker so that they all share it
+
+    def __init__(self, prefix: Optional[str] = None) -> None:
+        resource_tracker.ensure_running()
+
+        self.prefix = prefix if prefix is not None else "nsmbu_%d_%x" % (os.getpid(), id(self) & 0xFFFFFF)
+        self._counter = 0
+        self._names: Set[str] = set()
+
+        _arenas.add(self)
+
+    def __enter__(self) -> 'SharedCourseArena':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def reserve(self) -> str:
+        name = "%s_%d" % (self.prefix, self._counter)
+        self._counter += 1
+        self._names.add(name)
+        return name
+
+    def export(self, packSize: int = 0) -> SharedCourseHandle:
+        # Exports the course data files currently in CourseData of this process
+        files: List[Tuple[Optional[bytes], ...]] = []
+
+        for i in range(CD_FILE_MAX_NUM):
+            cd_file = CourseData.getCourseDataFile(i)
+            if not cd_file.isValid():
+                files.append((None, None, None, None))
+                continue
+
+            file, bgdat_L0, bgdat_L1, bgdat_L2 = cd_file.save(CourseData.getEndianness())
+            files.append((
+                file,
+                bgdat_L0 if cd_file.hasBgData(LAYER_0) else None,
+                bgdat_L1 if cd_file.hasBgData(LAYER_1) else None,
+                bgdat_L2 if cd_file.hasBgData(LAYER_2) else None,
+            ))
+
+        shm, handle = ExportFiles(self.reserve(), CourseData.getEndianness(), files, packSize)
+        shm.close()
+        return handle
+
+    def release(self, name: str) -> None:
+        if name in self._names:
+            self._names.discard(name)
+            _unlinkSegment(name)
+
+    def getLiveCount(self) -> int:
+        return len(self._names)
+
+    def close(self) -> None:
+        for name in sorted(self._names):
+            _unlinkSegment(name)
+        self._names.clear()
+
+
+# Arenas still open, closed by the one hook this module registers to run at exit
+_arenas: 'weakref.WeakSet[SharedCourseArena]' = weakref.WeakSet()
+
+
+def _closeArenas() -> None:
+    for arena in list(_arenas):
+        arena.close()
+
+
+atexit.register(_closeArenas)
+
+
+def scanShared(processes: Optional[int] = None, inFlight: int = 8) -> None:
+    # Scan with the packs loaded by worker processes and analyzed and drawn in this one,
+    # in scan order, with at most inFlight packs handed over at once
+    import main as analyzer
+    from asyncScan import listJobs
+
+    jobs = listJobs(analyzer.scanPaths)
+    analyzer.startTelemetry(len(jobs))
+    telemetry = analyzer.telemetry
+    if telemetry is not None:
+        telemetry.startTicker()
+
+    pending: Deque[Tuple[str, str, bool, str, Future]] = deque()
+    nextJob = 0
+
+    try:
+        with SharedCourseArena() as arena, ProcessPoolExecutor(processes) as executor:
+            while nextJob < len(jobs) or pending:
+                while nextJob < len(jobs) and len(pending) < max(1, inFlight):
+                    variant, file_path, isNSMBUDX = jobs[nextJob]
+                    name = arena.reserve()
+                    pending.append((variant, file_path, isNSMBUDX, name, executor.submit(ExportPack, name, file_path, isNSMBUDX)))
+                    nextJob += 1
+
+                variant, file_path, isNSMBUDX, name, future = pending.popleft()
+                loadError: Optional[CourseDataError] = None
+                try:
+                    # Packs whose archives are broken already fail in the worker
+                    try:
+                        handle = future.result()
+                    except CourseDataError as e:
+                        loadError = e
+
+                    else:
+                        if telemetry is not None:
+                            telemetry.setVariant(variant)
+                            telemetry.countRead(handle.packSize)
+
+                        with SharedCourseView(handle) as view:
+                            try:
+                                view.loadCourseData()
+                            except CourseDataError as e:
+                                loadError = e
+
+                finally:
+                    arena.release(name)
+
+                if loadError is None:
+                    graphs = analyzer.scanPack(file_path, isNSMBUDX, loaded=True)
+                else:
+                    analyzer.logger.info("Loading: %s", file_path)
+                    analyzer.reportLoadError(file_path, loadError)
+                    graphs = []
+
+                if analyzer.enableGraphDraw:
+                    analyzer.setGraphAtlasVariant(variant)
+                    for graph, out_fname, node_list in graphs:
+                        analyzer.draw_graph(graph, out_fname, node_list=node_list)
+
+                if telemetry is not None:
+                    telemetry.countPack()
+
+    finally:
+        if telemetry is not None:
+            telemetry.stopTicker()
+
+    analyzer.closeGraphAtlas()
+
+    if telemetry is not None:
+        telemetry.update(force=True)
+
+
+def main() -> None:
+    import main as analyzer
+
+    parser = argparse.ArgumentParser(description="Scan all packs with the loading done by worker processes, which hand the course data over in shared memory")
+    parser.add_argument('-j', '--processes', type=int, help="Number of worker processes (default: number of CPUs)")
+    parser.add_argument('--in-flight', type=int, default=8, help="Maximum number of packs handed over at once")
+    parser.add_argument('--no-draw', action='store_true', help="Do not draw the graphs")
+    parser.add_argument('--renderer', choices=sorted(analyzer.GRAPH_EXTENSIONS), help="Graph output (default: %s)" % analyzer.graphRenderer)
+    parser.add_argument('--no-progress', action='store_true', help="Do not print the progress")
+    args = parser.parse_args()
+
+    if args.no_draw:
+        analyzer.enableGraphDraw = False
+    if args.renderer:
+        analyzer.graphRenderer = args.renderer
+    if args.no_progress:
+        analyzer.showProgress = False
+
+    timestamp = analyzer.now()
+    scanShared(args.processes, args.in_flight)
+
+    if analyzer.logger.buffer:
+        with open(timestamp + '.txt', 'wb') as outf:
+            outf.write(''.join(analyzer.logger.buffer).encode('utf-8'))
+
+    if analyzer.jsonReport:
+        with open(timestamp + '.json', 'w', encoding='utf-8') as outf:
+            json.dump(analyzer.jsonReport, outf, indent=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,237 @@
+import argparse
+import json
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from courseArrays import GetStructureDtype
+from courseData import SID, CD_FILE_MAX_NUM
+from courseIndex import CourseIndex, buildIndex
+
+
+STATS_TOP_AREAS = 10
+
+# Actors which lead to another nextGoto (see explore_area())
+WARP_ACTOR_TYPES = (424, 432, 497)
+
+
+class CorpusArrays:
+    variants: List[str]
+    packNames: List[str]
+    packVariant: np.ndarray
+
+    # Native-endian structured arrays of every record in the corpus,
+    # each paired with the pack index and file ID the record belongs to
+    nextGoto: np.ndarray
+    nextGotoPack: np.ndarray
+    nextGotoFile: np.ndarray
+
+    mapActor: np.ndarray
+    mapActorPack: np.ndarray
+    mapActorFile: np.ndarray
+
+    area: np.ndarray
+    areaPack: np.ndarray
+    areaFile: np.ndarray
+
+    def __init__(self, index: CourseIndex) -> None:
+        self.variants = []
+        self.packNames = []
+        packVariant: List[int] = []
+
+        chunks: Dict[str, Tuple[List[np.ndarray], List[int], List[int]]] = {
+            'nextGoto': ([], [], []),
+            'mapActor': ([], [], []),
+            'area':     ([], [], []),
+        }
+
+        # The loops below run once per course data file, the records themselves are never visited in Python
+        for packIndex, entry in enumerate(index.getEntries()):
+            if entry.variant not in self.variants:
+                self.variants.append(entry.variant)
+
+            self.packNames.append(entry.name)
+            packVariant.append(self.variants.index(entry.variant))
+
+            for fileID in range(CD_FILE_MAX_NUM):
+                if not entry.isFileValid(fileID):
+                    continue
+
+                for key, records in (
+                    ('nextGoto', entry.getNextGoto(fileID)),
+                    ('mapActor', entry.getMapActorData(fileID)),
+                    ('area',     entry.getAreaData(fileID)),
+                ):
+                    arrays, packs, files = chunks[key]
+                    arrays.append(records)
+                    packs.append(packIndex)
+                    files.append(fileID)
+
+        self.packVariant = np.array(packVariant, dtype=np.int32)
+
+        for key, structId in (('nextGoto', SID.NextGoto), ('mapActor', SID.MapActor), ('area', SID.Area)):
+            arrays, packs, files = chunks[key]
+            dtype = GetStructureDtype('=', structId)
+            counts = np.array([len(records) for records in arrays], dtype=np.int64)
+
+            # Copies the records out of the index, converting them to native endianness on the way
+            if arrays:
+                records = np.concatenate([records.astype(dtype) for records in arrays])
+            else:
+                records = np.empty(0, dtype)
+
+            setattr(self, key, records)
+            setattr(self, key + 'Pack', np.repeat(np.array(packs, dtype=np.int32), counts))
+            setattr(self, key + 'File', np.repeat(np.array(files, dtype=np.int32), counts))
+
+
+def _valueCounts(values: np.ndarray) -> Dict[int, int]:
+    keys, counts = np.unique(values, return_counts=True)
+    return dict(zip(keys.tolist(), counts.tolist()))
+
+
+def _groupedValueCounts(groups: np.ndarray, values: np.ndarray, groupNames: List[str]) -> Dict[str, Dict[int, int]]:
+    ret: Dict[str, Dict[int, int]] = {name: {} for name in groupNames}
+    if not len(values):
+        return ret
+
+    pairs = np.stack((groups.astype(np.int64), values.astype(np.int64)), axis=1)
+    keys, counts = np.unique(pairs, axis=0, return_counts=True)
+    for (group, value), count in zip(keys.tolist(), counts.tolist()):
+        ret[groupNames[group]][value] = count
+
+    return ret
+
+
+def ComputeAreaContainment(arrays: CorpusArrays, objects: np.ndarray, objectPack: np.ndarray, objectFile: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # Vectorized form of AreaContainsNextGoto() applied to every (area, object) pair of the same file.
+    # Returns the area and object indices of the pairs for which the object lies within the area.
+    area = arrays.area
+
+    areaKey = arrays.areaPack.astype(np.int64) * CD_FILE_MAX_NUM + arrays.areaFile
+    objectKey = objectPack.astype(np.int64) * CD_FILE_MAX_NUM + objectFile
+
+    # Objects are stored grouped by file, so the objects of each area's file form a contiguous range
+    start = np.searchsorted(objectKey, areaKey, side='left')
+    end = np.searchsorted(objectKey, areaKey, side='right')
+    counts = end - start
+
+    pairArea = np.repeat(np.arange(len(area), dtype=np.int64), counts)
+    pairObject = np.arange(counts.sum(), dtype=np.int64) - np.repeat(np.cumsum(counts) - counts - start, counts)
+
+    area_x = area['offset__x'].astype(np.int64)[pairArea]
+    area_y = area['offset__y'].astype(np.int64)[pairArea]
+    area_w = area['size__x'].astype(np.int64)[pairArea]
+    area_h = area['size__y'].astype(np.int64)[pairArea]
+    object_x = objects['offset__x'].astype(np.int64)[pairObject]
+    object_y = objects['offset__y'].astype(np.int64)[pairObject]
+
+    contained = (
+        (area_x - 8*16 <= object_x) & (object_x <= area_x + area_w + 8*16) &
+        (area_y - 8*16 <= object_y) & (object_y <= area_y + area_h + 8*16)
+    ) | (objects['area'][pairObject] == area['ID'][pairArea])
+
+    return pairArea[contained], pairObject[contained]
+
+
+def computeStatistics(arrays: CorpusArrays) -> Dict[str, Any]:
+    actor = arrays.mapActor
+    nextGoto = arrays.nextGoto
+    area = arrays.area
+
+    actorVariant = arrays.packVariant[arrays.mapActorPack]
+    nextGotoVariant = arrays.packVariant[arrays.nextGotoPack]
+
+    # Actor densities per area
+    pairArea, _ = ComputeAreaContainment(arrays, actor, arrays.mapActorPack, arrays.mapActorFile)
+    areaActorCount = np.bincount(pairArea, minlength=len(area))
+    areaTiles = np.maximum(area['size__x'].astype(np.float64) * area['size__y'] / (16*16), 1.0)
+    areaDensity = areaActorCount / areaTiles
+
+    densest = np.argsort(-areaDensity, kind='stable')[:STATS_TOP_AREAS]
+
+    # nextGoto flag bits
+    flagBits = (nextGoto['flag'][:, None].astype(np.uint32) >> np.arange(16, dtype=np.uint32)) & 1
+
+    # Warp actor settings
+    warpActors: Dict[str, Dict[int, int]] = {}
+    for actorType in WARP_ACTOR_TYPES:
+        warpActors[str(actorType)] = _valueCounts(actor['settings_0'][actor['type'] == actorType])
+
+    return {
+        'packs': len(arrays.packNames),
+        'variants': {name: int((arrays.packVariant == i).sum()) for i, name in enumerate(arrays.variants)},
+        'actor_types': _groupedValueCounts(actorVariant, actor['type'], arrays.variants),
+        'next_goto_types': _groupedValueCounts(nextGotoVariant, nextGoto['type'], arrays.variants),
+        'next_goto_flag_bits': {bit: int(count) for bit, count in enumerate(flagBits.sum(axis=0).tolist()) if count},
+        'warp_actor_settings_0': warpActors,
+        'area_actor_density': {
+            'areas': len(area),
+            'mean': float(areaDensity.mean()) if len(area) else 0.0,
+            'median': float(np.median(areaDensity)) if len(area) else 0.0,
+            'max': float(areaDensity.max()) if len(area) else 0.0,
+            'densest': [
+                {
+                    'pack': arrays.packNames[arrays.areaPack[i]],
+                    'file': int(arrays.areaFile[i]),
+                    'area': int(area['ID'][i]),
+                    'actors': int(areaActorCount[i]),
+                    'actors_per_tile': float(areaDensity[i]),
+                }
+                for i in densest.tolist()
+            ],
+        },
+    }
+
+
+def printStatistics(stats: Dict[str, Any]) -> None:
+    print("Packs: %d" % stats['packs'])
+    for variant, count in stats['variants'].items():
+        print("  %s: %d" % (variant, count))
+
+    print("\nActor types per variant:")
+    for variant, counts in stats['actor_types'].items():
+        print("  %s:" % variant, ', '.join('%d: %d' % item for item in sorted(counts.items(), key=lambda item: -item[1])))
+
+    print("\nNextGoto types per variant:")
+    for variant, counts in stats['next_goto_types'].items():
+        print("  %s:" % variant, ', '.join('%d: %d' % item for item in sorted(counts.items())))
+
+    print("\nNextGoto flag bits:")
+    print("  " + ', '.join('0x%X: %d' % (1 << bit, count) for bit, count in stats['next_goto_flag_bits'].items()))
+
+    print("\nWarp actor settings_0:")
+    for actorType, counts in stats['warp_actor_settings_0'].items():
+        print("  %s:" % actorType, ', '.join('0x%X: %d' % item for item in sorted(counts.items())))
+
+    density = stats['area_actor_density']
+    print("\nActors per tile over %d areas: mean %.4f, median %.4f, max %.4f" % (density['areas'], density['mean'], density['median'], density['max']))
+    for item in density['densest']:
+        print("  %(pack)s file %(file)d area %(area)d: %(actors)d actors, %(actors_per_tile).4f per tile" % item)
+
+
+def main() -> None:
+    from main import scanPaths
+
+    parser = argparse.ArgumentParser(description="Corpus-wide actor and entity statistics")
+    parser.add_argument('index', nargs='?', default='courseIndex.bin')
+    parser.add_argument('--json', help="Also write the summary to this JSON file")
+    parser.add_argument('--no-refresh', action='store_true', help="Use the index as is instead of refreshing it first")
+    args = parser.parse_args()
+
+    if not args.no_refresh:
+        buildIndex(args.index, scanPaths)
+
+    with CourseIndex(args.index) as index:
+        arrays = CorpusArrays(index)
+
+    stats = computeStatistics(arrays)
+    printStatistics(stats)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as outf:
+            json.dump(stats, outf, indent=2)
+
+
+if __name__ == '__main__':
+    main()
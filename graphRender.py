@@ -0,0 +1,255 @@
+from html import escape
+import math
+import os
+from typing import Collection, Dict, Hashable, List, Mapping, Optional, Sequence, TextIO, Tuple
+
+
+# Graph output written directly, without networkx and matplotlib
+
+TGraph = Mapping[Hashable, Collection[Hashable]]
+TPoint = Tuple[float, float]
+
+NODE_RADIUS = 26
+NODE_SPACING = 80   # Minimum distance between neighboring nodes on the circle
+MARGIN = 40
+
+NODE_COLOR = 'lightblue'
+ROOT_COLOR = 'lightgreen'
+UNVISITABLE_COLOR = 'lightgray'
+EDGE_COLOR = 'gray'
+
+
+def GetNodeList(graph: TGraph, node_list: Optional[Sequence[Hashable]] = None) -> List[Hashable]:
+    # Nodes in node_list order, followed by edge targets missing from it
+    nodes = list(graph.keys()) if node_list is None else list(node_list)
+    known = set(nodes)
+
+    for neighbors in graph.values():
+        for neighbor in neighbors:
+            if neighbor not in known:
+                known.add(neighbor)
+                nodes.append(neighbor)
+
+    return nodes
+
+
+def CircleLayout(nodes: Sequence[Hashable]) -> Tuple[Dict[Hashable, TPoint], float]:
+    # Nodes evenly spaced on a circle, starting at the top and going clockwise (a single node is at the center).
+    # Returns the positions and the size of the square they fit in
+    count = len(nodes)
+    if count <= 1:
+        radius = 0.0
+    else:
+        radius = max(2 * NODE_RADIUS, NODE_SPACING / (2 * math.sin(math.pi / count)))
+
+    center = radius + NODE_RADIUS + MARGIN
+    pos: Dict[Hashable, TPoint] = {}
+
+    for i, node in enumerate(nodes):
+        angle = 2 * math.pi * i / count - math.pi / 2 if count else 0.0
+        pos[node] = (center + radius * math.cos(angle), center + radius * math.sin(angle))
+
+    return pos, 2 * center
+
+
+def _fmt(value: float) -> str:
+    return ('%.1f' % value).rstrip('0').rstrip('.')
+
+
+# Arrow head of the edges
+SVG_DEFS = (
+    '<defs><marker id="arrow" viewBox="0 0 10 10" refX="10" refY="5" markerWidth="8" markerHeight="8" orient="auto-start-reverse">'
+    '<path d="M0,0L10,5L0,10z" fill="%s"/></marker></defs>' % EDGE_COLOR
+)
+
+
+def GraphToSvg(graph: TGraph, node_list: Optional[Sequence[Hashable]] = None, root_node: Optional[Hashable] = None, embedded: bool = False) -> str:
+    # Nodes that are not keys of graph (the unvisitable ones) are drawn greyed out, the root node is highlighted.
+    # If embedded is True, SVG_DEFS are left out, to be given once by the document the graph is part of
+    nodes = GetNodeList(graph, node_list)
+    if root_node is None and nodes:
+        root_node = nodes[0]
+
+    pos, size = CircleLayout(nodes)
+
+    out = [
+        '<svg xmlns="http://www.w3.org/2000/svg" width="%s" height="%s" viewBox="0 0 %s %s">' % ((_fmt(size),) * 4),
+    ]
+    if not embedded:
+        out.append(SVG_DEFS)
+
+    out += [
+        '<rect width="100%" height="100%" fill="white"/>',
+        '<g stroke="%s" stroke-width="1.5" fill="none" marker-end="url(#arrow)">' % EDGE_COLOR,
+    ]
+
+    for node, neighbors in graph.items():
+        x0, y0 = pos[node]
+        for neighbor in neighbors:
+            if neighbor == node:
+                # Loop above the node
+                r = NODE_RADIUS
+                out.append('<path d="M%s,%sC%s,%s %s,%s %s,%s"/>' % (
+                    _fmt(x0 - r * 0.5), _fmt(y0 - r * 0.87),
+                    _fmt(x0 - r * 1.2), _fmt(y0 - r * 2.6),
+                    _fmt(x0 + r * 1.2), _fmt(y0 - r * 2.6),
+                    _fmt(x0 + r * 0.5), _fmt(y0 - r * 0.87)
+                ))
+                continue
+
+            x1, y1 = pos[neighbor]
+            length = math.hypot(x1 - x0, y1 - y0)
+            if not length:
+                continue
+
+            # Lines end at the border of the circles
+            dx = (x1 - x0) / length * NODE_RADIUS
+            dy = (y1 - y0) / length * NODE_RADIUS
+            out.append('<line x1="%s" y1="%s" x2="%s" y2="%s"/>' % (_fmt(x0 + dx), _fmt(y0 + dy), _fmt(x1 - dx), _fmt(y1 - dy)))
+
+    out.append('</g>')
+    out.append('<g font-family="sans-serif" font-size="13" font-weight="bold" text-anchor="middle" dominant-baseline="central">')
+
+    for node in nodes:
+        x, y = pos[node]
+        if node == root_node:
+            fill, stroke = ROOT_COLOR, ' stroke="black" stroke-width="2"'
+        elif node in graph:
+            fill, stroke = NODE_COLOR, ''
+        else:
+            fill, stroke = UNVISITABLE_COLOR, ' stroke="gray" stroke-dasharray="4 3"'
+
+        out.append('<circle cx="%s" cy="%s" r="%d" fill="%s"%s/>' % (_fmt(x), _fmt(y), NODE_RADIUS, fill, stroke))
+        out.append('<text x="%s" y="%s">%s</text>' % (_fmt(x), _fmt(y), escape(str(node))))
+
+    out.append('</g>')
+    out.append('</svg>')
+    out.append('')
+    return '\n'.join(out)
+
+
+def _dotQuote(value: Hashable) -> str:
+    return '"%s"' % str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+
+def GraphToDot(graph: TGraph, node_list: Optional[Sequence[Hashable]] = None, root_node: Optional[Hashable] = None) -> str:
+    nodes = GetNodeList(graph, node_list)
+    if root_node is None and nodes:
+        root_node = nodes[0]
+
+    out = [
+        'digraph {',
+        '  layout=circo;',
+        '  node [shape=circle, style=filled, fillcolor=%s, fontname="sans-serif"];' % NODE_COLOR,
+        '  edge [color=%s];' % EDGE_COLOR,
+    ]
+
+    for node in nodes:
+        if node == root_node:
+            attributes = ' [fillcolor=%s, penwidth=2]' % ROOT_COLOR
+        elif node not in graph:
+            attributes = ' [fillcolor=%s, style="filled,dashed"]' % UNVISITABLE_COLOR
+        else:
+            attributes = ''
+
+        out.append('  %s%s;' % (_dotQuote(node), attributes))
+
+    for node, neighbors in graph.items():
+        for neighbor in neighbors:
+            out.append('  %s -> %s;' % (_dotQuote(node), _dotQuote(neighbor)))
+
+    out.append('}')
+    out.append('')
+    return '\n'.join(out)
+
+
+GRAPH_WRITERS = {
+    'svg': GraphToSvg,
+    'dot': GraphToDot,
+}
+
+
+def WriteGraph(graph: TGraph, out_fname: str, format: str, node_list: Optional[Sequence[Hashable]] = None, root_node: Optional[Hashable] = None) -> None:
+    text = GRAPH_WRITERS[format](graph, node_list, root_node)
+    with open(out_fname, 'w', encoding='utf-8') as outf:
+        outf.write(text)
+
+
+class GraphAtlas:
+    # All graphs of a variant in a single HTML document, in pages of pageSize graphs,
+    # followed by an index by course name
+    #
+    # Graphs are written out as they are added and only their names are kept for the index,
+    # so memory use does not grow with the graphs. The file is only created once the first graph is added
+
+    def __init__(self, path: str, title: str, pageSize: int = 12) -> None:
+        self.path = path
+        self.title = title
+        self.pageSize = max(1, pageSize)
+
+        self._outf: Optional[TextIO] = None
+        self._entries: List[Tuple[str, int]] = []  # (Name, Page) of each graph
+
+    def __enter__(self) -> 'GraphAtlas':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _open(self) -> TextIO:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        outf = open(self.path, 'w', encoding='utf-8')
+        outf.write(
+            '<!DOCTYPE html>\n'
+            '<html>\n<head>\n<meta charset="utf-8">\n<title>%s</title>\n<style>\n'
+            'body { font-family: sans-serif; margin: 16px; }\n'
+            '.page { display: flex; flex-wrap: wrap; gap: 16px; break-after: page; }\n'
+            '.page > h2 { flex-basis: 100%%; margin: 24px 0 0; }\n'
+            'figure { margin: 0; border: 1px solid #ddd; }\n'
+            'figcaption { padding: 4px 8px; background: #f4f4f4; font-weight: bold; }\n'
+            '#index ol { columns: 16em; }\n'
+            '</style>\n</head>\n<body>\n'
+            '<svg width="0" height="0" style="position: absolute">%s</svg>\n'
+            '<h1>%s</h1>\n<p><a href="#index">Index</a></p>\n' % (escape(self.title), SVG_DEFS, escape(self.title))
+        )
+        return outf
+
+    def add(self, name: str, graph: TGraph, node_list: Optional[Sequence[Hashable]] = None, root_node: Optional[Hashable] = None) -> None:
+        if self._outf is None:
+            self._outf = self._open()
+
+        number = len(self._entries)
+        page = number // self.pageSize + 1
+
+        if number % self.pageSize == 0:
+            if number:
+                self._outf.write('</section>\n')
+            self._outf.write('<section class="page" id="page%d">\n<h2>Page %d</h2>\n' % (page, page))
+
+        self._outf.write('<figure id="graph%d">\n<figcaption>%s</figcaption>\n' % (number, escape(name)))
+        self._outf.write(GraphToSvg(graph, node_list, root_node, embedded=True))
+        self._outf.write('</figure>\n')
+
+        self._entries.append((name, page))
+
+    def close(self) -> None:
+        outf = self._outf
+        if outf is None:
+            return
+
+        self._outf = None
+
+        try:
+            outf.write('</section>\n<section id="index">\n<h2>Index</h2>\n<ol>\n')
+
+            # Sorted by name, then by order of addition
+            for number, (name, page) in sorted(enumerate(self._entries), key=lambda entry: (entry[1][0], entry[0])):
+                outf.write('<li><a href="#graph%d">%s</a> (page %d)</li>\n' % (number, escape(name), page))
+
+            outf.write('</ol>\n</section>\n</body>\n</html>\n')
+
+        finally:
+            outf.close()
@@ -1,11 +1,15 @@
 from time import gmtime, strftime
+from io import BytesIO
+import json
 import os
-from typing import Tuple, Dict, Set, Optional, List, Hashable, Collection, Sequence
+import sys
+from typing import Any, Tuple, Dict, Set, Optional, List, Hashable, Collection, Iterator, Sequence
 
-from courseData import CourseData, CD_FILE_MAX_NUM, NextGoto, AreaData, CourseDataFile
-
-import networkx as nx
-import matplotlib.pyplot as plt
+from areaGraph import Condensation, ImmediateDominators, GetMandatoryNodes
+from courseData import CourseData, CourseDataError, CD_FILE_MAX_NUM, NextGoto, AreaData, CourseDataFile, MapActorData
+from graphRender import GraphAtlas, WriteGraph
+from scanLog import ScanLogger, LOG_DEBUG, LOG_INFO
+from scanTelemetry import ScanTelemetry
 
 
 TAreaID = Tuple[int, int]
@@ -15,37 +19,68 @@ TAreaGraph = Dict[TAreaID, Set[TAreaID]]
 TGenericGraph = Dict[Hashable, Collection[Hashable]]
 
 
-logBuffer = []
-logToFile = True
-enableTestLog = False
-enableGraphDraw = True
+scanPaths: List[Tuple[str, str, bool]] = [
+    # (Variant, Path, Is NSMBUDX)
+    ('NSMBU',        'SARC',                False),
+    ('NSLU',         'SARC-RDash',          False),
+    ('NSMBUDX',      'DX\\Course',          True),
+    ('NSMBUDX_NSLU', 'DX\\RDashRes\\Course', True),
+]
 
 
-def warn(*args) -> None:
-    log("Warning:", *args)
+logger = ScanLogger(LOG_INFO)  # LOG_DEBUG for the traversal test log, toFile = False to print instead
+enableGraphDraw = True
+graphRenderer = 'matplotlib'  # PNG through networkx and matplotlib, 'svg'/'dot' written directly by graphRender.py, or 'atlas'
+graphAtlasDir = 'Graphs'  # Where the atlas of each variant is written, as <variant>.html
+graphAtlas: Optional[GraphAtlas] = None
+enableJsonReport = True
+jsonReport: List[Dict[str, Any]] = []
+showProgress = True
+metricsPath: Optional[str] = None  # Prometheus textfile to update during the scan, if any
+telemetry: Optional[ScanTelemetry] = None
 
 
-def log_test(*args, **kwargs) -> None:
-    if enableTestLog:
-        print(*args, **kwargs)
+def now() -> str:
+    return strftime("%Y-%m-%d %H.%M.%S", gmtime())
 
 
-def log(*args) -> None:
-    if logToFile:
-        global logBuffer
-        logBuffer.extend((' '.join(map(str, args)), '\n'))
-    else:
-        print(*args)
+# Caches of the matplotlib output of draw_graph()
+GRAPH_IMAGE_CACHE_SIZE = 256
+_graphLayouts: Dict[Tuple[Hashable, ...], Dict[Hashable, Any]] = {}
+_graphImages: Dict[Tuple[Any, ...], bytes] = {}
+_graphFigure: Any = None
 
 
-def now() -> str:
-    return strftime("%Y-%m-%d %H.%M.%S", gmtime())
+GRAPH_EXTENSIONS = {
+    'matplotlib': '.png',
+    'svg': '.svg',
+    'dot': '.dot',
+    'atlas': '',  # Graphs are named after the pack in the atlas
+}
 
 
-def draw_graph(graph_dict: TGenericGraph, out_fname: str, *, node_list: Optional[Sequence[Hashable]] = None, root_node: Optional[Hashable] = None, format: Optional[str] = 'png') -> None:
+def draw_graph(graph_dict: TGenericGraph, out_fname: str, *, node_list: Optional[Sequence[Hashable]] = None, root_node: Optional[Hashable] = None, format: Optional[str] = 'png', renderer: Optional[str] = None) -> None:
     if not graph_dict:
         return
 
+    if renderer is None:
+        renderer = graphRenderer
+
+    if renderer == 'atlas':
+        assert graphAtlas is not None
+        graphAtlas.add(os.path.basename(out_fname), graph_dict, node_list, root_node)
+        return
+
+    if renderer != 'matplotlib':
+        WriteGraph(graph_dict, out_fname, renderer, node_list, root_node)
+        return
+
+    # Only imported when needed, as they take longer to import than the whole scan of a few packs
+    import networkx as nx
+    import matplotlib.pyplot as plt
+
+    global _graphFigure
+
     # Create a graph object
     G = nx.DiGraph()
 
@@ -63,17 +98,50 @@ def draw_graph(graph_dict: TGenericGraph, out_fname: str, *, node_list: Optional
     if root_node is None:
         root_node = node_list[0]
 
+    # Identical graphs (e.g. all single-area courses) get the image already rendered for the first one
+    nodes = tuple(G.nodes)
+    imageKey = (nodes, frozenset(G.edges), root_node, format)
+    if out_fname:
+        image = _graphImages.get(imageKey)
+        if image is not None:
+            with open(out_fname, 'wb') as outf:
+                outf.write(image)
+            return
+
+    # The layout only depends on the nodes, in order
+    pos = _graphLayouts.get(nodes)
+    if pos is None:
+        pos = _graphLayouts[nodes] = nx.shell_layout(G)  # Layout for visualization
+
+    # Saved graphs are all drawn on the same figure, which is cleared instead of being closed
+    if not out_fname:
+        fig = plt.figure()
+    else:
+        if _graphFigure is None:
+            _graphFigure = plt.figure()
+        fig = _graphFigure
+        fig.clf()
+    ax = fig.add_axes((0, 0, 1, 1))
+
     # Draw the graph
-    pos = nx.shell_layout(G)  # Layout for visualization
     ## Draw all nodes and edges
-    nx.draw(G, pos, with_labels=True, node_color='lightblue', node_size=2000, font_size=15, font_weight='bold', edge_color='gray')
+    nx.draw(G, pos, ax=ax, with_labels=True, node_color='lightblue', node_size=2000, font_size=15, font_weight='bold', edge_color='gray')
     ## Draw the root node with an extra circle
-    nx.draw_networkx_nodes(G, pos, nodelist=[root_node], node_color='lightgreen', node_size=2200, edgecolors='black')
+    nx.draw_networkx_nodes(G, pos, ax=ax, nodelist=[root_node], node_color='lightgreen', node_size=2200, edgecolors='black')
     if out_fname:
-        plt.savefig(out_fname, format=format)
+        buf = BytesIO()
+        fig.savefig(buf, format=format)
+        image = buf.getvalue()
+
+        if len(_graphImages) >= GRAPH_IMAGE_CACHE_SIZE:
+            del _graphImages[next(iter(_graphImages))]  # Oldest first
+        _graphImages[imageKey] = image
+
+        with open(out_fname, 'wb') as outf:
+            outf.write(image)
     else:
         plt.show()
-    plt.close()
+        plt.close(fig)
 
 
 def AreaContainsNextGoto(area: AreaData, nextGoto: NextGoto, iAreaID: int) -> bool:
@@ -90,8 +158,63 @@ def FindContainmentArea(file: CourseDataFile, nextGoto: NextGoto) -> Optional[Ar
     return None
 
 
+def DecodeWarpActor(actor: MapActorData) -> Optional[Tuple[int, Optional[int]]]:
+    # Returns the raw destination file and nextGoto of actors which warp the player,
+    # the nextGoto is None if the destination is the start nextGoto of the file
+    if actor.type == 424:
+        # Pipe Cannon to Airship
+        return actor.settings_0 >> 8 & 0xFF, actor.settings_0 & 0xFF
+
+    if actor.type == 432 and (actor.settings_0 & 0xF) == 1:
+        # Bowser Jr. Controller
+        return actor.settings_0 >> 4 & 0xF, actor.settings_0 >> 8 & 0xFF
+
+    if actor.type == 497:
+        # Final Bowser Battle Controller
+        return actor.settings_0 & 0xFF, None
+
+    return None
+
+
+def IterAreaExits(file: CourseDataFile, fileID: int, area: AreaData, coinOrBoost: bool, exploredActors: Optional[Set[TNextGotoID]] = None) -> Iterator[Tuple[Optional[NextGoto], int, Optional[int]]]:
+    # Every exit of the area: its nextGotos, then the actors in it which warp the player.
+    # Yields the nextGoto the exit is (None for actors), the destination file and the destination nextGoto,
+    # which is None if the destination is the start nextGoto of a file that does not exist.
+    # Actors already in exploredActors (as (file, 0x10000 | index)) are skipped, and every actor reached is added to it,
+    # whether it is in the area or not
+    for nextGoto in file.getNextGoto():
+        if nextGoto.flag & 0x80 or not AreaContainsNextGoto(area, nextGoto, area.ID):
+            continue
+
+        dstFile = nextGoto.destination__file
+        dstFile = fileID if dstFile <= 0 else dstFile - 1
+        yield nextGoto, dstFile, nextGoto.destination__next_goto
+
+    for i, actor in enumerate(file.getMapActorData()):
+        if exploredActors is not None:
+            actorAsNextGotoID = (fileID, 0x10000 | i)
+            if actorAsNextGotoID in exploredActors:
+                continue
+            exploredActors.add(actorAsNextGotoID)
+
+        warp = DecodeWarpActor(actor)
+        if warp is None or not AreaContainsNextGoto(area, actor, area.ID):
+            continue
+
+        dstFile, dstNextGoto = warp
+        dstFile = fileID if dstFile <= 0 else dstFile - 1
+
+        if dstNextGoto is None:
+            dstFileObj = CourseData.getCourseDataFile(dstFile)
+            if dstFileObj.isValid():
+                dstNextGoto = dstFileObj.getOptions().start_next_goto_coin_boost if coinOrBoost else dstFileObj.getOptions().start_next_goto
+
+        yield None, dstFile, dstNextGoto
+
+
 explored_nextGoto: Set[TNextGotoID] = set()
 isCoinOrBoost = False
+exploreActorsOnce = True  # Follow the actors of a file from the first of its areas visited only, as in output.txt
 
 
 def explore_area(areas: TAreaGraph, areaID: TAreaID) -> None:
@@ -103,86 +226,35 @@ def explore_area(areas: TAreaGraph, areaID: TAreaID) -> None:
 
     file = CourseData.getCourseDataFile(areaID[0])
     if not file.isValid():
-        warn("Trying to visit file %d area %d, but file does not exist!" % areaID)
+        logger.warning('FILE_MISSING', "Trying to visit file %d area %d, but file does not exist!", *areaID, file=areaID[0], area=areaID[1])
         return
     
     area = file.getAreaDataByID(areaID[1])
     if area is None:
-        warn("Trying to visit file %d area %d, but area does not exist!" % areaID)
+        logger.warning('AREA_MISSING', "Trying to visit file %d area %d, but area does not exist!", *areaID, file=areaID[0], area=areaID[1])
         return
-    
-    for nextGoto in file.getNextGoto():
-        log_test("Test: file %d area %d, area %d nextGoto %d" % (*areaID, nextGoto.area, nextGoto.ID))
-        if not AreaContainsNextGoto(area, nextGoto, areaID[1]):
-            continue
 
-        if nextGoto.flag & 0x80:
-            continue
-
-        dstFile = nextGoto.destination__file
-        if dstFile <= 0:
-            dstFile = areaID[0]
-        else:
-            dstFile -= 1
-            if dstFile == areaID[0]:
-                warn("File %d, area %d: NextGoto %d leads to the same file, but uses file ID explicitly instead of 0." % (*areaID, nextGoto.ID))
+    if logger.isEnabledFor(LOG_DEBUG):
+        for nextGoto in file.getNextGoto():
+            logger.debug("Test: file %d area %d, area %d nextGoto %d", areaID[0], areaID[1], nextGoto.area, nextGoto.ID)
 
-        dstAreaID = explore_nextGoto(areas, (dstFile, nextGoto.destination__next_goto), nextGoto.destination__file == 0 and nextGoto.destination__next_goto == 0)
-        if dstAreaID is not None:
-            adjacency.add(dstAreaID)
+    # Same exits as the entrance matrix of the report (see buildAreaEdges()), except for the actors with exploreActorsOnce
+    for nextGoto, dstFile, dstNextGoto in IterAreaExits(file, areaID[0], area, isCoinOrBoost, explored_nextGoto if exploreActorsOnce else None):
+        suppress_warn = False
 
-    for i, actor in enumerate(file.getMapActorData()):
-        actorAsNextGotoID = (areaID[0], 0x10000 | i)
-        if actorAsNextGotoID in explored_nextGoto:
-            continue
-        else:
-            explored_nextGoto.add(actorAsNextGotoID)
+        if nextGoto is not None:
+            if nextGoto.destination__file > 0 and dstFile == areaID[0]:
+                logger.warning('SAME_FILE_EXPLICIT_ID', "File %d, area %d: NextGoto %d leads to the same file, but uses file ID explicitly instead of 0.", areaID[0], areaID[1], nextGoto.ID, file=areaID[0], area=areaID[1], nextGoto=nextGoto.ID)
+            suppress_warn = nextGoto.destination__file == 0 and nextGoto.destination__next_goto == 0
 
-        if not AreaContainsNextGoto(area, actor, areaID[1]):
+        elif dstNextGoto is None:
+            logger.warning('FINAL_BOWSER_FILE_MISSING', "Trying to visit file %d through Final Bowser, but file does not exist!", dstFile, file=dstFile)
             continue
 
-        if actor.type == 424:
-            dstFile = actor.settings_0 >> 8 & 0xFF
-            if dstFile <= 0:
-                dstFile = areaID[0]
-            else:
-                dstFile -= 1
-                # if dstFile == areaID[0]:
-                #     warn("File %d, area %d: Pipe Cannon to Airship leads to the same file, but uses file ID explicitly instead of 0." % areaID)
-
-            dstAreaID = explore_nextGoto(areas, (dstFile, actor.settings_0 & 0xFF))
-            if dstAreaID is not None:
-                adjacency.add(dstAreaID)
-
-        elif actor.type == 432 and (actor.settings_0 & 0xF) == 1:
-            dstFile = actor.settings_0 >> 4 & 0xF
-            if dstFile <= 0:
-                dstFile = areaID[0]
-            else:
-                dstFile -= 1
-                # if dstFile == areaID[0]:
-                #     warn("File %d, area %d: Bowser Jr. Controller leads to the same file, but uses file ID explicitly instead of 0." % areaID)
-
-            dstAreaID = explore_nextGoto(areas, (dstFile, actor.settings_0 >> 8 & 0xFF))
-            if dstAreaID is not None:
-                adjacency.add(dstAreaID)
-
-        elif actor.type == 497:
-            dstFile = actor.settings_0 & 0xFF
-            if dstFile <= 0:
-                dstFile = areaID[0]
-            else:
-                dstFile -= 1
-                # if dstFile == areaID[0]:
-                #     warn("File %d, area %d: Final Bowser Battle Controller leads to the same file, but uses file ID explicitly instead of 0." % areaID)
-
-            dstFileObj = CourseData.getCourseDataFile(dstFile)
-            if dstFileObj.isValid():
-                dstAreaID = explore_nextGoto(areas, (dstFile, dstFileObj.getOptions().start_next_goto_coin_boost if isCoinOrBoost else dstFileObj.getOptions().start_next_goto))
-                if dstAreaID is not None:
-                    adjacency.add(dstAreaID)
-            else:
-                warn("Trying to visit file %d through Final Bowser, but file does not exist!" % dstFile)
+        assert dstNextGoto is not None
+        dstAreaID = explore_nextGoto(areas, (dstFile, dstNextGoto), suppress_warn)
+        if dstAreaID is not None:
+            adjacency.add(dstAreaID)
 
 
 def explore_nextGoto(areas: TAreaGraph, nextGotoID: TNextGotoID, suppress_warn: bool = False) -> Optional[TAreaID]:
@@ -190,22 +262,22 @@ def explore_nextGoto(areas: TAreaGraph, nextGotoID: TNextGotoID, suppress_warn:
         return
 
     explored_nextGoto.add(nextGotoID)
-    log_test("File %d nextGoto %d" % (nextGotoID[0], nextGotoID[1]))
+    logger.debug("File %d nextGoto %d", nextGotoID[0], nextGotoID[1])
 
     file = CourseData.getCourseDataFile(nextGotoID[0])
     if not file.isValid():
-        warn("Trying to visit file %d nextGoto %d, but file does not exist!" % nextGotoID)
+        logger.warning('FILE_MISSING', "Trying to visit file %d nextGoto %d, but file does not exist!", *nextGotoID, file=nextGotoID[0], nextGoto=nextGotoID[1])
         return None
 
     nextGoto = file.getNextGotoByID(nextGotoID[1])
     if nextGoto is None:
         if not suppress_warn:
-            warn("Trying to visit file %d nextGoto %d, but nextGoto does not exist!" % nextGotoID)
+            logger.warning('NEXT_GOTO_MISSING', "Trying to visit file %d nextGoto %d, but nextGoto does not exist!", *nextGotoID, file=nextGotoID[0], nextGoto=nextGotoID[1])
         return None
     
     area = FindContainmentArea(file, nextGoto)
     if area is None:
-        warn("Trying to visit file %d nextGoto %d, but nextGoto is not contained in any area!" % nextGotoID)
+        logger.warning('NEXT_GOTO_NOT_CONTAINED', "Trying to visit file %d nextGoto %d, but nextGoto is not contained in any area!", *nextGotoID, file=nextGotoID[0], nextGoto=nextGotoID[1])
         return None
     
     dstAreaID = (nextGotoID[0], area.ID)
@@ -220,19 +292,20 @@ def findVisitableAreas() -> Tuple[TAreaGraph, Optional[TAreaGraph]]:
     visitable_areas: TAreaGraph = {}
     visitable_areas_cb: Optional[TAreaGraph] = None
     
-    for i in range(CD_FILE_MAX_NUM):
-        file = CourseData.getCourseDataFile(i)
-        if not file.isValid():
-            continue
-        for area in file.getAreaData():
-            log_test("Has File %d area %d" % (i, area.ID))
-
-    for i in range(CD_FILE_MAX_NUM):
-        file = CourseData.getCourseDataFile(i)
-        if not file.isValid():
-            continue
-        for nextGoto in file.getNextGoto():
-            log_test("Has File %d area %d nextGoto %d" % (i, nextGoto.area, nextGoto.ID))
+    if logger.isEnabledFor(LOG_DEBUG):
+        for i in range(CD_FILE_MAX_NUM):
+            file = CourseData.getCourseDataFile(i)
+            if not file.isValid():
+                continue
+            for area in file.getAreaData():
+                logger.debug("Has File %d area %d", i, area.ID)
+
+        for i in range(CD_FILE_MAX_NUM):
+            file = CourseData.getCourseDataFile(i)
+            if not file.isValid():
+                continue
+            for nextGoto in file.getNextGoto():
+                logger.debug("Has File %d area %d nextGoto %d", i, nextGoto.area, nextGoto.ID)
 
     file0 = CourseData.getCourseDataFile(0)
     assert file0.isValid()
@@ -269,66 +342,242 @@ def findUnvisitableAreas(visitable_areas: TAreaGraph) -> List[TAreaID]:
     return ret
 
 
-def scanPath(path: str, isNSMBUDX: bool) -> None:
-    for fname in os.listdir(path):
-        if not fname.endswith('.sarc'):
+def FindFileEntrances(file: CourseDataFile, fileID: int) -> Dict[TNextGotoID, TAreaID]:
+    # The area containing every nextGoto of the file
+    entrances: Dict[TNextGotoID, TAreaID] = {}
+    for nextGoto in file.getNextGoto():
+        area = FindContainmentArea(file, nextGoto)
+        if area is not None:
+            entrances[(fileID, nextGoto.ID)] = (fileID, area.ID)
+
+    return entrances
+
+
+def FindAreaExits(file: CourseDataFile, fileID: int, area: AreaData, coinOrBoost: bool) -> Set[TNextGotoID]:
+    # Every nextGoto which can be warped to from the area
+    return {(dstFile, dstNextGoto) for _, dstFile, dstNextGoto in IterAreaExits(file, fileID, area, coinOrBoost) if dstNextGoto is not None}
+
+
+def buildAreaEdges(coinOrBoost: bool) -> Tuple[TAreaGraph, Dict[TNextGotoID, TAreaID]]:
+    # Every exit of every area and the area containing every nextGoto, without traversing from a start nextGoto
+    entrances: Dict[TNextGotoID, TAreaID] = {}
+    for fileID in range(CD_FILE_MAX_NUM):
+        file = CourseData.getCourseDataFile(fileID)
+        if file.isValid():
+            entrances.update(FindFileEntrances(file, fileID))
+
+    edges: TAreaGraph = {}
+    for fileID in range(CD_FILE_MAX_NUM):
+        file = CourseData.getCourseDataFile(fileID)
+        if not file.isValid():
             continue
 
-        file_path = os.path.join(path, fname)
-        log("Loading:", file_path)
-        CourseData.loadFromPack(file_path, isNSMBUDX)
+        for area in file.getAreaData():
+            exits = FindAreaExits(file, fileID, area, coinOrBoost)
+            edges[(fileID, area.ID)] = {entrances[nextGotoID] for nextGotoID in exits if nextGotoID in entrances}
 
-        visitable_areas, visitable_areas_cb = findVisitableAreas()
+    return edges, entrances
 
-        if visitable_areas:
-            log("Visitable areas graph:")
-            log(visitable_areas)
-        else:
-            warn("Course not even enterable!")
 
-        if visitable_areas_cb is not None:
-            if visitable_areas_cb:
-                log("Visitable areas graph in Coin Battle and Boost Rush specifically:")
-                log(visitable_areas_cb)
-            else:
-                warn("Course not even enterable in Coin Battle and Boost Rush specifically!")
+def makeEntranceReport(coinOrBoost: bool) -> Dict[str, Any]:
+    # Reachability matrix with a row for every nextGoto, as a bitset over the areas in hex
+    edges, entrances = buildAreaEdges(coinOrBoost)
+    areaIndex = {areaID: i for i, areaID in enumerate(edges)}
 
-        unvisitable_areas = findUnvisitableAreas(visitable_areas)
-        if visitable_areas_cb is not None:
-            unvisitable_areas_cb = findUnvisitableAreas(visitable_areas_cb)
+    condensation = Condensation(edges)
+    closure = condensation.getClosure(areaIndex)
+
+    return {
+        'areas': list(edges),
+        'rows': [
+            [nextGotoID, areaID, '%x' % closure[condensation.componentOf[areaID]]]
+            for nextGotoID, areaID in sorted(entrances.items())
+        ],
+    }
+
+
+def makeAreaGraphReport(visitable_areas: TAreaGraph, unvisitable_areas: List[TAreaID], coinOrBoost: bool) -> Dict[str, Any]:
+    report: Dict[str, Any] = {
+        'visitable': [[areaID, sorted(adjacency)] for areaID, adjacency in visitable_areas.items()],
+        'unvisitable': unvisitable_areas,
+    }
+
+    if visitable_areas:
+        # The first area visited is the one containing the start nextGoto
+        root = next(iter(visitable_areas))
+        report['condensation'] = Condensation(visitable_areas).toJson(root)
+
+        idom = ImmediateDominators(visitable_areas, root)
+        report['immediate_dominators'] = [[areaID, dominator] for areaID, dominator in idom.items() if areaID != root]
+        report['mandatory'] = GetMandatoryNodes(visitable_areas, idom)
+
+    report['entrances'] = makeEntranceReport(coinOrBoost)
+
+    return report
+
+
+def listPacks(path: str) -> List[str]:
+    return [fname for fname in os.listdir(path) if fname.endswith(('.sarc', '.szs'))]
+
+
+TGraphDraw = Tuple[TAreaGraph, str, List[TAreaID]]
+
+
+def reportLoadError(file_path: str, error: CourseDataError) -> None:
+    # A pack which cannot be loaded is logged and reported with its error, and the scan goes on with the next one
+    logger.warning('LOAD_FAILED', "Could not load the pack: %s", error)
+    warnings = logger.takeWarnings()
+
+    if enableJsonReport:
+        jsonReport.append({'path': file_path, 'error': str(error), 'warnings': [warning.toJson() for warning in warnings]})
+
+    logger.info()
+
+
+def scanPack(file_path: str, isNSMBUDX: bool, inb: Optional[bytes] = None, loaded: bool = False) -> List[TGraphDraw]:
+    # Returns the graphs to draw as (graph, output file name, node list)
+    # If loaded is True, CourseData already holds the pack (e.g. handed over by another process)
+    logger.info("Loading: %s", file_path)
+    try:
+        if loaded:
+            pass
+        elif inb is None:
+            CourseData.loadFromPack(file_path, isNSMBUDX)
         else:
-            unvisitable_areas_cb = []
+            CourseData.loadFromPackData(inb, file_path, isNSMBUDX)
 
-        if unvisitable_areas:
-            log("Unvisitable areas:")
-            log('\n'.join(map(str, unvisitable_areas)))
+    except CourseDataError as e:
+        reportLoadError(file_path, e)
+        return []
 
-        if unvisitable_areas_cb:
-            log("Unvisitable areas in Coin Battle and Boost Rush specifically:")
-            log('\n'.join(map(str, unvisitable_areas_cb)))
+    visitable_areas, visitable_areas_cb = findVisitableAreas()
 
-        if visitable_areas:
-            if enableGraphDraw:
-                draw_graph(visitable_areas, file_path + '.png', node_list=list(visitable_areas.keys()) + unvisitable_areas)
+    if visitable_areas:
+        logger.info("Visitable areas graph:")
+        logger.info("%s", visitable_areas)
+    else:
+        logger.warning('NOT_ENTERABLE', "Course not even enterable!")
+        if telemetry is not None:
+            telemetry.countUnenterable()
 
+    if visitable_areas_cb is not None:
         if visitable_areas_cb:
-            if enableGraphDraw:
-                draw_graph(visitable_areas_cb, file_path + '_Coin_Boost.png', node_list=list(visitable_areas_cb.keys()) + unvisitable_areas_cb)
+            logger.info("Visitable areas graph in Coin Battle and Boost Rush specifically:")
+            logger.info("%s", visitable_areas_cb)
+        else:
+            logger.warning('NOT_ENTERABLE_COIN_BOOST', "Course not even enterable in Coin Battle and Boost Rush specifically!")
+
+    unvisitable_areas = findUnvisitableAreas(visitable_areas)
+    if visitable_areas_cb is not None:
+        unvisitable_areas_cb = findUnvisitableAreas(visitable_areas_cb)
+    else:
+        unvisitable_areas_cb = []
+
+    if unvisitable_areas:
+        logger.info("Unvisitable areas:")
+        logger.info('\n'.join(map(str, unvisitable_areas)))
+
+    if unvisitable_areas_cb:
+        logger.info("Unvisitable areas in Coin Battle and Boost Rush specifically:")
+        logger.info('\n'.join(map(str, unvisitable_areas_cb)))
+
+    warnings = logger.takeWarnings()
+
+    if enableJsonReport:
+        modes = {'normal': makeAreaGraphReport(visitable_areas, unvisitable_areas, False)}
+        if visitable_areas_cb is not None:
+            modes['coin_boost'] = makeAreaGraphReport(visitable_areas_cb, unvisitable_areas_cb, True)
+        jsonReport.append({'path': file_path, 'modes': modes, 'warnings': [warning.toJson() for warning in warnings]})
+
+    graphs: List[TGraphDraw] = []
+    extension = GRAPH_EXTENSIONS[graphRenderer]
+
+    if visitable_areas:
+        graphs.append((visitable_areas, file_path + extension, list(visitable_areas.keys()) + unvisitable_areas))
+
+    if visitable_areas_cb:
+        graphs.append((visitable_areas_cb, file_path + '_Coin_Boost' + extension, list(visitable_areas_cb.keys()) + unvisitable_areas_cb))
+
+    logger.info()
+    return graphs
+
+
+def scanPath(path: str, isNSMBUDX: bool) -> None:
+    for fname in listPacks(path):
+        file_path = os.path.join(path, fname)
+        graphs = scanPack(file_path, isNSMBUDX)
 
-        log()
+        if enableGraphDraw:
+            for graph, out_fname, node_list in graphs:
+                draw_graph(graph, out_fname, node_list=node_list)
+
+        if telemetry is not None:
+            telemetry.countRead(os.path.getsize(file_path))
+            telemetry.countPack()
+
+
+def setGraphAtlasVariant(variant: str) -> None:
+    # With the 'atlas' renderer, the graphs of each variant go to their own atlas
+    global graphAtlas
+
+    if graphAtlas is not None:
+        if graphAtlas.title == variant:
+            return
+        closeGraphAtlas()
+
+    if graphRenderer == 'atlas':
+        graphAtlas = GraphAtlas(os.path.join(graphAtlasDir, variant + '.html'), variant)
+
+
+def closeGraphAtlas() -> None:
+    global graphAtlas
+
+    if graphAtlas is not None:
+        graphAtlas.close()
+        graphAtlas = None
+
+
+def startTelemetry(totalPacks: int) -> Optional[ScanTelemetry]:
+    global telemetry
+
+    if showProgress or metricsPath:
+        telemetry = ScanTelemetry(totalPacks, metricsPath=metricsPath, out=sys.stderr if showProgress else None)
+        logger.listeners.append(telemetry.countWarning)
+
+    return telemetry
 
 
 def main() -> None:
-    scanPath('SARC', False)
-    scanPath('SARC-RDash', False)
-    scanPath('DX\\Course', True)
-    scanPath('DX\\RDashRes\\Course', True)
+    startTelemetry(sum(len(listPacks(path)) for _, path, _ in scanPaths))
+    if telemetry is not None:
+        telemetry.startTicker()
+
+    try:
+        for variant, path, isNSMBUDX in scanPaths:
+            if telemetry is not None:
+                telemetry.setVariant(variant)
+            if enableGraphDraw:
+                setGraphAtlasVariant(variant)
+            scanPath(path, isNSMBUDX)
+
+    finally:
+        if telemetry is not None:
+            telemetry.stopTicker()
+
+    closeGraphAtlas()
+
+    if telemetry is not None:
+        telemetry.update(force=True)
 
 
 if __name__ == '__main__':
     main()
 
-    if logBuffer:
-        logMsg = ''.join(logBuffer).encode('utf-8')
+    if logger.buffer:
+        logMsg = ''.join(logger.buffer).encode('utf-8')
         with open(str(now()) + '.txt', 'wb') as outf:
             outf.write(logMsg)
+
+    if jsonReport:
+        with open(str(now()) + '.json', 'w', encoding='utf-8') as outf:
+            json.dump(jsonReport, outf, indent=1)
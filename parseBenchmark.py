@@ -0,0 +1,54 @@
+import argparse
+import os
+from time import perf_counter
+from typing import List, Tuple
+
+from courseData import CourseData
+
+
+def benchmark(packs: List[Tuple[str, bool]], repeat: int = 3) -> None:
+    # Packs are read up front, so only decompression, archive lookup and parsing are timed
+    data: List[Tuple[str, bool, bytes]] = []
+    for path, isNSMBUDX in packs:
+        with open(path, 'rb') as inf:
+            data.append((path, isNSMBUDX, inf.read()))
+
+    if not data:
+        print("No packs found")
+        return
+
+    totalSize = sum(len(inb) for _, _, inb in data)
+
+    # Warm up, so that the timed runs do not pay for the imports and caches
+    for path, isNSMBUDX, inb in data:
+        CourseData.loadFromPackData(inb, path, isNSMBUDX)
+
+    best = float('inf')
+    for _ in range(repeat):
+        start = perf_counter()
+        for path, isNSMBUDX, inb in data:
+            CourseData.loadFromPackData(inb, path, isNSMBUDX)
+        best = min(best, perf_counter() - start)
+
+    print("%d packs, %.3f s, %.1f packs/s, %.2f MB/s" % (
+        len(data), best, len(data) / best, totalSize / best / 1e6
+    ))
+
+
+def main() -> None:
+    from main import scanPaths, listPacks
+
+    parser = argparse.ArgumentParser(description="Course loading throughput, with every block and terminator checked")
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    packs: List[Tuple[str, bool]] = []
+    for _, path, isNSMBUDX in scanPaths:
+        if os.path.isdir(path):
+            packs.extend((os.path.join(path, fname), isNSMBUDX) for fname in listPacks(path))
+
+    benchmark(packs, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+import argparse
+import os
+from typing import List, Optional, Sequence, Set, Tuple
+
+from areaReachability import IncrementalReachability
+from courseData import CourseData, CourseDataFile, AreaData, MapActorData, NextGoto, CD_FILE_MAX_NUM, SID, SIZE
+import main as analyzer
+from main import TAreaID
+
+
+# Check that the entrance matrix of the report and IncrementalReachability reach the same areas
+# as findVisitableAreas(), on a regression course and on every pack of the scan paths.
+# They follow the warp actors from every area containing them, so the traversal is run without exploreActorsOnce
+
+
+def _newRecord(cls: type, structId: SID) -> object:
+    return cls('>', bytes(SIZE('>', structId)))
+
+
+def _newArea(ID: int, x: int) -> AreaData:
+    area = _newRecord(AreaData, SID.Area)
+    area.ID = ID
+    area.offset__x, area.offset__y = x, 0
+    area.size__x, area.size__y = 1024, 1024
+    return area
+
+
+def _newNextGoto(ID: int, areaID: int, x: int) -> NextGoto:
+    nextGoto = _newRecord(NextGoto, SID.NextGoto)
+    nextGoto.ID = ID
+    nextGoto.area = areaID
+    nextGoto.offset__x, nextGoto.offset__y = x, 512
+    return nextGoto
+
+
+def _newActor(type: int, settings: int, areaID: int, x: int) -> MapActorData:
+    actor = _newRecord(MapActorData, SID.MapActor)
+    actor.type = type
+    actor.settings_0 = settings
+    actor.area = areaID
+    actor.offset__x, actor.offset__y = x, 512
+    return actor
+
+
+def LoadWarpActorCourse() -> None:
+    # File 0 has the start area 1, with a Bowser Jr. Controller (actor 1) leading to area 2,
+    # which has a Pipe Cannon (actor 0) leading to area 1 of file 1.
+    # The traversal of the scan follows the actors of a file from the first area of it visited only (exploreActorsOnce),
+    # which misses file 1
+    blank = CourseDataFile().save('>')[0]
+    CourseData.loadFromFiles('>', [(blank, None, None, None)] * 2 + [(None, None, None, None)] * (CD_FILE_MAX_NUM - 2))
+
+    file0 = CourseData.getCourseDataFile(0)
+    file0.getAreaData().extend((_newArea(1, 0), _newArea(2, 4096)))
+    file0.getNextGoto().extend((_newNextGoto(0, 1, 256), _newNextGoto(1, 2, 4352)))
+    file0.getMapActorData().extend((
+        _newActor(424, 2 << 8 | 0, 2, 4608),          # To file 1 nextGoto 0
+        _newActor(432, 1 << 8 | 0 << 4 | 1, 1, 512),  # To file 0 nextGoto 1
+    ))
+
+    file1 = CourseData.getCourseDataFile(1)
+    file1.getAreaData().append(_newArea(1, 0))
+    file1.getNextGoto().append(_newNextGoto(0, 1, 256))
+
+
+WARP_ACTOR_COURSE_AREAS = {(0, 1), (0, 2), (1, 1)}
+WARP_ACTOR_COURSE_SCAN_AREAS = {(0, 1), (0, 2)}
+
+
+def _getVisitableAreas(coinOrBoost: bool, exploreActorsOnce: bool = False) -> Optional[Set[TAreaID]]:
+    analyzer.exploreActorsOnce = exploreActorsOnce
+    try:
+        visitable_areas, visitable_areas_cb = analyzer.findVisitableAreas()
+    finally:
+        analyzer.exploreActorsOnce = True
+    analyzer.logger.takeBuffer()
+    analyzer.logger.takeWarnings()
+
+    areas = visitable_areas_cb if coinOrBoost else visitable_areas
+    return None if areas is None else set(areas)
+
+
+def _getMatrixAreas(coinOrBoost: bool) -> Set[TAreaID]:
+    # Areas in the entrance matrix row of the start nextGoto
+    options = CourseData.getCourseDataFile(0).getOptions()
+    start = (0, options.start_next_goto_coin_boost if coinOrBoost else options.start_next_goto)
+
+    report = analyzer.makeEntranceReport(coinOrBoost)
+    for nextGotoID, _, bits in report['rows']:
+        if nextGotoID == start:
+            reachable = int(bits, 16)
+            return {areaID for i, areaID in enumerate(report['areas']) if reachable >> i & 1}
+
+    return set()
+
+
+def _compare(differences: List[str], what: str, expected: Set[TAreaID], actual: Set[TAreaID]) -> None:
+    if actual != expected:
+        differences.append("%s: missing %s, extra %s" % (what, sorted(expected - actual), sorted(actual - expected)))
+
+
+def CheckLoadedCourse() -> List[str]:
+    # Differences for the course loaded in CourseData. IncrementalReachability is also checked after
+    # the nextGotos of each file are disabled and enabled again, against a new traversal each time
+    differences: List[str] = []
+
+    for coinOrBoost in (False, True):
+        mode = "coin/boost" if coinOrBoost else "normal"
+        expected = _getVisitableAreas(coinOrBoost)
+        if expected is None:
+            continue
+
+        _compare(differences, "%s: entrance matrix" % mode, expected, _getMatrixAreas(coinOrBoost))
+
+        reachability = IncrementalReachability(coinOrBoost)
+        _compare(differences, "%s: initial incremental" % mode, expected, reachability.getReachable())
+
+        for fileID in range(CD_FILE_MAX_NUM):
+            file = CourseData.getCourseDataFile(fileID)
+            if not file.isValid() or not file.getNextGoto():
+                continue
+
+            flags = [nextGoto.flag for nextGoto in file.getNextGoto()]
+            changed = [(fileID, nextGoto.ID) for nextGoto in file.getNextGoto()]
+
+            try:
+                for nextGoto in file.getNextGoto():
+                    nextGoto.flag |= 0x80
+
+                reachability.update(nextGotos=changed)
+                _compare(differences, "%s: file %d nextGotos disabled" % (mode, fileID), _getVisitableAreas(coinOrBoost) or set(), reachability.getReachable())
+
+            finally:
+                for nextGoto, flag in zip(file.getNextGoto(), flags):
+                    nextGoto.flag = flag
+
+            reachability.update(nextGotos=changed)
+            _compare(differences, "%s: file %d nextGotos enabled" % (mode, fileID), expected, reachability.getReachable())
+
+    return differences
+
+
+def checkRegression() -> List[str]:
+    LoadWarpActorCourse()
+
+    differences = CheckLoadedCourse()
+    _compare(differences, "traversal", WARP_ACTOR_COURSE_AREAS, _getVisitableAreas(False) or set())
+    _compare(differences, "scan traversal", WARP_ACTOR_COURSE_SCAN_AREAS, _getVisitableAreas(False, True) or set())
+
+    # Without the Pipe Cannon, file 1 is not reachable anymore
+    file0 = CourseData.getCourseDataFile(0)
+    cannon = file0.getMapActorData()[0]
+    reachability = IncrementalReachability()
+
+    cannon.type = 0
+    diff = reachability.update(actors=[(0, 0)])
+    _compare(differences, "cannon removed", {(1, 1)}, diff.unreachable)
+    _compare(differences, "cannon removed: incremental", _getVisitableAreas(False) or set(), reachability.getReachable())
+
+    cannon.type = 424
+    diff = reachability.update(actors=[(0, 0)])
+    _compare(differences, "cannon restored", {(1, 1)}, diff.reachable)
+    _compare(differences, "cannon restored: incremental", WARP_ACTOR_COURSE_AREAS, reachability.getReachable())
+
+    return differences
+
+
+def checkCorpus(scanPaths: Sequence[Tuple[str, str, bool]]) -> Tuple[int, int, int]:
+    checked = 0
+    differentCount = 0
+    errorCount = 0
+
+    for _, path, isNSMBUDX in scanPaths:
+        if not os.path.isdir(path):
+            continue
+
+        for fname in analyzer.listPacks(path):
+            file_path = os.path.join(path, fname)
+            checked += 1
+
+            try:
+                with open(file_path, 'rb') as inf:
+                    CourseData.loadFromPackData(inf.read(), file_path, isNSMBUDX)
+                differences = CheckLoadedCourse()
+
+            except Exception as e:
+                errorCount += 1
+                print("Error: %s: %s: %s" % (file_path, type(e).__name__, e))
+                continue
+
+            if differences:
+                differentCount += 1
+                print("%s:" % file_path)
+                for difference in differences:
+                    print("  %s" % difference)
+
+    return checked, differentCount, errorCount
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Check the entrance matrix and the incremental reachability against the traversal of the scan")
+    parser.add_argument('--regression-only', action='store_true', help="Only check the built-in regression course")
+    args = parser.parse_args()
+
+    analyzer.logger.toFile = True
+
+    differences = checkRegression()
+    print("Regression course: %s" % ("OK" if not differences else "FAILED"))
+    for difference in differences:
+        print("  %s" % difference)
+    failed = bool(differences)
+
+    if not args.regression_only:
+        total, different, errors = checkCorpus(analyzer.scanPaths)
+        print("Checked %d packs, %d differ, %d failed" % (total, different, errors))
+        failed = failed or bool(different or errors)
+
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+from bisect import bisect_left
+import struct
+from typing import List, Optional, Tuple, Union
+
+import SarcLib
+
+
+TBuffer = Union[bytes, bytearray, memoryview]
+
+SARC_HEADER_SIZE = 0x14
+SFAT_HEADER_SIZE = 0x0C
+SFAT_NODE_SIZE = 0x10
+SFNT_HEADER_SIZE = 0x08
+
+
+def SarcNameHash(name: str, key: int) -> int:
+    result = 0
+    for char in name:
+        result = (result * key + ord(char)) & 0xFFFFFFFF
+
+    return result
+
+
+class SarcReader:
+    # Reads entries straight from the SFAT node table, which is sorted by name hash,
+    # instead of building the whole folder tree like SarcLib.SARC_Archive
+
+    endianness: str
+    hashKey: int
+
+    def __init__(self, data: TBuffer) -> None:
+        self._data = memoryview(data)
+        if self._data[:4] != b'SARC':
+            raise ValueError("This is not a valid SARC file!")
+
+        bom = bytes(self._data[6:8])
+        if bom == b'\xFE\xFF':
+            self.endianness = '>'
+        elif bom == b'\xFF\xFE':
+            self.endianness = '<'
+        else:
+            raise ValueError("This is not a valid SARC file! Invalid BOM.")
+
+        headLen, _, fileLen, self._dataStart = struct.unpack_from(self.endianness + 'H2sII', self._data, 4)
+        if headLen != SARC_HEADER_SIZE or fileLen != len(self._data):
+            raise ValueError("This is not a valid SARC file! Invalid header.")
+
+        if self._data[SARC_HEADER_SIZE:SARC_HEADER_SIZE + 4] != b'SFAT':
+            raise ValueError("This is not a valid SARC file! SFAT not found.")
+
+        headLen, nodeCount, self.hashKey = struct.unpack_from(self.endianness + 'HHI', self._data, SARC_HEADER_SIZE + 4)
+        if headLen != SFAT_HEADER_SIZE:
+            raise ValueError("This is not a valid SARC file! Invalid SFAT header.")
+
+        # (name hash, name table entry, data start, data end) of every node
+        nodesStart = SARC_HEADER_SIZE + SFAT_HEADER_SIZE
+        nodes = struct.unpack_from(self.endianness + 'IIII' * nodeCount, self._data, nodesStart)
+        self._hashes = nodes[0::4]
+        self._nameEntries = nodes[1::4]
+        self._dataStarts = nodes[2::4]
+        self._dataEnds = nodes[3::4]
+
+        sfntStart = nodesStart + SFAT_NODE_SIZE * nodeCount
+        if self._data[sfntStart:sfntStart + 4] != b'SFNT':
+            raise ValueError("This is not a valid SARC file! SFNT not found.")
+
+        self._names = bytes(self._data[sfntStart + SFNT_HEADER_SIZE:self._dataStart])
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def _getName(self, index: int) -> Optional[str]:
+        nameEntry = self._nameEntries[index]
+        if not nameEntry >> 24:
+            return None
+
+        start = (nameEntry & 0xFFFFFF) * 4
+        end = self._names.find(b'\0', start)
+        return self._names[start:end if end >= 0 else len(self._names)].decode('utf-8')
+
+    def _getData(self, index: int) -> memoryview:
+        return self._data[self._dataStart + self._dataStarts[index]:self._dataStart + self._dataEnds[index]]
+
+    def findFile(self, name: str) -> int:
+        nameHash = SarcNameHash(name, self.hashKey)
+
+        index = bisect_left(self._hashes, nameHash)
+        while index < len(self._hashes) and self._hashes[index] == nameHash:
+            # Names are compared to rule out hash collisions
+            if self._getName(index) == name:
+                return index
+            index += 1
+
+        return -1
+
+    def hasFile(self, name: str) -> bool:
+        return self.findFile(name) >= 0
+
+    def getFile(self, name: str) -> Optional[bytes]:
+        index = self.findFile(name)
+        if index < 0:
+            return None
+
+        return bytes(self._getData(index))
+
+    def readEntries(self) -> List[Tuple[str, memoryview]]:
+        # Data is returned as views of the archive, nothing is copied
+        entries: List[Tuple[str, memoryview]] = []
+        for index in range(len(self._hashes)):
+            data = self._getData(index)
+            name = self._getName(index)
+            if name is None:
+                name = ''.join(["hash_" + hex(self._hashes[index]), SarcLib.guessFileExt(data)])
+            entries.append((name, data))
+
+        return entries
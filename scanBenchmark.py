@@ -0,0 +1,295 @@
+import argparse
+import ast
+import difflib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from time import gmtime, perf_counter, strftime
+from typing import Any, Dict, List, Optional
+
+
+# Scans the benchmark can run, see _runScan()
+SCANNERS = ('main', 'async', 'shared')
+
+# Number of previous runs the throughput is compared with
+HISTORY_WINDOW = 5
+
+
+def _sorted(values: Any) -> List[Any]:
+    try:
+        return sorted(values)
+    except TypeError:
+        return sorted(values, key=repr)
+
+
+def _canonicalRepr(value: Any) -> str:
+    # Like repr(), but with the elements of sets and the keys of dicts sorted, so that their iteration order
+    # does not matter. The first key of a dict is kept first, as the first area of a graph is its start
+    if isinstance(value, dict):
+        keys = list(value.keys())
+        keys[1:] = _sorted(keys[1:])
+        return '{%s}' % ', '.join('%s: %s' % (_canonicalRepr(key), _canonicalRepr(value[key])) for key in keys)
+    if isinstance(value, (set, frozenset)):
+        return '{%s}' % ', '.join(map(_canonicalRepr, _sorted(value))) if value else 'set()'
+    if isinstance(value, list):
+        return '[%s]' % ', '.join(map(_canonicalRepr, value))
+    if isinstance(value, tuple):
+        return ('(%s,)' if len(value) == 1 else '(%s)') % ', '.join(map(_canonicalRepr, value))
+    return repr(value)
+
+
+def _normalizeLine(line: str) -> str:
+    if line.startswith("Loading: "):
+        return line.replace('\\', '/')
+
+    if line.startswith(('{', '(')) or line == 'set()':
+        try:
+            return _canonicalRepr(ast.literal_eval(line))
+        except (ValueError, SyntaxError):
+            pass
+
+    return line
+
+
+def _isUnordered(line: str) -> bool:
+    # Lines of runs whose order depends on the traversal order: warnings and unvisitable areas
+    return line.startswith("Warning: ") or line.startswith('(')
+
+
+def NormalizeLog(text: str) -> List[str]:
+    # Log of a scan as lines that only differ if the results differ:
+    # packs sorted by path, sets and graphs printed in sorted order and runs of warnings and areas sorted
+    blocks: List[List[str]] = []
+
+    for block in text.replace('\r\n', '\n').split('\n\n'):
+        lines = [_normalizeLine(line) for line in block.split('\n') if line]
+        if not lines:
+            continue
+
+        normalized: List[str] = []
+        run: List[str] = []
+        for line in lines:
+            if _isUnordered(line):
+                run.append(line)
+                continue
+
+            normalized.extend(sorted(run))
+            run.clear()
+            normalized.append(line)
+
+        normalized.extend(sorted(run))
+        blocks.append(normalized)
+
+    blocks.sort()
+
+    result: List[str] = []
+    for block in blocks:
+        result.extend(block)
+        result.append('')
+
+    return result
+
+
+def _runScan(scanner: str, logPath: str, renderer: Optional[str]) -> None:
+    # Child side of a benchmark run, scanning the packs under the working directory
+    import main as analyzer
+
+    analyzer.enableGraphDraw = renderer is not None
+    if renderer is not None:
+        analyzer.graphRenderer = renderer
+    analyzer.enableJsonReport = False
+    analyzer.showProgress = False
+
+    if scanner == 'async':
+        import asyncio
+        from asyncScan import PipelinedScan, listJobs
+
+        if analyzer.enableGraphDraw and analyzer.graphRenderer == 'matplotlib':
+            import matplotlib.pyplot as plt
+            plt.switch_backend('Agg')
+
+        asyncio.run(PipelinedScan(listJobs(analyzer.scanPaths), logPath, None, drawGraphs=analyzer.enableGraphDraw).run())
+        return
+
+    if scanner == 'shared':
+        from courseShared import scanShared
+        scanShared()
+    else:
+        analyzer.main()
+
+    with open(logPath, 'wb') as outf:
+        outf.write(''.join(analyzer.logger.buffer).encode('utf-8'))
+
+
+def runBenchmark(corpus: str, scanner: str = 'main', renderer: Optional[str] = None) -> Dict[str, Any]:
+    # Runs the scan in a new process in corpus and returns its log and measurements.
+    # CPU time and peak RSS are those of the scan process, where os.wait4() is available
+    fd, logPath = tempfile.mkstemp(suffix='.txt')
+    os.close(fd)
+
+    args = [sys.executable, os.path.abspath(__file__), '_run', scanner, logPath]
+    if renderer is not None:
+        args.append(renderer)
+
+    try:
+        start = perf_counter()
+        process = subprocess.Popen(args, cwd=corpus)
+
+        if hasattr(os, 'wait4'):
+            _, status, usage = os.wait4(process.pid, 0)
+            wall = perf_counter() - start
+            returncode = os.waitstatus_to_exitcode(status)
+            process.returncode = returncode  # Already reaped
+            cpu: Optional[float] = usage.ru_utime + usage.ru_stime
+            peakRss: Optional[float] = usage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)  # MB
+        else:
+            returncode = process.wait()
+            wall = perf_counter() - start
+            cpu = None
+            peakRss = None
+
+        if returncode != 0:
+            raise RuntimeError("Scan failed with exit code %d" % returncode)
+
+        with open(logPath, encoding='utf-8') as inf:
+            log = inf.read()
+
+    finally:
+        os.remove(logPath)
+
+    packs = sum(1 for line in log.split('\n') if line.startswith("Loading: "))
+
+    return {
+        'log': log,
+        'packs': packs,
+        'wall_s': wall,
+        'cpu_s': cpu,
+        'peak_rss_mb': peakRss,
+        'packs_per_s': packs / wall if wall > 0 else 0.0,
+    }
+
+
+def _getRevision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def loadHistory(path: str) -> List[Dict[str, Any]]:
+    if not os.path.isfile(path):
+        return []
+
+    with open(path, encoding='utf-8') as inf:
+        return json.load(inf)
+
+
+def saveHistory(path: str, history: List[Dict[str, Any]]) -> None:
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as outf:
+        json.dump(history, outf, indent=1)
+    os.replace(tmp_path, path)
+
+
+def getReferenceThroughput(history: List[Dict[str, Any]], entry: Dict[str, Any]) -> Optional[float]:
+    # Median throughput of the last correct runs of the same scan over the same corpus
+    rates = [
+        previous['packs_per_s'] for previous in history
+        if previous['matches'] and all(previous.get(key) == entry[key] for key in ('corpus', 'scanner', 'renderer', 'packs'))
+    ][-HISTORY_WINDOW:]
+
+    if not rates:
+        return None
+
+    rates.sort()
+    middle = len(rates) // 2
+    return rates[middle] if len(rates) % 2 else (rates[middle - 1] + rates[middle]) / 2
+
+
+def main() -> None:
+    if len(sys.argv) > 1 and sys.argv[1] == '_run':
+        _runScan(sys.argv[2], sys.argv[3], sys.argv[4] if len(sys.argv) > 4 else None)
+        return
+
+    parser = argparse.ArgumentParser(description="End-to-end scan benchmark checked against a golden log")
+    parser.add_argument('-c', '--corpus', default='.', help="Directory with the scanned pack directories (default: current directory)")
+    parser.add_argument('-g', '--golden', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'output.txt'), help="Golden log (default: output.txt of the repository)")
+    parser.add_argument('-s', '--scanner', choices=SCANNERS, default='main', help="Scan to run: main.py, asyncScan.py or courseShared.py")
+    parser.add_argument('--renderer', help="Also draw the graphs with this renderer")
+    parser.add_argument('-r', '--repeat', type=int, default=3, help="Number of runs, the fastest one is recorded")
+    parser.add_argument('--history', default='scanBenchmark.json', help="JSON file the results are appended to")
+    parser.add_argument('-t', '--threshold', type=float, default=0.1, help="Largest allowed drop in packs/s from the median of the last runs (default: 0.1 = 10%%)")
+    parser.add_argument('--update-golden', action='store_true', help="Replace the golden log with the log of this run")
+    args = parser.parse_args()
+
+    corpus = os.path.abspath(args.corpus)
+
+    runs = [runBenchmark(corpus, args.scanner, args.renderer) for _ in range(max(1, args.repeat))]
+    best = min(runs, key=lambda run: run['wall_s'])
+
+    if args.update_golden:
+        with open(args.golden, 'w', encoding='utf-8', newline='') as outf:
+            outf.write(best['log'])
+        print("Golden log updated: %s" % args.golden)
+
+    with open(args.golden, encoding='utf-8') as inf:
+        golden = NormalizeLog(inf.read())
+
+    failed = False
+    for i, run in enumerate(runs):
+        actual = NormalizeLog(run['log'])
+        if actual != golden:
+            failed = True
+            print("Run %d diverges from the golden log:" % (i + 1))
+            diff = list(difflib.unified_diff(golden, actual, 'golden', 'run %d' % (i + 1), lineterm=''))
+            print('\n'.join(diff[:60]))
+            if len(diff) > 60:
+                print("... (%d more lines)" % (len(diff) - 60))
+
+    entry = {
+        'timestamp': strftime("%Y-%m-%dT%H:%M:%SZ", gmtime()),
+        'revision': _getRevision(),
+        'corpus': corpus,
+        'scanner': args.scanner,
+        'renderer': args.renderer,
+        'packs': best['packs'],
+        'runs': len(runs),
+        'wall_s': round(best['wall_s'], 4),
+        'cpu_s': None if best['cpu_s'] is None else round(best['cpu_s'], 4),
+        'peak_rss_mb': None if best['peak_rss_mb'] is None else round(best['peak_rss_mb'], 1),
+        'packs_per_s': round(best['packs_per_s'], 2),
+        'matches': not failed,
+    }
+
+    history = loadHistory(args.history)
+    reference = getReferenceThroughput(history, entry)
+
+    history.append(entry)
+    saveHistory(args.history, history)
+
+    print("%d packs, %.3f s wall, %s s CPU, %s MB peak RSS, %.2f packs/s" % (
+        entry['packs'], entry['wall_s'],
+        '?' if entry['cpu_s'] is None else '%.3f' % entry['cpu_s'],
+        '?' if entry['peak_rss_mb'] is None else '%.1f' % entry['peak_rss_mb'],
+        entry['packs_per_s']
+    ))
+
+    if reference is not None:
+        change = entry['packs_per_s'] / reference - 1
+        print("Throughput %+.1f%% against the median of the last runs (%.2f packs/s)" % (change * 100, reference))
+        if change < -args.threshold:
+            print("Throughput regressed by more than %.0f%%" % (args.threshold * 100))
+            failed = True
+
+    print("FAILED" if failed else "OK")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+
+LOG_DEBUG = 10
+LOG_INFO = 20
+LOG_WARNING = 30
+LOG_NONE = 100
+
+
+class WarningRecord(NamedTuple):
+    code: str
+    file: Optional[int]
+    area: Optional[int]
+    nextGoto: Optional[int]
+    format: str
+    args: tuple
+
+    def getMessage(self) -> str:
+        return self.format % self.args
+
+    def toJson(self) -> Dict[str, Any]:
+        return {
+            'code': self.code,
+            'file': self.file,
+            'area': self.area,
+            'next_goto': self.nextGoto,
+            'message': self.getMessage(),
+        }
+
+
+class ScanLogger:
+    # Leveled logger of the scan
+    #
+    # Messages take a format string and its arguments, which are only formatted if the level is enabled,
+    # so disabled debug messages in the traversal cost a call and a comparison. Info and warning messages
+    # go to the buffer (or stdout if toFile is False), debug messages always go to stdout.
+    # Warnings are also kept as structured records until they are taken with takeWarnings().
+
+    level: int
+    toFile: bool
+    buffer: List[str]
+    warnings: List[WarningRecord]
+    listeners: List[Callable[[WarningRecord], None]]
+
+    def __init__(self, level: int = LOG_INFO, toFile: bool = True) -> None:
+        self.level = level
+        self.toFile = toFile
+        self.buffer = []
+        self.warnings = []
+        self.listeners = []
+
+    def isEnabledFor(self, level: int) -> bool:
+        return level >= self.level
+
+    def _emit(self, msg: str) -> None:
+        if self.toFile:
+            self.buffer.extend((msg, '\n'))
+        else:
+            print(msg)
+
+    def debug(self, format: str, *args: Any) -> None:
+        if LOG_DEBUG >= self.level:
+            print(format % args)
+
+    def info(self, format: str = '', *args: Any) -> None:
+        if LOG_INFO >= self.level:
+            self._emit(format % args if args else format)
+
+    def warning(self, code: str, format: str, *args: Any, file: Optional[int] = None, area: Optional[int] = None, nextGoto: Optional[int] = None) -> None:
+        record = WarningRecord(code, file, area, nextGoto, format, args)
+        self.warnings.append(record)
+
+        for listener in self.listeners:
+            listener(record)
+
+        if LOG_WARNING >= self.level:
+            self._emit("Warning: " + record.getMessage())
+
+    def takeBuffer(self) -> List[str]:
+        buffer = self.buffer
+        self.buffer = []
+        return buffer
+
+    def takeWarnings(self) -> List[WarningRecord]:
+        warnings = self.warnings
+        self.warnings = []
+        return warnings
@@ -0,0 +1,222 @@
+from collections import deque
+import os
+import sys
+import threading
+from time import monotonic, time
+from typing import Any, Callable, Deque, Dict, List, NamedTuple, Optional, TextIO, Tuple
+
+
+# Throughput and ETA are measured over this many seconds, so that they follow drops in throughput
+RATE_WINDOW = 30.0
+
+
+class _Counts(NamedTuple):
+    # Snapshot of the counters, taken under the update lock
+    packs: int
+    bytesRead: int
+    packsByVariant: Dict[str, int]
+    warningsByVariant: Dict[str, int]
+    unenterableByVariant: Dict[str, int]
+    queues: Dict[str, Callable[[], int]]
+
+
+class ScanTelemetry:
+    # Live progress of a scan: throughput, queue depths, ETA and per-variant counts,
+    # printed periodically (unless out is None) and optionally dumped as a Prometheus textfile collector file
+
+    def __init__(self, totalPacks: int, interval: float = 5.0, metricsPath: Optional[str] = None, out: Optional[TextIO] = sys.stderr) -> None:
+        self.totalPacks = totalPacks
+        self.interval = interval
+        self.metricsPath = metricsPath
+        self.out = out
+
+        self.packs = 0
+        self.bytesRead = 0
+        self.variant = ''
+        self.packsByVariant: Dict[str, int] = {}
+        self.warningsByVariant: Dict[str, int] = {}
+        self.unenterableByVariant: Dict[str, int] = {}
+
+        # Callables returning the current depth of each pipeline queue
+        self.queues: Dict[str, Callable[[], int]] = {}
+
+        self.startTime = monotonic()
+        self.lastProgressTime = self.startTime
+        self.lastReportTime = self.startTime
+
+        # (Time, packs, bytes read) at the updates of the last RATE_WINDOW seconds
+        self._samples: Deque[Tuple[float, int, int]] = deque([(self.startTime, 0, 0)])
+
+        # Counts and updates can come from the scan and from the ticker thread.
+        # Reentrant, as update() holds it while report() and getMetrics() take their snapshot
+        self._updateLock = threading.RLock()
+        self._ticker: Optional[threading.Thread] = None
+        self._tickerStop = threading.Event()
+
+    def setVariant(self, variant: str) -> None:
+        self.variant = variant
+
+    def addQueue(self, name: str, depth: Callable[[], int]) -> None:
+        with self._updateLock:
+            self.queues[name] = depth
+
+    def countWarning(self, record: Any = None) -> None:
+        with self._updateLock:
+            self.warningsByVariant[self.variant] = self.warningsByVariant.get(self.variant, 0) + 1
+
+    def countUnenterable(self) -> None:
+        with self._updateLock:
+            self.unenterableByVariant[self.variant] = self.unenterableByVariant.get(self.variant, 0) + 1
+
+    def countRead(self, size: int) -> None:
+        with self._updateLock:
+            self.bytesRead += size
+
+    def countPack(self, variant: Optional[str] = None) -> None:
+        with self._updateLock:
+            if variant is None:
+                variant = self.variant
+
+            self.packs += 1
+            self.packsByVariant[variant] = self.packsByVariant.get(variant, 0) + 1
+            self.lastProgressTime = monotonic()
+
+        self.update()
+
+    def _getCounts(self) -> _Counts:
+        with self._updateLock:
+            return _Counts(
+                self.packs, self.bytesRead,
+                dict(self.packsByVariant), dict(self.warningsByVariant), dict(self.unenterableByVariant), dict(self.queues)
+            )
+
+    def update(self, force: bool = False) -> None:
+        with self._updateLock:
+            now = monotonic()
+            if not force and now - self.lastReportTime < self.interval:
+                return
+
+            self.lastReportTime = now
+
+            # Keeps the newest sample at least RATE_WINDOW old as the start of the window
+            self._samples.append((now, self.packs, self.bytesRead))
+            while len(self._samples) > 2 and self._samples[1][0] <= now - RATE_WINDOW:
+                self._samples.popleft()
+
+            self.report()
+            if self.metricsPath:
+                self.writeMetrics(self.metricsPath)
+
+    def startTicker(self) -> None:
+        # Keeps the progress and metrics updating from a thread while no pack gets done, e.g. on a slow pack,
+        # for scans which are not driven by an event loop (asyncScan has its own ticker task)
+        if self._ticker is not None:
+            return
+
+        self._tickerStop.clear()
+        self._ticker = threading.Thread(target=self._tick, name='ScanTelemetry', daemon=True)
+        self._ticker.start()
+
+    def stopTicker(self) -> None:
+        if self._ticker is None:
+            return
+
+        self._tickerStop.set()
+        self._ticker.join()
+        self._ticker = None
+
+    def _tick(self) -> None:
+        while not self._tickerStop.wait(self.interval):
+            self.update()
+
+    def getElapsed(self) -> float:
+        return monotonic() - self.startTime
+
+    def _getRates(self) -> Tuple[float, float]:
+        # Packs and bytes per second since the start of the window
+        with self._updateLock:
+            start, packs, bytesRead = self._samples[0]
+            elapsed = monotonic() - start
+            if elapsed <= 0:
+                return 0.0, 0.0
+
+            return (self.packs - packs) / elapsed, (self.bytesRead - bytesRead) / elapsed
+
+    def getPacksPerSecond(self) -> float:
+        return self._getRates()[0]
+
+    def getBytesPerSecond(self) -> float:
+        return self._getRates()[1]
+
+    def getETA(self) -> Optional[float]:
+        with self._updateLock:
+            rate = self.getPacksPerSecond()
+            if not rate:
+                return None
+
+            return max(0, self.totalPacks - self.packs) / rate
+
+    def report(self) -> None:
+        if self.out is None:
+            return
+
+        counts = self._getCounts()
+        packsPerSecond, bytesPerSecond = self._getRates()
+        eta = self.getETA()
+        parts = [
+            "[%d/%d]" % (counts.packs, self.totalPacks),
+            "%.1f packs/s" % packsPerSecond,
+            "%.2f MB/s" % (bytesPerSecond / 1e6),
+        ]
+
+        if counts.queues:
+            parts.append("queues " + ' '.join("%s=%d" % (name, depth()) for name, depth in counts.queues.items()))
+
+        parts.append("ETA %s" % ("?" if eta is None else "%dm%02ds" % divmod(int(eta), 60)))
+
+        for variant, count in counts.packsByVariant.items():
+            parts.append("%s: %d packs, %d warnings, %d unenterable" % (
+                variant, count, counts.warningsByVariant.get(variant, 0), counts.unenterableByVariant.get(variant, 0)
+            ))
+
+        print(', '.join(parts), file=self.out, flush=True)
+
+    def getMetrics(self) -> str:
+        lines: List[str] = []
+
+        def metric(name: str, kind: str, help: str, values: Dict[str, float]) -> None:
+            lines.append("# HELP nsmbu_scan_%s %s" % (name, help))
+            lines.append("# TYPE nsmbu_scan_%s %s" % (name, kind))
+            for labels, value in values.items():
+                lines.append("nsmbu_scan_%s%s %s" % (name, labels, repr(float(value))))
+
+        def byVariant(counts: Dict[str, int]) -> Dict[str, float]:
+            return {'{variant="%s"}' % variant: count for variant, count in counts.items()}
+
+        counts = self._getCounts()
+        packsPerSecond, bytesPerSecond = self._getRates()
+        eta = self.getETA()
+
+        # Only counters end in _total
+        metric('packs_expected', 'gauge', "Number of packs to scan", {'': self.totalPacks})
+        metric('packs_done_total', 'counter', "Number of packs scanned", {'': counts.packs})
+        metric('bytes_read_total', 'counter', "Number of pack bytes read", {'': counts.bytesRead})
+        metric('packs_per_second', 'gauge', "Packs scanned per second over the last %d seconds" % RATE_WINDOW, {'': packsPerSecond})
+        metric('bytes_per_second', 'gauge', "Pack bytes read per second over the last %d seconds" % RATE_WINDOW, {'': bytesPerSecond})
+        metric('eta_seconds', 'gauge', "Estimated time until the scan is done", {'': -1 if eta is None else eta})
+        metric('seconds_since_progress', 'gauge', "Time since the last pack was done", {'': monotonic() - self.lastProgressTime})
+        metric('last_update_timestamp_seconds', 'gauge', "Time of the last metrics update", {'': time()})
+        metric('queue_depth', 'gauge', "Current number of items in each pipeline queue", {'{queue="%s"}' % name: depth() for name, depth in counts.queues.items()})
+        metric('variant_packs_total', 'counter', "Number of packs scanned per variant", byVariant(counts.packsByVariant))
+        metric('variant_warnings_total', 'counter', "Number of warnings per variant", byVariant(counts.warningsByVariant))
+        metric('variant_unenterable_total', 'counter', "Number of unenterable courses per variant", byVariant(counts.unenterableByVariant))
+
+        lines.append('')
+        return '\n'.join(lines)
+
+    def writeMetrics(self, path: str) -> None:
+        # Written to a temporary file first, so the collector never reads a partial file
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as outf:
+            outf.write(self.getMetrics())
+        os.replace(tmp_path, path)
@@ -0,0 +1,142 @@
+import argparse
+import os
+import struct
+from time import perf_counter
+from typing import List, Union
+
+
+YAZ0_HEADER_SIZE = 0x10
+
+
+def IsYaz0(data: Union[bytes, bytearray, memoryview]) -> bool:
+    return bytes(data[:4]) in (b'Yaz0', b'Yaz1')
+
+
+def Yaz0GetDecompressedSize(data: Union[bytes, bytearray, memoryview]) -> int:
+    return struct.unpack_from('>I', data, 4)[0]
+
+
+def Yaz0Decompress(data: Union[bytes, bytearray, memoryview]) -> bytes:
+    if not IsYaz0(data):
+        raise ValueError("Not Yaz0 compressed data!")
+
+    data = bytes(data)
+    data_len = len(data)
+
+    # The whole output buffer is allocated up front from the size in the header
+    size = Yaz0GetDecompressedSize(data)
+    out = bytearray(size)
+
+    src = YAZ0_HEADER_SIZE
+    dst = 0
+
+    try:
+        while dst < size:
+            code = data[src]
+            src += 1
+
+            # Fast path: a whole group of literals
+            if code == 0xFF and dst + 8 <= size and src + 8 <= data_len:
+                out[dst:dst + 8] = data[src:src + 8]
+                src += 8
+                dst += 8
+                continue
+
+            for _ in range(8):
+                if dst >= size:
+                    break
+
+                if code & 0x80:
+                    out[dst] = data[src]
+                    src += 1
+                    dst += 1
+
+                else:
+                    b1 = data[src]
+                    b2 = data[src + 1]
+                    src += 2
+
+                    dist = ((b1 & 0xF) << 8 | b2) + 1
+                    count = b1 >> 4
+                    if count:
+                        count += 2
+                    else:
+                        count = data[src] + 0x12
+                        src += 1
+
+                    start = dst - dist
+                    if start < 0:
+                        raise ValueError("Yaz0 back-reference before the start of the data!")
+
+                    count = min(count, size - dst)
+                    if dist >= count:
+                        out[dst:dst + count] = out[start:start + count]
+                    else:
+                        # Overlapping copy, which repeats the last dist bytes
+                        pattern = bytes(out[start:dst])
+                        out[dst:dst + count] = (pattern * (count // dist + 1))[:count]
+
+                    dst += count
+
+                code <<= 1
+
+    except IndexError:
+        raise ValueError("Yaz0 data is truncated!") from None
+
+    if src > data_len:
+        raise ValueError("Yaz0 data is truncated!")
+
+    return bytes(out)
+
+
+def benchmark(paths: List[str], repeat: int = 3) -> None:
+    totalIn = 0
+    totalOut = 0
+    totalTime = 0.0
+
+    for path in paths:
+        with open(path, 'rb') as inf:
+            inb = inf.read()
+
+        if not IsYaz0(inb):
+            continue
+
+        best = float('inf')
+        for _ in range(repeat):
+            start = perf_counter()
+            outb = Yaz0Decompress(inb)
+            best = min(best, perf_counter() - start)
+
+        totalIn += len(inb)
+        totalOut += len(outb)
+        totalTime += best
+
+        print("%s: %d -> %d bytes, %.3f ms, %.2f MB/s" % (path, len(inb), len(outb), best * 1000, len(outb) / best / 1e6))
+
+    if totalTime:
+        print("Total: %d -> %d bytes, %.3f s, %.2f MB/s decompressed (%.2f MB/s compressed)" % (
+            totalIn, totalOut, totalTime, totalOut / totalTime / 1e6, totalIn / totalTime / 1e6
+        ))
+    else:
+        print("No Yaz0 files found")
+
+
+def main() -> None:
+    from main import scanPaths, listPacks
+
+    parser = argparse.ArgumentParser(description="Yaz0 decompression throughput benchmark")
+    parser.add_argument('files', nargs='*', help="Files to decompress (default: all .szs packs in the scan paths)")
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    paths: List[str] = args.files
+    if not paths:
+        for _, path, _ in scanPaths:
+            if os.path.isdir(path):
+                paths.extend(os.path.join(path, fname) for fname in listPacks(path) if fname.endswith('.szs'))
+
+    benchmark(paths, args.repeat)
+
+
+if __name__ == '__main__':
+    main()